@@ -0,0 +1,165 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from graph_cache import normalize_book_text
+
+BOOK_ID_RE = re.compile(r"^[0-9a-f]{24}$")
+
+
+def _atomic_write(path, data):
+    """Write bytes to `path` via a temp file so readers never see a partial file."""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class BookStore:
+    """
+    On-disk registry of uploaded books.
+
+    Each book lives in its own directory, named by a content hash, holding the
+    text, its metadata and any derived artifacts (JSON). Text is read through a
+    memory map, and writes to one book are serialized by a per-book lock.
+    """
+
+    def __init__(self, root, max_open=32, max_derived=32):
+        self.root = root
+        self.max_open = max_open
+        self.max_derived = max_derived
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._book_locks = {}
+        self._maps = OrderedDict()
+        self._derived = OrderedDict()
+        self._build_locks = {}
+
+    @staticmethod
+    def book_id_for(text):
+        return hashlib.sha256(normalize_book_text(text).encode("utf-8")).hexdigest()[:24]
+
+    def _book_dir(self, book_id):
+        if not isinstance(book_id, str) or not BOOK_ID_RE.match(book_id):
+            raise KeyError(f"Invalid book_id: {book_id}")
+        return os.path.join(self.root, book_id)
+
+    def lock(self, book_id):
+        """Lock guarding writes to one book's directory."""
+        with self._lock:
+            return self._book_locks.setdefault(book_id, threading.Lock())
+
+    def add(self, text, filename=None, title=None):
+        """Store `text` (if not already stored) and return its book_id."""
+        if not text or not text.strip():
+            raise ValueError("Book text is empty")
+
+        book_id = self.book_id_for(text)
+        book_dir = self._book_dir(book_id)
+        with self.lock(book_id):
+            if not os.path.exists(os.path.join(book_dir, "meta.json")):
+                os.makedirs(book_dir, exist_ok=True)
+                encoded = text.encode("utf-8")
+                _atomic_write(os.path.join(book_dir, "book.txt"), encoded)
+                meta = {
+                    "book_id": book_id,
+                    "title": title,
+                    "filename": filename,
+                    "num_chars": len(text),
+                    "num_bytes": len(encoded),
+                    "created_at": time.time(),
+                }
+                _atomic_write(os.path.join(book_dir, "meta.json"), json.dumps(meta).encode("utf-8"))
+        return book_id
+
+    def exists(self, book_id):
+        try:
+            return os.path.exists(os.path.join(self._book_dir(book_id), "meta.json"))
+        except KeyError:
+            return False
+
+    def get_meta(self, book_id):
+        with open(os.path.join(self._book_dir(book_id), "meta.json")) as f:
+            return json.load(f)
+
+    def _mapped(self, book_id):
+        # Caller must hold self._lock
+        mapped = self._maps.get(book_id)
+        if mapped is not None:
+            self._maps.move_to_end(book_id)
+            return mapped
+
+        path = os.path.join(self._book_dir(book_id), "book.txt")
+        if not os.path.exists(path):
+            raise KeyError(f"Unknown book_id: {book_id}")
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[book_id] = mapped
+        while len(self._maps) > self.max_open:
+            _, old = self._maps.popitem(last=False)
+            old.close()
+        return mapped
+
+    def read_bytes(self, book_id, start=0, end=None):
+        """Return raw UTF-8 bytes [start, end) of a book without reading the whole file."""
+        with self._lock:
+            mapped = self._mapped(book_id)
+            return mapped[start:len(mapped) if end is None else end]
+
+    def get_text(self, book_id):
+        return self.read_bytes(book_id).decode("utf-8")
+
+    def save_artifact(self, book_id, name, data):
+        """Persist a JSON-serializable artifact derived from a book (graph, chapters, ...)."""
+        path = os.path.join(self._book_dir(book_id), f"{name}.json")
+        with self.lock(book_id):
+            _atomic_write(path, json.dumps(data).encode("utf-8"))
+
+    def load_artifact(self, book_id, name):
+        path = os.path.join(self._book_dir(book_id), f"{name}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def get_derived(self, book_id, name, build):
+        """
+        Memoize an in-memory object derived from a book's text, such as a
+        search index. `build(text)` runs at most once per book and name while
+        the result stays among the `max_derived` most recently used.
+        """
+        key = (book_id, name)
+        with self._lock:
+            if key in self._derived:
+                self._derived.move_to_end(key)
+                return self._derived[key]
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                if key in self._derived:
+                    return self._derived[key]
+            try:
+                value = build(self.get_text(book_id))
+            except BaseException:
+                with self._lock:
+                    self._build_locks.pop(key, None)
+                raise
+            with self._lock:
+                self._derived[key] = value
+                while len(self._derived) > self.max_derived:
+                    self._derived.popitem(last=False)
+                self._build_locks.pop(key, None)
+        return value
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from token_counter import MESSAGE_OVERHEAD_TOKENS, REQUEST_OVERHEAD_TOKENS
+
+
+def history_chain_keys(turns):
+    """
+    One key per history prefix: keys[k] identifies turns[:k], so a summary of
+    the first k turns can be found again however the history grows later.
+    """
+    keys = [hashlib.sha256(b"chat-history").hexdigest()]
+    for turn in turns:
+        digest = hashlib.sha256()
+        digest.update(keys[-1].encode("utf-8"))
+        digest.update(json.dumps([turn["role"], turn["content"]]).encode("utf-8"))
+        keys.append(digest.hexdigest())
+    return keys
+
+
+class RollingSummaries:
+    """LRU map from a history prefix key to the summary of that prefix."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            summary = self._entries.get(key)
+            if summary is not None:
+                self._entries.move_to_end(key)
+            return summary
+
+    def set(self, key, summary):
+        with self._lock:
+            self._entries[key] = summary
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def fold_history(turns, keys, fold_count, fold_block, summaries, summarize):
+    """
+    Summary of turns[:fold_count], built block by block on top of the longest
+    prefix already summarized. `summarize(previous_summary, turns)` returns
+    the new summary or None. Returns (summary, turns_covered).
+    """
+    covered = 0
+    summary = ""
+    for boundary in range(fold_count, 0, -fold_block):
+        cached = summaries.get(keys[boundary])
+        if cached is not None:
+            covered, summary = boundary, cached
+            break
+
+    while covered < fold_count:
+        boundary = min(covered + fold_block, fold_count)
+        updated = summarize(summary, turns[covered:boundary])
+        if not updated:
+            break
+        summaries.set(keys[boundary], updated)
+        covered, summary = boundary, updated
+    return summary, covered
+
+
+def _content_text(content):
+    return content if isinstance(content, str) else json.dumps(content)
+
+
+def build_chat_messages(
+    counter,
+    budget,
+    system_prompt,
+    relationship_data,
+    passages,
+    history,
+    query,
+    summaries,
+    summarize,
+    recent_turns=6,
+    fold_block=4,
+    min_passages=2,
+    min_turns=2,
+    context_header="Relevant passages from the book:",
+):
+    """
+    Assemble the /chat prompt within `budget` tokens.
+
+    `passages` are {"text", "score"} context blocks; `history` is a list of
+    {"role", "content"} turns, oldest first. The latest `recent_turns` turns
+    are kept verbatim and older ones are folded, `fold_block` turns at a time,
+    into a cached rolling summary, so the prompt stays the same size however
+    long the conversation runs. If the prompt is still over budget, the
+    lowest-scoring passages go first (down to `min_passages`), then the
+    oldest verbatim turns (down to `min_turns`), then the remaining passages,
+    then the tail of the relationship data.
+
+    Returns (messages, report); the report says what was summarized or dropped.
+    """
+    keys = history_chain_keys(history)
+    older = max(0, len(history) - recent_turns)
+    fold_count = older - older % fold_block
+    summary, folded = fold_history(history, keys, fold_count, fold_block, summaries, summarize) if fold_count else ("", 0)
+    # Turns that should have been folded but could not be summarized are dropped
+    verbatim = list(history[fold_count:])
+    report = {
+        "budget": budget,
+        "history_turns": len(history),
+        "history_turns_summarized": folded,
+        "history_turns_dropped": fold_count - folded,
+        "passages_dropped": 0,
+        "relationship_data_truncated": False,
+    }
+
+    kept_passages = sorted(range(len(passages)), key=lambda i: passages[i]["score"])
+    relationship_text = _content_text(relationship_data)
+
+    def cost(text):
+        return counter.count(text) + MESSAGE_OVERHEAD_TOKENS
+
+    fixed = cost(system_prompt) + cost(query) + REQUEST_OVERHEAD_TOKENS
+    summary_tokens = cost(summary) if summary else 0
+    passage_tokens = {i: counter.count(passages[i]["text"]) for i in kept_passages}
+    turn_tokens = [cost(turn["content"]) for turn in verbatim]
+
+    def total():
+        context = sum(passage_tokens[i] for i in kept_passages)
+        context_tokens = cost(context_header) + context if kept_passages else 0
+        return fixed + cost(relationship_text) + summary_tokens + context_tokens + sum(turn_tokens)
+
+    while total() > budget and len(kept_passages) > min_passages:
+        kept_passages.pop(0)
+        report["passages_dropped"] += 1
+    while total() > budget and len(verbatim) > min_turns:
+        verbatim.pop(0)
+        turn_tokens.pop(0)
+        report["history_turns_dropped"] += 1
+    while total() > budget and kept_passages:
+        kept_passages.pop(0)
+        report["passages_dropped"] += 1
+    over = total() - budget
+    if over > 0 and relationship_text:
+        # Trim proportionally, then let the next request's pre-flight check catch any remainder
+        rel_tokens = counter.count(relationship_text)
+        keep = max(0, int(len(relationship_text) * (rel_tokens - over) / max(rel_tokens, 1)))
+        relationship_text = relationship_text[:keep]
+        relationship_data = relationship_text
+        report["relationship_data_truncated"] = True
+
+    messages = [{"role": "system", "content": system_prompt}]
+    if kept_passages:
+        ordered = sorted(kept_passages)
+        messages.append({
+            "role": "assistant",
+            "content": context_header + "\n\n" + "\n\n".join(passages[i]["text"] for i in ordered),
+        })
+    messages.append({"role": "assistant", "content": relationship_data})
+    if summary:
+        messages.append({"role": "assistant", "content": f"Summary of the earlier conversation:\n{summary}"})
+    messages.extend(verbatim)
+    messages.append({"role": "user", "content": query})
+
+    report["history_turns_verbatim"] = len(verbatim)
+    report["prompt_tokens"] = counter.count_messages(messages)
+    report["kept_passages"] = sorted(kept_passages)
+    return messages, report
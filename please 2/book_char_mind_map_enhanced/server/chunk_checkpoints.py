@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from graph_cache import normalize_book_text
+
+
+def make_run_key(task, book_text, params, prompt_version, chunk_tokens):
+    """
+    Identify one chunked run over a book: the task, the normalized book text,
+    the target (language or setting parameters), the prompt version and the
+    chunk size. Any change to these starts a fresh set of checkpoints.
+    """
+    digest = hashlib.sha256()
+    digest.update(normalize_book_text(book_text).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(json.dumps([task, params, prompt_version, chunk_tokens], sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+class ChunkCheckpoints:
+    """
+    SQLite-backed store of finished chunk outputs from /translate_book and
+    /transform_setting, saved as each chunk completes so a failed or
+    interrupted run can resume with only the missing chunks.
+
+    Rows are keyed by run key and chunk index and carry a hash of the chunk
+    text, so a checkpoint is only reused for the exact chunk it was made
+    from. Rows are evicted least-recently-used first once the stored outputs
+    exceed `max_bytes`.
+    """
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chunk_checkpoints (
+                    run_key TEXT NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    chunk_hash TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (run_key, chunk_index)
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS chunk_checkpoints_last_access ON chunk_checkpoints (last_access)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def load(self, run_key, chunks):
+        """Return {chunk_index: result} for the chunks of `chunks` already finished in this run."""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT chunk_index, chunk_hash, result FROM chunk_checkpoints WHERE run_key = ?",
+                (run_key,),
+            ).fetchall()
+            if rows:
+                conn.execute(
+                    "UPDATE chunk_checkpoints SET last_access = ? WHERE run_key = ?", (time.time(), run_key)
+                )
+        return {
+            index: result
+            for index, stored_hash, result in rows
+            if index < len(chunks) and stored_hash == chunk_hash(chunks[index])
+        }
+
+    def save(self, run_key, index, chunk, result):
+        size = len(result.encode("utf-8"))
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO chunk_checkpoints
+                    (run_key, chunk_index, chunk_hash, result, size, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (run_key, index, chunk_hash(chunk), result, size, now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM chunk_checkpoints").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute(
+            "SELECT run_key, chunk_index, size FROM chunk_checkpoints ORDER BY last_access ASC"
+        ).fetchall()
+        for run_key, index, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute(
+                "DELETE FROM chunk_checkpoints WHERE run_key = ? AND chunk_index = ?", (run_key, index)
+            )
+            total -= size
+
+    def clear(self, run_key=None):
+        """Drop one run's checkpoints, or all of them when `run_key` is None. Returns the number removed."""
+        with self._lock, self._connect() as conn:
+            if run_key is None:
+                cursor = conn.execute("DELETE FROM chunk_checkpoints")
+            else:
+                cursor = conn.execute("DELETE FROM chunk_checkpoints WHERE run_key = ?", (run_key,))
+            return cursor.rowcount
+
+    def stats(self):
+        with self._lock, self._connect() as conn:
+            runs, entries, total = conn.execute(
+                "SELECT COUNT(DISTINCT run_key), COUNT(*), COALESCE(SUM(size), 0) FROM chunk_checkpoints"
+            ).fetchone()
+        return {"runs": runs, "entries": entries, "bytes": total, "max_bytes": self.max_bytes}
@@ -0,0 +1,170 @@
+import bisect
+import re
+
+from segmenter import chapter_starts, segment_book
+
+PARAGRAPH_BREAK_RE = re.compile(r"\n[ \t]*\n\s*")
+# End of a sentence: terminal punctuation, optional closing quotes/brackets, whitespace
+SENTENCE_END_RE = re.compile(r"[.!?…]+[\"'”’)\]]*\s+")
+
+
+def estimate_tokens(text):
+    """Rough token estimate: about 4 characters per token for English prose."""
+    if not text:
+        return 0
+    return max(1, (len(text) + 3) // 4)
+
+
+def find_chapter_starts(text):
+    """Return the character offsets at which chapter headings begin."""
+    return chapter_starts(segment_book(text))
+
+
+def _trimmed_span(text, start, end):
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _paragraph_spans(text, start, end):
+    spans = []
+    pos = start
+    for m in PARAGRAPH_BREAK_RE.finditer(text, start, end):
+        span = _trimmed_span(text, pos, m.start())
+        if span[0] < span[1]:
+            spans.append(span)
+        pos = m.end()
+    span = _trimmed_span(text, pos, end)
+    if span[0] < span[1]:
+        spans.append(span)
+    return spans
+
+
+def _inside_quote(text, start, pos):
+    segment = text[start:pos]
+    if segment.count('"') % 2 == 1:
+        return True
+    return segment.count("“") > segment.count("”")
+
+
+def _sentence_spans(text, start, end):
+    spans = []
+    pos = start
+    for m in SENTENCE_END_RE.finditer(text, start, end):
+        # Never break in the middle of a quoted line of dialogue
+        if _inside_quote(text, pos, m.start()):
+            continue
+        spans.append(_trimmed_span(text, pos, m.end()))
+        pos = m.end()
+    if pos < end:
+        spans.append(_trimmed_span(text, pos, end))
+    return [span for span in spans if span[0] < span[1]]
+
+
+def _hard_split(text, start, end, max_tokens, token_counter):
+    """Split an oversized sentence on whitespace so each piece fits the budget."""
+    tokens = token_counter(text[start:end])
+    chars_per_piece = max(1, int((end - start) * max_tokens / max(tokens, 1)))
+    spans = []
+    pos = start
+    while pos < end:
+        cut = min(end, pos + chars_per_piece)
+        if cut < end:
+            space = text.rfind(" ", pos + 1, cut)
+            if space > pos:
+                cut = space
+        spans.append(_trimmed_span(text, pos, cut))
+        pos = cut
+    return [span for span in spans if span[0] < span[1]]
+
+
+def _units(text, start, end, max_tokens, token_counter):
+    """Break a chapter into paragraph-or-smaller spans that each fit the budget."""
+    units = []
+    for p_start, p_end in _paragraph_spans(text, start, end):
+        p_tokens = token_counter(text[p_start:p_end])
+        if p_tokens <= max_tokens:
+            units.append((p_start, p_end, p_tokens))
+            continue
+        for s_start, s_end in _sentence_spans(text, p_start, p_end):
+            s_tokens = token_counter(text[s_start:s_end])
+            if s_tokens <= max_tokens:
+                units.append((s_start, s_end, s_tokens))
+                continue
+            for h_start, h_end in _hard_split(text, s_start, s_end, max_tokens, token_counter):
+                units.append((h_start, h_end, token_counter(text[h_start:h_end])))
+    return units
+
+
+def chunk_text(text, max_tokens, overlap_tokens=0, token_counter=estimate_tokens, min_fill=0.5,
+               chapter_offsets=None):
+    """
+    Split `text` into chunks of at most `max_tokens` tokens (plus any overlap).
+
+    Chunks break on chapter headings, then paragraphs, then sentences, and only
+    fall back to splitting on whitespace for a single sentence that is larger
+    than the budget. A chapter heading starts a new chunk once the current one
+    is at least `min_fill` of the budget, so chunks line up with chapters
+    without coming out tiny. With `overlap_tokens`, each chunk is prefixed
+    with trailing units of the previous chunk.
+
+    Returns a list of dicts with "index", "start", "end", "text",
+    "token_estimate" and "chapter_id" (the chapter the chunk starts in, as
+    numbered by segmenter.segment_book; 0 is any text before the first
+    heading). Pass `chapter_offsets` to reuse an already computed table of
+    heading offsets.
+    """
+    if not text or not text.strip():
+        return []
+
+    headings = find_chapter_starts(text) if chapter_offsets is None else list(chapter_offsets)
+    boundaries = [0] + [offset for offset in headings if offset > 0] + [len(text)]
+
+    # Group units into chunks; each chunk is a list of (start, end, tokens, chapter_id)
+    groups = []
+    current = []
+    current_tokens = 0
+    for c_start, c_end in zip(boundaries, boundaries[1:]):
+        chapter_id = bisect.bisect_right(headings, c_start)
+        chapter_units = _units(text, c_start, c_end, max_tokens, token_counter)
+        if current and chapter_units and current_tokens >= max_tokens * min_fill:
+            groups.append(current)
+            current, current_tokens = [], 0
+        for u_start, u_end, u_tokens in chapter_units:
+            if current and current_tokens + u_tokens > max_tokens:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append((u_start, u_end, u_tokens, chapter_id))
+            current_tokens += u_tokens
+    if current:
+        groups.append(current)
+
+    chunks = []
+    for i, group in enumerate(groups):
+        start = group[0][0]
+        end = group[-1][1]
+        tokens = sum(unit[2] for unit in group)
+
+        if overlap_tokens and i > 0:
+            carried = 0
+            for u_start, _, u_tokens, _ in reversed(groups[i - 1]):
+                if carried + u_tokens > overlap_tokens:
+                    break
+                carried += u_tokens
+                start = u_start
+            tokens += carried
+
+        chunk = text[start:end]
+        chunks.append(
+            {
+                "index": i,
+                "start": start,
+                "end": end,
+                "text": chunk,
+                "token_estimate": tokens,
+                "chapter_id": group[0][3],
+            }
+        )
+    return chunks
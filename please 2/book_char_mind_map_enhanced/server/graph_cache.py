@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+
+
+def normalize_book_text(text):
+    """Normalize text so trivially different copies of a book share a cache key."""
+    text = unicodedata.normalize("NFC", text)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.split("\n")).strip()
+
+
+def make_cache_key(text, version):
+    """SHA-256 of the normalized book text plus the pipeline version."""
+    digest = hashlib.sha256()
+    digest.update(normalize_book_text(text).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(version.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class GraphCache:
+    """
+    SQLite-backed cache of /inference results.
+
+    Entries are evicted least-recently-used first once the stored payloads
+    exceed `max_bytes`.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS graph_cache (
+                    key TEXT PRIMARY KEY,
+                    graph_data TEXT NOT NULL,
+                    character_response_text TEXT,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS graph_cache_last_access ON graph_cache (last_access)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """Return the cached entry for `key` as a dict, or None."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT graph_data, character_response_text FROM graph_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE graph_cache SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+        return {"graph_data": json.loads(row[0]), "character_response_text": row[1]}
+
+    def put(self, key, graph_data, character_response_text):
+        graph_json = json.dumps(graph_data)
+        size = len(graph_json.encode("utf-8")) + len((character_response_text or "").encode("utf-8"))
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO graph_cache
+                    (key, graph_data, character_response_text, size, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (key, graph_json, character_response_text, size, now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM graph_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute(
+            "SELECT key, size FROM graph_cache ORDER BY last_access ASC"
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM graph_cache WHERE key = ?", (key,))
+            total -= size
+
+    def invalidate(self, key=None):
+        """Drop one entry, or every entry when `key` is None. Returns the number removed."""
+        with self._lock, self._connect() as conn:
+            if key is None:
+                cursor = conn.execute("DELETE FROM graph_cache")
+            else:
+                cursor = conn.execute("DELETE FROM graph_cache WHERE key = ?", (key,))
+            return cursor.rowcount
+
+    def stats(self):
+        with self._lock, self._connect() as conn:
+            entries, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM graph_cache"
+            ).fetchone()
+        return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes}
@@ -0,0 +1,111 @@
+import numpy as np
+
+GRAPH_LAYOUT_VERSION = 1
+
+# Above this many nodes the spectral start (a dense eigendecomposition) is skipped
+SPECTRAL_MAX_NODES = 1000
+# Rows of the pairwise repulsion computed at once, to bound memory on big graphs
+REPULSION_BLOCK = 512
+# Typical distance between linked nodes in the output, matching d3's default link distance
+TARGET_EDGE_LENGTH = 30.0
+# Node pairs visited across all iterations; big graphs get fewer iterations (but at least MIN_ITERATIONS)
+LAYOUT_PAIR_BUDGET = 100_000_000
+MIN_ITERATIONS = 30
+
+
+def _edges(graph, index):
+    edges = []
+    for link in graph.get("links", []):
+        source, target = index.get(link["source"]), index.get(link["target"])
+        if source is not None and target is not None and source != target:
+            edges.append((source, target))
+    return np.array(edges, dtype=np.int64).reshape(-1, 2)
+
+
+def _initial_positions(n, edges, rng):
+    """Spectral start (two smallest non-trivial Laplacian eigenvectors), else random."""
+    if len(edges) and n <= SPECTRAL_MAX_NODES:
+        adjacency = np.zeros((n, n))
+        adjacency[edges[:, 0], edges[:, 1]] = 1.0
+        adjacency[edges[:, 1], edges[:, 0]] = 1.0
+        laplacian = np.diag(adjacency.sum(axis=1)) - adjacency
+        _, vectors = np.linalg.eigh(laplacian)
+        pos = vectors[:, 1:3] if n > 2 else vectors[:, :2]
+        # Nodes in other components share the same eigenvector entries; spread them a little
+        pos = pos + rng.normal(scale=1e-3, size=pos.shape)
+    else:
+        pos = rng.uniform(-1.0, 1.0, size=(n, 2))
+    spread = np.abs(pos).max()
+    return pos / spread if spread > 0 else pos
+
+
+def force_layout(n, edges, iterations=200, seed=0, gravity=0.05):
+    """
+    Fruchterman-Reingold layout in the unit square, vectorized with NumPy:
+    all-pairs repulsion (computed in row blocks), attraction along edges and
+    a weak pull towards the centre so disconnected parts stay in view.
+    Deterministic for a given graph and seed.
+    """
+    rng = np.random.default_rng(seed)
+    pos = _initial_positions(n, edges, rng)
+    if n == 1:
+        return np.zeros((1, 2))
+
+    k = np.sqrt(1.0 / n)
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+    for _ in range(iterations):
+        disp = np.zeros_like(pos)
+        x, y = pos[:, 0], pos[:, 1]
+        for lo in range(0, n, REPULSION_BLOCK):
+            dx = x[lo:lo + REPULSION_BLOCK, None] - x[None, :]
+            dy = y[lo:lo + REPULSION_BLOCK, None] - y[None, :]
+            strength = (k * k) / np.maximum(dx * dx + dy * dy, 1e-9)
+            disp[lo:lo + REPULSION_BLOCK, 0] += (dx * strength).sum(axis=1)
+            disp[lo:lo + REPULSION_BLOCK, 1] += (dy * strength).sum(axis=1)
+
+        if len(edges):
+            delta = pos[edges[:, 0]] - pos[edges[:, 1]]
+            dist = np.sqrt(np.maximum((delta ** 2).sum(axis=-1), 1e-9))
+            pull = delta * (dist / k)[:, None]
+            np.add.at(disp, edges[:, 0], -pull)
+            np.add.at(disp, edges[:, 1], pull)
+
+        disp -= gravity * pos * n * k
+        length = np.sqrt(np.maximum((disp ** 2).sum(axis=-1), 1e-9))
+        pos += disp * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= cooling
+    return pos - pos.mean(axis=0)
+
+
+def layout_graph(graph, iterations=200, seed=0):
+    """
+    Attach precomputed "x"/"y" coordinates to every node of a normalized
+    graph, scaled so linked nodes sit about TARGET_EDGE_LENGTH apart, and
+    record the layout version under graph["layout"]. Returns the graph.
+    """
+    nodes = graph.get("nodes", [])
+    if not nodes:
+        return graph
+    iterations = min(iterations, max(MIN_ITERATIONS, LAYOUT_PAIR_BUDGET // (len(nodes) ** 2)))
+
+    index = {node["id"]: i for i, node in enumerate(nodes)}
+    edges = _edges(graph, index)
+    pos = force_layout(len(nodes), edges, iterations=iterations, seed=seed)
+
+    if len(edges):
+        lengths = np.sqrt(((pos[edges[:, 0]] - pos[edges[:, 1]]) ** 2).sum(axis=-1))
+        scale = TARGET_EDGE_LENGTH / max(float(np.median(lengths)), 1e-6)
+    else:
+        scale = TARGET_EDGE_LENGTH * np.sqrt(len(nodes))
+    pos = pos * scale
+
+    for node, (x, y) in zip(nodes, pos):
+        node["x"] = round(float(x), 2)
+        node["y"] = round(float(y), 2)
+    graph["layout"] = {"version": GRAPH_LAYOUT_VERSION, "algorithm": "force", "iterations": iterations}
+    return graph
+
+
+def has_current_layout(graph):
+    return isinstance(graph.get("layout"), dict) and graph["layout"].get("version") == GRAPH_LAYOUT_VERSION
@@ -0,0 +1,195 @@
+import re
+
+_TITLE_PREFIXES = ("the ",)
+
+
+def normalize_name(name):
+    """Case-, whitespace- and punctuation-insensitive key for a character name."""
+    key = re.sub(r"[^\w\s'-]", "", str(name)).lower()
+    key = re.sub(r"\s+", " ", key).strip()
+    for prefix in _TITLE_PREFIXES:
+        if key.startswith(prefix):
+            key = key[len(prefix):]
+    return key
+
+
+def _entries(partial, field):
+    """The dict entries of one list field of a partial; anything malformed is skipped."""
+    if not isinstance(partial, dict) or not isinstance(partial.get(field), list):
+        return []
+    return [entry for entry in partial[field] if isinstance(entry, dict)]
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else ""
+
+
+class NameSets:
+    """Union-find over normalized names so aliases collapse onto one character."""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, key):
+        self.parent.setdefault(key, key)
+        root = key
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[key] != root:
+            self.parent[key], key = root, self.parent[key]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # Keep the smaller key as root so the result doesn't depend on union order
+            if root_b < root_a:
+                root_a, root_b = root_b, root_a
+            self.parent[root_b] = root_a
+
+
+def merge_extractions(partials):
+    """
+    Merge per-chunk extraction results into one character/relationship set.
+
+    Each partial is a dict with "characters" ([{"name", "aliases",
+    "description"}]) and "relationships" ([{"source", "target",
+    "description"}]). Names are de-duplicated by normalized form and through
+    aliases; relationship descriptions for the same pair are combined in
+    chunk order. The result is deterministic for a given input order.
+    Malformed partials and entries (not a dict, or a name that isn't a
+    string) are skipped rather than failing the whole merge.
+    """
+    names = NameSets()
+    first_seen = {}
+    spellings = {}
+
+    def register(name):
+        key = normalize_name(_text(name))
+        if not key:
+            return None
+        names.find(key)
+        first_seen.setdefault(key, len(first_seen))
+        counts = spellings.setdefault(key, {})
+        counts[name.strip()] = counts.get(name.strip(), 0) + 1
+        return key
+
+    for partial in partials:
+        for character in _entries(partial, "characters"):
+            key = register(character.get("name"))
+            if key is None:
+                continue
+            aliases = character.get("aliases")
+            for alias in aliases if isinstance(aliases, list) else []:
+                alias_key = register(alias)
+                if alias_key is not None:
+                    names.union(key, alias_key)
+        for relationship in _entries(partial, "relationships"):
+            register(relationship.get("source"))
+            register(relationship.get("target"))
+
+    # Group every normalized key under its root
+    groups = {}
+    for key in sorted(first_seen, key=first_seen.get):
+        groups.setdefault(names.find(key), []).append(key)
+
+    characters = {}
+    for root, keys in groups.items():
+        variants = {}
+        for key in keys:
+            for spelling, count in spellings[key].items():
+                variants[spelling] = variants.get(spelling, 0) + count
+        # Prefer the longest (most complete) spelling, then the most frequent
+        canonical = sorted(variants, key=lambda v: (-len(v.split()), -variants[v], v))[0]
+        characters[root] = {
+            "name": canonical,
+            "aliases": sorted(v for v in variants if v != canonical),
+            "descriptions": [],
+            "order": min(first_seen[key] for key in keys),
+        }
+
+    relationships = {}
+    for partial in partials:
+        for character in _entries(partial, "characters"):
+            key = normalize_name(_text(character.get("name")))
+            description = _text(character.get("description"))
+            if key and description:
+                entry = characters[names.find(key)]
+                if description not in entry["descriptions"]:
+                    entry["descriptions"].append(description)
+        for relationship in _entries(partial, "relationships"):
+            source = normalize_name(_text(relationship.get("source")))
+            target = normalize_name(_text(relationship.get("target")))
+            if not source or not target:
+                continue
+            source, target = names.find(source), names.find(target)
+            if source == target:
+                continue
+            pair = (source, target)
+            if pair not in relationships and (target, source) in relationships:
+                pair = (target, source)
+            entry = relationships.setdefault(pair, [])
+            description = _text(relationship.get("description"))
+            if description and description not in entry:
+                entry.append(description)
+
+    ordered = sorted(characters.items(), key=lambda item: item[1]["order"])
+    return {
+        "characters": [
+            {
+                "name": entry["name"],
+                "aliases": entry["aliases"],
+                "descriptions": entry["descriptions"],
+            }
+            for _, entry in ordered
+        ],
+        "relationships": [
+            {
+                "source": characters[source]["name"],
+                "target": characters[target]["name"],
+                "descriptions": descriptions,
+            }
+            for (source, target), descriptions in relationships.items()
+        ],
+    }
+
+
+def merged_to_text(merged):
+    """Render merged extraction data as the descriptive text the relationship prompt expects."""
+    relationships_by_name = {}
+    for relationship in merged["relationships"]:
+        relationships_by_name.setdefault(relationship["source"], []).append(relationship)
+
+    lines = []
+    for character in merged["characters"]:
+        lines.append(f"* **Character:** {character['name']}")
+        if character["aliases"]:
+            lines.append(f"    * **Also known as:** {', '.join(character['aliases'])}")
+        if character["descriptions"]:
+            lines.append(f"    * **Role:** {' '.join(character['descriptions'])}")
+        for relationship in relationships_by_name.get(character["name"], []):
+            description = " ".join(relationship["descriptions"]) or "Interacts in the story."
+            lines.append(f"    * **Relationship with {relationship['target']}:** {description}")
+    return "\n".join(lines)
+
+
+def merged_to_graph(merged, title="", summary=""):
+    """Build nodes/links graph data directly from merged extraction data."""
+    ids = {}
+    nodes = []
+    for i, character in enumerate(merged["characters"]):
+        ids[character["name"]] = f"c{i + 1}"
+        nodes.append({"id": f"c{i + 1}", "name": character["name"], "val": i + 1})
+
+    links = []
+    for relationship in merged["relationships"]:
+        label = "; ".join(relationship["descriptions"]) or "interacts with"
+        links.append(
+            {
+                "source": ids[relationship["source"]],
+                "target": ids[relationship["target"]],
+                "label": label,
+            }
+        )
+
+    return {"title": title, "summary": summary, "nodes": nodes, "links": links}
@@ -0,0 +1,157 @@
+from graph_merge import NameSets, normalize_name
+from mentions import NAME_TITLES
+
+GRAPH_SCHEMA_VERSION = 1
+
+
+class GraphSchemaError(ValueError):
+    """Graph data that cannot be turned into a nodes/links graph."""
+
+
+def _endpoint(value):
+    # Rendering libraries replace link endpoints with the node objects themselves
+    if isinstance(value, dict):
+        value = value.get("id", value.get("name"))
+    return None if value is None else str(value)
+
+
+def _short_forms(name):
+    """First and last word of a multi-word name, ignoring titles such as "Mr." or "Professor"."""
+    words = [w.strip(".,") for w in name.split()]
+    words = [w for w in words if w and w.lower().rstrip(".") not in NAME_TITLES]
+    if len(words) < 2:
+        return set()
+    return {normalize_name(words[0]), normalize_name(words[-1])}
+
+
+def normalize_graph(graph):
+    """
+    Validate graph data against the nodes/links schema and repair it locally,
+    in time linear in its size.
+
+    Nodes need a non-empty name. Nodes whose names or aliases normalize to the
+    same key are merged, and so is a one-word node ("Hagrid") whose name is
+    the first or last name of exactly one multi-word node ("Rubeus Hagrid").
+    Links may reference node ids or names; dangling links and self-links are
+    dropped, and duplicate links between the same pair (either direction) are
+    collapsed into one, keeping each distinct label. Ids are reassigned as
+    "c1", "c2", ... and "val" runs sequentially from 1.
+
+    Returns (graph, report); the report counts what was merged or dropped.
+    Raises GraphSchemaError if `graph` is not an object with a nodes list.
+    """
+    if not isinstance(graph, dict) or not isinstance(graph.get("nodes"), list):
+        raise GraphSchemaError("Graph data must be an object with a \"nodes\" list")
+    raw_links = graph.get("links")
+    if not isinstance(raw_links, list):
+        raw_links = []
+
+    report = {
+        "nodes_in": len(graph["nodes"]),
+        "links_in": len(raw_links),
+        "invalid_nodes": 0,
+        "merged_nodes": 0,
+        "dangling_links": 0,
+        "self_links": 0,
+        "duplicate_links": 0,
+    }
+
+    # Valid nodes, each with the keys of its name and aliases
+    nodes = []
+    names = NameSets()
+    for node in graph["nodes"]:
+        name = node.get("name") if isinstance(node, dict) else None
+        if not isinstance(name, str) or not normalize_name(name):
+            report["invalid_nodes"] += 1
+            continue
+        aliases = node.get("aliases") if isinstance(node.get("aliases"), list) else []
+        keys = [normalize_name(name)] + [normalize_name(a) for a in aliases if isinstance(a, str)]
+        keys = [key for key in keys if key]
+        for key in keys[1:]:
+            names.union(keys[0], key)
+        nodes.append({"id": node.get("id"), "name": name.strip(), "aliases": aliases, "key": keys[0], "keys": keys})
+
+    # One-word names that are the first or last name of exactly one longer name
+    short_owners = {}
+    for node in nodes:
+        for short in _short_forms(node["name"]) - {node["key"]}:
+            short_owners.setdefault(short, set()).add(names.find(node["key"]))
+    for node in nodes:
+        owners = short_owners.get(node["key"], set())
+        if len(node["name"].split()) == 1 and len(owners) == 1:
+            names.union(next(iter(owners)), node["key"])
+
+    # Collapse each group onto its first node, keeping the longest spelling as its name
+    groups = {}
+    for node in nodes:
+        root = names.find(node["key"])
+        group = groups.get(root)
+        if group is None:
+            groups[root] = {"name": node["name"], "members": [node]}
+            continue
+        report["merged_nodes"] += 1
+        group["members"].append(node)
+        if len(node["name"].split()) > len(group["name"].split()):
+            group["name"] = node["name"]
+
+    # Old ids and every known spelling resolve to the new node id
+    out_nodes = []
+    resolve = {}
+    for i, group in enumerate(groups.values()):
+        node_id = f"c{i + 1}"
+        aliases = []
+        for member in group["members"]:
+            for spelling in [member["name"], *member["aliases"]]:
+                if isinstance(spelling, str) and spelling.strip() and spelling.strip() != group["name"] \
+                        and spelling.strip() not in aliases:
+                    aliases.append(spelling.strip())
+            if member["id"] is not None:
+                resolve.setdefault(str(member["id"]), node_id)
+            for key in member["keys"]:
+                resolve.setdefault(key, node_id)
+        out_node = {"id": node_id, "name": group["name"], "val": i + 1}
+        if aliases:
+            out_node["aliases"] = aliases
+        out_nodes.append(out_node)
+
+    def lookup(value):
+        if value is None:
+            return None
+        return resolve.get(value) or resolve.get(normalize_name(value))
+
+    links = {}
+    for link in raw_links:
+        if not isinstance(link, dict):
+            report["dangling_links"] += 1
+            continue
+        source = lookup(_endpoint(link.get("source")))
+        target = lookup(_endpoint(link.get("target")))
+        if source is None or target is None:
+            report["dangling_links"] += 1
+            continue
+        if source == target:
+            report["self_links"] += 1
+            continue
+        label = link.get("label")
+        label = label.strip() if isinstance(label, str) else ""
+        pair = tuple(sorted((source, target)))
+        existing = links.get(pair)
+        if existing is None:
+            links[pair] = {"source": source, "target": target, "label": label, "labels": [label] if label else []}
+            continue
+        report["duplicate_links"] += 1
+        if label and label not in existing["labels"]:
+            existing["labels"].append(label)
+            existing["label"] = "; ".join(existing["labels"])
+
+    out_links = [{"source": l["source"], "target": l["target"], "label": l["label"]} for l in links.values()]
+    report["nodes_out"] = len(out_nodes)
+    report["links_out"] = len(out_links)
+
+    normalized = {
+        "title": graph.get("title") if isinstance(graph.get("title"), str) else "",
+        "summary": graph.get("summary") if isinstance(graph.get("summary"), str) else "",
+        "nodes": out_nodes,
+        "links": out_links,
+    }
+    return normalized, report
@@ -0,0 +1,193 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import run_in_context
+
+FINISHED_STATES = ("succeeded", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function once the job has been cancelled."""
+
+
+class Job:
+    """
+    Handle a job function receives: reports the current stage, chunk-level
+    progress and per-chunk partial results, and tells it when to stop.
+    Safe to use from the worker threads a job fans out to.
+    """
+
+    def __init__(self, kind, params):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = "queued"
+        self.stage = None
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.partial = {}
+        self.chunk_errors = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.job_id} was cancelled")
+
+    def set_stage(self, stage, total=None):
+        """Move on to `stage`; with `total`, start counting that many chunks."""
+        with self._lock:
+            self.stage = stage
+            if total is not None:
+                self.total, self.done, self.failed = total, 0, 0
+                self.partial, self.chunk_errors = {}, {}
+
+    def chunk_done(self, index, result=None, error=None):
+        """Record chunk `index` as finished, with its output or the error it failed with."""
+        with self._lock:
+            self.done += 1
+            if error is not None:
+                self.failed += 1
+                self.chunk_errors[index] = str(error)
+            elif result is not None:
+                self.partial[index] = result
+
+    def snapshot(self, include_partial=False):
+        with self._lock:
+            job = {
+                "job_id": self.job_id,
+                "kind": self.kind,
+                "status": self.status,
+                "cancel_requested": self.cancelled,
+                "stage": self.stage,
+                "progress": {
+                    "total_chunks": self.total,
+                    "completed_chunks": self.done,
+                    "failed_chunks": self.failed,
+                    "fraction": round(self.done / self.total, 4) if self.total else None,
+                },
+                "params": copy.deepcopy(self.params),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+            if self.error is not None:
+                job["error"] = self.error
+            if self.result is not None:
+                job["result"] = copy.deepcopy(self.result)
+            if include_partial:
+                job["partial_results"] = [
+                    {"chunk": i + 1, "result": copy.deepcopy(self.partial[i])} for i in sorted(self.partial)
+                ]
+                job["chunk_errors"] = [
+                    {"chunk": i + 1, "error": self.chunk_errors[i]} for i in sorted(self.chunk_errors)
+                ]
+            return job
+
+
+class JobQueue:
+    """
+    In-process queue for long-running requests.
+
+    Jobs run on a small worker pool; each is a function `fn(job)` returning
+    a (body, status_code) pair like the synchronous endpoints, and a status
+    of 400 or above marks the job failed. Cancelling a queued job removes it
+    from the queue; a running job stops at its next `check_cancelled()`, so
+    chunks already sent to the model still finish. Finished jobs are kept
+    for `ttl` seconds, and the oldest finished ones are dropped beyond
+    `max_jobs`.
+    """
+
+    def __init__(self, max_workers=2, ttl=3600, max_jobs=256):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def submit(self, kind, fn, params=None):
+        """Queue `fn(job)` and return the new job's snapshot."""
+        job = Job(kind, params or {})
+        with self._lock:
+            self._evict_locked()
+            self._jobs[job.job_id] = job
+        job.future = self._pool.submit(run_in_context(self._run), job, fn)
+        return job.snapshot()
+
+    def _run(self, job, fn):
+        with job._lock:
+            if job.cancelled:
+                return
+            job.status = "running"
+            job.started_at = time.time()
+        try:
+            body, status = fn(job)
+            job.check_cancelled()
+            outcome = "succeeded" if status < 400 else "failed"
+            error = body.get("error") if outcome == "failed" else None
+        except JobCancelled:
+            body, outcome, error = None, "cancelled", None
+        except Exception as e:
+            print(f"Job {job.job_id} ({job.kind}) failed: {str(e)}")
+            body, outcome, error = None, "failed", str(e)
+        with job._lock:
+            job.status = outcome
+            job.result = body
+            job.error = error
+            job.finished_at = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            self._evict_locked()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Ask a job to stop. Returns the job, or None if it is unknown."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job._cancel.set()
+        with job._lock:
+            if job.status == "queued":
+                # _run also checks the flag, in case the pool picks the job up first
+                if job.future is not None:
+                    job.future.cancel()
+                job.status = "cancelled"
+                job.finished_at = time.time()
+        return job
+
+    def _evict_locked(self):
+        now = time.time()
+        finished = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in FINISHED_STATES
+        ]
+        for job_id in finished:
+            if now - self._jobs[job_id].finished_at > self.ttl:
+                del self._jobs[job_id]
+        finished = [job_id for job_id in finished if job_id in self._jobs]
+        while len(self._jobs) > self.max_jobs and finished:
+            del self._jobs[finished.pop(0)]
+
+    def stats(self):
+        with self._lock:
+            self._evict_locked()
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {"jobs": len(self._jobs), "by_status": counts, "max_jobs": self.max_jobs}
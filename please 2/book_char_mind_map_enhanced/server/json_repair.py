@@ -0,0 +1,159 @@
+import json
+import re
+
+FENCE_RE = re.compile(r"```[ \t]*(?:json|JSON)?[ \t]*\n?(.*?)(?:```|$)", re.DOTALL)
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class JSONExtractionError(ValueError):
+    """No JSON object could be recovered from a model response."""
+
+
+def strip_fences(text):
+    """Contents of ``` fenced blocks (last first), followed by the text itself."""
+    blocks = [m.group(1) for m in FENCE_RE.finditer(text) if "{" in m.group(1)]
+    return blocks[::-1] + [text]
+
+
+def clean_json_text(text):
+    """
+    Remove // line comments, /* */ block comments and trailing commas
+    (a "," followed only by whitespace or comments before "}" or "]"),
+    leaving string contents untouched.
+    """
+    out = []
+    i = 0
+    in_string = False
+    pending_comma = None
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if ch == "\\" and i + 1 < len(text):
+                out.append(text[i + 1])
+                i += 1
+            elif ch == '"':
+                in_string = False
+        elif text.startswith("//", i):
+            end = text.find("\n", i)
+            i = len(text) if end == -1 else end
+            continue
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = len(text) if end == -1 else end + 2
+            continue
+        elif ch.isspace():
+            out.append(ch)
+        else:
+            if pending_comma is not None and ch in "}]":
+                del out[pending_comma]
+            pending_comma = len(out) if ch == "," else None
+            if ch == '"':
+                in_string = True
+            out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def _scan(text, start):
+    """
+    Walk a JSON value starting at the "{" at `start`, tracking strings and
+    nesting. Returns (end, cut, stack): `end` is the index just past the
+    matching "}", -1 if a bracket is mismatched, or None if the text stops
+    first; `cut` and `stack` describe the last point where everything before
+    it was complete (after an opening or closing bracket, or before a comma)
+    and the brackets still open there.
+    """
+    stack = []
+    in_string = False
+    cut, cut_stack = start + 1, ["{"]
+    i = start
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            if ch == "\\":
+                i += 1
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+            cut, cut_stack = i + 1, list(stack)
+        elif ch in "}]":
+            if not stack or _CLOSERS[stack[-1]] != ch:
+                return -1, cut, cut_stack
+            stack.pop()
+            if not stack:
+                return i + 1, i + 1, []
+            cut, cut_stack = i + 1, list(stack)
+        elif ch == ",":
+            cut, cut_stack = i, list(stack)
+        i += 1
+    return None, cut, cut_stack
+
+
+def scan_objects(text):
+    """
+    Find the top-level {...} objects in `text`. Returns (spans, truncated):
+    (start, end) spans of the complete objects, and the start of a trailing
+    object the text ends inside of, or None.
+    """
+    spans = []
+    i = text.find("{")
+    while i != -1:
+        end, _, _ = _scan(text, i)
+        if end is None:
+            return spans, i
+        if end == -1:
+            i = text.find("{", i + 1)
+            continue
+        spans.append((i, end))
+        i = text.find("{", end)
+    return spans, None
+
+
+def close_truncated(text, start):
+    """
+    Repair an object cut off mid-stream (e.g. at max_tokens): drop the
+    incomplete trailing element and close every bracket still open.
+    """
+    _, cut, stack = _scan(text, start)
+    return text[start:cut].rstrip().rstrip(",") + "".join(_CLOSERS[b] for b in reversed(stack))
+
+
+def extract_json_object(text):
+    """
+    Recover a JSON object from a model response. Tries the text as-is, then
+    each fenced block (last first) and the whole text: a trailing object cut
+    off mid-stream, closed after its last complete element, and then the
+    complete objects from last to first. Comments and trailing commas are
+    tolerated. Raises JSONExtractionError if nothing parses to an object.
+    """
+    if not text or not text.strip():
+        raise JSONExtractionError("Empty response")
+
+    try:
+        parsed = json.loads(text)
+        if isinstance(parsed, dict):
+            return parsed
+    except ValueError:
+        pass
+
+    for candidate in strip_fences(text):
+        cleaned = clean_json_text(candidate)
+        spans, truncated = scan_objects(cleaned)
+        attempts = [cleaned[start:end] for start, end in reversed(spans)]
+        if truncated is not None:
+            # A response cut off mid-object is the newest output; try it first
+            attempts.insert(0, close_truncated(cleaned, truncated))
+        for attempt in attempts:
+            try:
+                parsed = json.loads(attempt)
+            except ValueError:
+                continue
+            if isinstance(parsed, dict):
+                return parsed
+
+    raise JSONExtractionError("No valid JSON object found in response")
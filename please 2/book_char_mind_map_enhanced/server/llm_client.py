@@ -0,0 +1,473 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from llm_cache import make_request_key
+from metrics import Counter, Gauge, Histogram
+from rate_limit import RateLimiter, RetryPolicy, parse_retry_after
+from singleflight import SingleFlight
+from token_counter import PromptTooLarge
+from tracing import run_in_context, span, tracer
+
+
+LLM_CALLS = Counter("llm_calls_total", "Llama API calls by mode and how they were answered", ["mode", "source"])
+LLM_CALL_SECONDS = Histogram(
+    "llm_call_duration_seconds", "Llama API call latency, including retries", ["mode", "outcome"]
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the Llama API", ["kind"])
+LLM_FINISH_REASONS = Counter("llm_finish_reasons_total", "Completion stop reasons", ["reason"])
+LLM_ERRORS = Counter("llm_errors_total", "Failed Llama API attempts by error type", ["type"])
+LLM_RETRIES = Counter("llm_retries_total", "Llama API attempts retried, by the error that caused them", ["type"])
+LLM_IN_FLIGHT = Gauge("llm_requests_in_flight", "Llama API requests currently being sent or streamed")
+
+
+def error_type(error):
+    """Short label for an error, for metrics."""
+    if isinstance(error, PromptTooLarge):
+        return "prompt_too_large"
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return f"http_{error.response.status_code}"
+    if isinstance(error, requests.exceptions.Timeout):
+        return "timeout"
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return "connection"
+    if isinstance(error, requests.exceptions.RequestException):
+        return "request"
+    if isinstance(error, ValueError):
+        return "invalid_response"
+    return type(error).__name__
+
+
+def _metric_values(metrics):
+    """The API reports usage as a list of {"metric", "value"}; streamed events are collected into a dict."""
+    if isinstance(metrics, list):
+        return {m.get("metric"): m.get("value") for m in metrics if isinstance(m, dict)}
+    return metrics or {}
+
+
+def record_usage(metrics, stop_reason):
+    metrics = _metric_values(metrics)
+    for kind in ("prompt", "completion"):
+        if metrics.get(f"num_{kind}_tokens"):
+            LLM_TOKENS.inc(metrics[f"num_{kind}_tokens"], kind=kind)
+    LLM_FINISH_REASONS.inc(reason=stop_reason or "unknown")
+
+
+def prompt_bytes(messages):
+    return sum(len(str(m.get("content") or "").encode("utf-8")) for m in messages)
+
+
+def extract_completion_text(response_json):
+    """Pull the completion text out of a Llama API response body."""
+    if "completion_message" in response_json:
+        content = response_json["completion_message"]["content"]
+        if isinstance(content, dict) and "text" in content:
+            return content["text"]
+        return str(content)
+
+    print(f"Unexpected API response structure: {response_json}")
+    return None
+
+
+def usage_tokens(metrics):
+    """Prompt plus completion tokens from the API's usage metrics, or None if not reported."""
+    metrics = _metric_values(metrics)
+    if "num_prompt_tokens" not in metrics:
+        return None
+    return metrics.get("num_prompt_tokens", 0) + metrics.get("num_completion_tokens", 0)
+
+
+def map_ordered(fn, items, max_workers):
+    """
+    Run `fn` over `items` on a worker pool and return the outcomes in input
+    order. Each outcome is a `(result, error)` pair so one failing item does
+    not abort the rest.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    def run(item):
+        try:
+            return fn(item), None
+        except Exception as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        # One copy of the caller's context per item keeps trace spans nested under the caller
+        futures = [pool.submit(run_in_context(run), item) for item in items]
+        return [future.result() for future in futures]
+
+
+class LlamaClient:
+    """
+    Shared client for the Llama chat completions API.
+
+    Keeps a pool of keep-alive connections so calls reuse TCP/TLS sessions,
+    and bounds how many requests are in flight at once. `complete` is the
+    blocking entry point, `stream` yields the completion as it is generated
+    and `acomplete` is the asyncio counterpart. When a
+    `response_cache` is given, identical requests are answered from it.
+    With a `token_counter` and `context_window`, every prompt is checked
+    against the window before it is sent; unless the counter is exact (the
+    model's own tokenizer), `token_margin` of the window is held back to
+    absorb counting error. Transient failures (429, 5xx,
+    timeouts) are retried per `retry_policy`, and `rate_limiter` keeps
+    requests and tokens within the provider's quota. Identical `complete`
+    calls made while one is already in flight share its result instead of
+    sending their own request.
+    """
+
+    def __init__(
+        self,
+        api_key,
+        api_url,
+        model,
+        pool_size=16,
+        max_concurrency=8,
+        connect_timeout=10,
+        read_timeout=600,
+        response_cache=None,
+        token_counter=None,
+        context_window=None,
+        retry_policy=None,
+        rate_limiter=None,
+        token_margin=0.1,
+    ):
+        self.api_url = api_url
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_concurrency = max_concurrency
+        self.response_cache = response_cache
+        self.token_counter = token_counter
+        self.context_window = context_window
+        self.token_margin = token_margin
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.retries = 0
+        self.failures = 0
+        self.in_flight = SingleFlight()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            }
+        )
+
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._async_semaphores = weakref.WeakKeyDictionary()
+        self._async_lock = threading.Lock()
+
+    def build_payload(self, messages, max_tokens, temperature):
+        return {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        }
+
+    def check_prompt(self, messages, max_tokens):
+        """
+        Pre-flight check against the context window. Raises PromptTooLarge
+        when the prompt alone does not fit; when only prompt plus completion
+        overflows, returns `max_tokens` reduced to the room that is left.
+        """
+        if self.token_counter is None or not self.context_window:
+            return max_tokens
+        window = self.usable_window()
+        if self.token_counter.fits(messages, window - max_tokens):
+            return max_tokens
+
+        prompt_tokens = self.token_counter.count_messages(messages)
+        if prompt_tokens >= window:
+            LLM_ERRORS.inc(type="prompt_too_large")
+            raise PromptTooLarge(prompt_tokens, window)
+        print(f"Prompt is about {prompt_tokens} tokens; capping max_tokens at {window - prompt_tokens}")
+        return window - prompt_tokens
+
+    def usable_window(self):
+        """
+        The context window prompts are checked against. Counts from tiktoken
+        (an OpenAI vocabulary) or the heuristic are only estimates of the
+        Llama tokenizer's, so a `token_margin` fraction is kept in reserve.
+        """
+        if getattr(self.token_counter, "exact", False):
+            return self.context_window
+        return int(self.context_window * (1 - self.token_margin))
+
+    def complete(self, messages, max_tokens=800, temperature=0.7, use_cache=True):
+        """
+        Send a chat completion request and return the completion text,
+        or None if the call failed. Pass use_cache=False for creative calls
+        that should produce a fresh completion every time (identical calls
+        made at the same moment still share one). Raises PromptTooLarge for
+        prompts that cannot fit the context window.
+        """
+        with span("llm.complete", messages=len(messages), prompt_bytes=prompt_bytes(messages),
+                  max_tokens=max_tokens, temperature=temperature) as current:
+            max_tokens = self.check_prompt(messages, max_tokens)
+            key = make_request_key(self.model, messages, max_tokens, temperature)
+            cache = self.response_cache if use_cache else None
+            if cache is not None:
+                cached = cache.get(key)
+                if cached is not None:
+                    LLM_CALLS.inc(mode="complete", source="cache")
+                    current.set(source="cache", completion_bytes=len(cached.encode("utf-8")))
+                    return cached
+
+            def post():
+                result = self._post(messages, max_tokens, temperature)
+                if cache is not None and result is not None:
+                    cache.set(key, result)
+                return result
+
+            # Concurrent duplicates are double submits, so uncached calls coalesce too
+            result, shared = self.in_flight.do(key, post)
+            LLM_CALLS.inc(mode="complete", source="shared" if shared else "api")
+            if shared:
+                print(f"Shared an in-flight Llama API call for {key[:12]}")
+            current.set(source="shared" if shared else "api",
+                        completion_bytes=len(result.encode("utf-8")) if result else 0)
+            return result
+
+    def _reserve_tokens(self, messages, max_tokens):
+        """Tokens to reserve with the rate limiter: the prompt plus the whole completion budget."""
+        if self.token_counter is not None:
+            return self.token_counter.count_messages(messages) + max_tokens
+        return sum(len(str(m.get("content") or "")) for m in messages) // 4 + max_tokens
+
+    def _used_tokens(self, metrics, reserved, max_tokens, pieces):
+        """Tokens a streamed call used: the reported usage, else the prompt estimate plus the text received."""
+        used = usage_tokens(metrics)
+        if used is not None:
+            return used
+        text = "".join(pieces)
+        completion = self.token_counter.count(text) if self.token_counter is not None else len(text) // 4
+        return reserved - max_tokens + completion
+
+    def _request(self, data, reserved, stream=False, trace=None):
+        """
+        POST `data` under the rate limiter and concurrency bound, retrying
+        transient failures with backoff. Returns the successful response or
+        raises the last RequestException. For a streamed response the
+        concurrency slot is still held and the caller must release
+        its slot with `_release_slot()` once it has read the body. The
+        number of attempts is recorded on the `trace` span, if given.
+        """
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(reserved)
+            self._acquire_slot()
+            try:
+                response = self.session.post(
+                    self.api_url, json=data, timeout=self.timeout, stream=stream
+                )
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                self._release_slot()
+                LLM_ERRORS.inc(type=error_type(e))
+                # A rejected call does not count against the token quota
+                self.rate_limiter.settle(reserved, 0)
+                failed = getattr(e, "response", None)
+                status = failed.status_code if failed is not None else None
+                if trace is not None:
+                    trace.set(attempts=attempt + 1, last_error=error_type(e))
+                if not self.retry_policy.should_retry(attempt, status):
+                    self.failures += 1
+                    raise
+                retry_after = parse_retry_after(failed.headers.get("Retry-After")) if failed is not None else None
+                delay = self.retry_policy.delay(attempt, retry_after)
+                if status == 429:
+                    # Everyone else is about to hit the same limit; hold them back too
+                    self.rate_limiter.pause(delay)
+                self.retries += 1
+                LLM_RETRIES.inc(type=error_type(e))
+                attempt += 1
+                print(f"Llama API call failed ({status or type(e).__name__}), "
+                      f"retry {attempt}/{self.retry_policy.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            if not stream:
+                self._release_slot()
+            if trace is not None:
+                trace.set(attempts=attempt + 1, status=response.status_code)
+            return response
+
+    def _acquire_slot(self):
+        self._semaphore.acquire()
+        LLM_IN_FLIGHT.inc()
+
+    def _release_slot(self):
+        LLM_IN_FLIGHT.dec()
+        self._semaphore.release()
+
+    def _post(self, messages, max_tokens, temperature):
+        data = self.build_payload(messages, max_tokens, temperature)
+        reserved = self._reserve_tokens(messages, max_tokens) if self.rate_limiter.enabled else 0
+
+        started = time.perf_counter()
+        try:
+            with span("llm.request") as current:
+                response = self._request(data, reserved, trace=current)
+                with span("llm.parse_response", bytes=len(response.content or b"")):
+                    response_json = response.json()
+                print(f"API Response: {json.dumps(response_json, indent=2)}")
+                usage = _metric_values(response_json.get("metrics"))
+                stop_reason = (response_json.get("completion_message") or {}).get("stop_reason")
+                current.set(prompt_tokens=usage.get("num_prompt_tokens"),
+                            completion_tokens=usage.get("num_completion_tokens"), stop_reason=stop_reason)
+            self.rate_limiter.settle(reserved, usage_tokens(usage))
+            record_usage(usage, stop_reason)
+            text = extract_completion_text(response_json)
+            if text is None:
+                LLM_ERRORS.inc(type="invalid_response")
+            LLM_CALL_SECONDS.observe(time.perf_counter() - started, mode="complete",
+                                     outcome="ok" if text is not None else "error")
+            return text
+
+        except requests.exceptions.RequestException as e:
+            LLM_CALL_SECONDS.observe(time.perf_counter() - started, mode="complete", outcome="error")
+            print(f"Error calling Llama API: {e}")
+            if hasattr(e, "response") and e.response is not None:
+                print(f"Response content: {e.response.text}")
+            return None
+
+    def stream(self, messages, max_tokens=800, temperature=0.7, use_cache=True):
+        """
+        Stream a chat completion. Yields {"event": "token", "text": ...} for
+        each piece of text as it arrives, then one {"event": "done", ...}
+        carrying the stop reason and usage metrics, or {"event": "error", ...}
+        if the call failed. The full text is cached once the stream completes.
+        """
+        try:
+            max_tokens = self.check_prompt(messages, max_tokens)
+        except PromptTooLarge as e:
+            yield {"event": "error", "error": str(e)}
+            return
+
+        cache = self.response_cache if use_cache else None
+        if cache is not None:
+            key = make_request_key(self.model, messages, max_tokens, temperature)
+            cached = cache.get(key)
+            if cached is not None:
+                LLM_CALLS.inc(mode="stream", source="cache")
+                yield {"event": "token", "text": cached}
+                yield {"event": "done", "stop_reason": "stop", "metrics": {}, "cached": True}
+                return
+
+        data = self.build_payload(messages, max_tokens, temperature)
+        data["stream"] = True
+        reserved = self._reserve_tokens(messages, max_tokens) if self.rate_limiter.enabled else 0
+
+        LLM_CALLS.inc(mode="stream", source="api")
+        started = time.perf_counter()
+        # Not made current: this generator runs in whatever context iterates it
+        trace, _ = tracer.start("llm.stream", current=False, messages=len(messages),
+                                prompt_bytes=prompt_bytes(messages), max_tokens=max_tokens)
+        pieces = []
+        stop_reason = None
+        metrics = {}
+        response = None
+        error = None
+        finished = False
+        try:
+            # Only the request itself is retried; once tokens have been sent on, a failure is final
+            response = self._request(data, reserved, stream=True, trace=trace)
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                event = json.loads(payload).get("event", {})
+                delta = event.get("delta") or {}
+                if delta.get("text"):
+                    pieces.append(delta["text"])
+                    yield {"event": "token", "text": delta["text"]}
+                if event.get("stop_reason"):
+                    stop_reason = event["stop_reason"]
+                for metric in event.get("metrics") or []:
+                    metrics[metric["metric"]] = metric["value"]
+            finished = True
+        except (requests.exceptions.RequestException, ValueError) as e:
+            error = e
+        finally:
+            # Also runs when the consumer closes the generator early (GeneratorExit)
+            if response is not None:
+                response.close()
+                self._release_slot()
+                # A call that failed before responding was already settled by _request
+                self.rate_limiter.settle(reserved, self._used_tokens(metrics, reserved, max_tokens, pieces))
+            if not finished and error is None:
+                interrupted = sys.exc_info()[1]
+                cancelled = isinstance(interrupted, GeneratorExit)
+                LLM_CALL_SECONDS.observe(time.perf_counter() - started, mode="stream",
+                                         outcome="cancelled" if cancelled else "error")
+                trace.set(cancelled=cancelled, completion_bytes=len("".join(pieces).encode("utf-8")))
+                tracer.end(trace, error=None if cancelled else interrupted)
+
+        if error is not None:
+            if not isinstance(error, requests.exceptions.RequestException):
+                LLM_ERRORS.inc(type=error_type(error))
+            LLM_CALL_SECONDS.observe(time.perf_counter() - started, mode="stream", outcome="error")
+            tracer.end(trace, error=error)
+            print(f"Error streaming from Llama API: {error}")
+            if hasattr(error, "response") and error.response is not None:
+                print(f"Response content: {error.response.text}")
+            yield {"event": "error", "error": str(error)}
+            return
+
+        text = "".join(pieces)
+        print(f"Streamed API response: {len(text)} chars, stop_reason={stop_reason}")
+        record_usage(metrics, stop_reason)
+        LLM_CALL_SECONDS.observe(time.perf_counter() - started, mode="stream", outcome="ok")
+        trace.set(completion_bytes=len(text.encode("utf-8")), stop_reason=stop_reason,
+                  prompt_tokens=metrics.get("num_prompt_tokens"), completion_tokens=metrics.get("num_completion_tokens"))
+        tracer.end(trace)
+        if cache is not None and text:
+            cache.set(key, text)
+        yield {"event": "done", "stop_reason": stop_reason, "metrics": metrics, "cached": False}
+
+    def _get_async_semaphore(self):
+        # asyncio primitives belong to one event loop, so keep one per loop.
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            semaphore = self._async_semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._async_semaphores[loop] = semaphore
+            return semaphore
+
+    async def acomplete(self, messages, max_tokens=800, temperature=0.7, use_cache=True):
+        """Async version of `complete`; runs the pooled request off the event loop."""
+        async with self._get_async_semaphore():
+            return await asyncio.to_thread(
+                self.complete, messages, max_tokens, temperature, use_cache
+            )
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "context_window": self.context_window,
+            "usable_window": self.usable_window() if self.context_window else None,
+            "max_retries": self.retry_policy.max_retries,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rate_limiter": self.rate_limiter.stats(),
+            "single_flight": self.in_flight.stats(),
+        }
+
+    def close(self):
+        self.session.close()
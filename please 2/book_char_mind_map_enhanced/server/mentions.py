@@ -0,0 +1,222 @@
+import bisect
+from array import array
+from collections import Counter, deque
+
+from chunking import PARAGRAPH_BREAK_RE, find_chapter_starts
+
+# Leading words that are titles, not names, and must never become aliases on their own
+NAME_TITLES = frozenset(
+    "mr mrs ms miss dr sir lady lord madam professor prof uncle aunt king queen "
+    "prince princess captain st saint father mother brother sister the".split()
+)
+
+
+class AhoCorasick:
+    """Multi-pattern string matcher: finds every pattern occurrence in one pass."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        self.lengths = [len(p) for p in patterns]
+
+        for pattern_id, pattern in enumerate(patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = nxt
+            self.output[state].append(pattern_id)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def iter_matches(self, text):
+        """Yield (start, end, pattern_id) for every occurrence, overlapping ones included."""
+        state = 0
+        goto, fail, output, lengths = self.goto, self.fail, self.output, self.lengths
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for pattern_id in output[state]:
+                yield i + 1 - lengths[pattern_id], i + 1, pattern_id
+
+
+def _lowercase_same_length(text):
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    # A few characters lowercase to more than one code point; keep offsets aligned
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+def derive_aliases(characters):
+    """
+    Add unambiguous short forms to each character's aliases: a first or last
+    name (ignoring titles like "Mr." or "Professor") that no other character shares.
+    """
+    candidates = []
+    for character in characters:
+        words = [w.strip(".,") for w in character["name"].split()]
+        words = [w for w in words if w and w.lower().rstrip(".") not in NAME_TITLES]
+        candidates.append({words[0], words[-1]} if len(words) > 1 else set())
+
+    counts = Counter(word.lower() for words in candidates for word in words)
+    taken = {n.lower() for c in characters for n in [c["name"], *c.get("aliases", [])]}
+
+    enriched = []
+    for character, words in zip(characters, candidates):
+        aliases = list(character.get("aliases", []))
+        for word in sorted(words):
+            if len(word) > 2 and counts[word.lower()] == 1 and word.lower() not in taken:
+                aliases.append(word)
+        enriched.append({**character, "aliases": aliases})
+    return enriched
+
+
+class MentionIndex:
+    """
+    Every occurrence of every character name or alias in a book.
+
+    Occurrences are stored column-wise in compact arrays (character, offset,
+    paragraph, chapter), sorted by offset, so frequency, first-appearance and
+    co-occurrence lookups are local and cheap.
+    """
+
+    def __init__(self, text, characters, chapter_starts=None):
+        """`characters` is a list of {"id", "name", "aliases"} dicts (graph nodes)."""
+        self.characters = [
+            {"id": str(c.get("id", c["name"])), "name": c["name"], "aliases": list(c.get("aliases", []))}
+            for c in characters
+            if c.get("name")
+        ]
+        self.ids = [c["id"] for c in self.characters]
+        self.position = {character_id: i for i, character_id in enumerate(self.ids)}
+
+        patterns = []
+        owners = []
+        seen = set()
+        for i, character in enumerate(self.characters):
+            for name in [character["name"], *character["aliases"]]:
+                key = name.strip().lower()
+                if key and key not in seen:
+                    seen.add(key)
+                    patterns.append(key)
+                    owners.append(i)
+
+        self.paragraph_starts = [0] + [m.end() for m in PARAGRAPH_BREAK_RE.finditer(text)]
+        self.chapter_starts = list(chapter_starts) if chapter_starts is not None else find_chapter_starts(text)
+
+        self.character_ids = array("l")
+        self.offsets = array("l")
+        self.lengths = array("l")
+        self.paragraphs = array("l")
+        self.chapters = array("l")
+        if not patterns:
+            return
+
+        # Longest match wins where names overlap ("Harry Potter" over "Harry")
+        lowered = _lowercase_same_length(text)
+        matches = []
+        for start, end, pattern_id in AhoCorasick(patterns).iter_matches(lowered):
+            before = lowered[start - 1] if start > 0 else " "
+            after = lowered[end] if end < len(lowered) else " "
+            if before.isalnum() or after.isalnum():
+                continue
+            matches.append((start, -(end - start), owners[pattern_id]))
+        matches.sort()
+
+        last_end = -1
+        for start, neg_length, owner in matches:
+            if start < last_end:
+                continue
+            last_end = start - neg_length
+            self.character_ids.append(owner)
+            self.offsets.append(start)
+            self.lengths.append(-neg_length)
+            self.paragraphs.append(bisect.bisect_right(self.paragraph_starts, start) - 1)
+            # Chapter 0 is any text before the first heading, as in chunking.chunk_text
+            self.chapters.append(bisect.bisect_right(self.chapter_starts, start))
+
+    def resolve(self, character):
+        """Map a character id or name (case-insensitive) to its position, or None."""
+        if character in self.position:
+            return self.position[character]
+        key = str(character).strip().lower()
+        for i, c in enumerate(self.characters):
+            if key == c["name"].lower() or key in (a.lower() for a in c["aliases"]):
+                return i
+        return None
+
+    def _occurrence(self, k):
+        return {
+            "offset": self.offsets[k],
+            "length": self.lengths[k],
+            "paragraph": self.paragraphs[k],
+            "chapter": self.chapters[k],
+        }
+
+    def frequencies(self):
+        counts = Counter(self.character_ids)
+        return {self.ids[i]: counts.get(i, 0) for i in range(len(self.ids))}
+
+    def first_appearances(self):
+        first = {}
+        for k, owner in enumerate(self.character_ids):
+            if owner not in first:
+                first[owner] = self._occurrence(k)
+        return {self.ids[i]: first[i] for i in sorted(first)}
+
+    def first_appearance(self, character):
+        i = self.resolve(character)
+        if i is None:
+            return None
+        for k, owner in enumerate(self.character_ids):
+            if owner == i:
+                return self._occurrence(k)
+        return None
+
+    def occurrences(self, character, limit=None):
+        i = self.resolve(character)
+        if i is None:
+            return []
+        found = []
+        for k, owner in enumerate(self.character_ids):
+            if owner == i:
+                found.append(self._occurrence(k))
+                if limit is not None and len(found) >= limit:
+                    break
+        return found
+
+    def co_occurrences(self, min_count=1):
+        """Pairs of characters mentioned in the same paragraph, with how many paragraphs they share."""
+        by_paragraph = {}
+        for owner, paragraph in zip(self.character_ids, self.paragraphs):
+            by_paragraph.setdefault(paragraph, set()).add(owner)
+
+        pairs = Counter()
+        for owners in by_paragraph.values():
+            ordered = sorted(owners)
+            for a in range(len(ordered)):
+                for b in range(a + 1, len(ordered)):
+                    pairs[(ordered[a], ordered[b])] += 1
+
+        return [
+            {"source": self.ids[a], "target": self.ids[b], "paragraphs": count}
+            for (a, b), count in pairs.most_common()
+            if count >= min_count
+        ]
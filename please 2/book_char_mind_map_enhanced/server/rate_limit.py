@@ -0,0 +1,156 @@
+import email.utils
+import random
+import threading
+import time
+
+# Statuses worth retrying: rate limited, timed out or a transient server error
+RETRYABLE_STATUSES = frozenset({408, 409, 425, 429, 500, 502, 503, 504, 529})
+
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait from a Retry-After header (delta-seconds or an HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter: attempt n waits a random time in
+    [0, min(max_delay, base_delay * 2**n)], so parallel callers that failed
+    together do not retry in lockstep. A server-provided Retry-After is
+    honored as a lower bound (capped at `max_retry_after`).
+    """
+
+    def __init__(self, max_retries=4, base_delay=1.0, max_delay=60.0, max_retry_after=300.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def should_retry(self, attempt, status=None):
+        """Whether to retry after failed `attempt` (0-based); `status` is None for connection errors."""
+        if attempt >= self.max_retries:
+            return False
+        return status is None or status in RETRYABLE_STATUSES
+
+    def delay(self, attempt, retry_after=None):
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            return max(backoff, min(retry_after, self.max_retry_after))
+        return backoff
+
+
+class TokenBucket:
+    """
+    Refills at `rate` units per second up to `capacity`. A request larger
+    than the capacity is let through once the bucket is full and leaves it
+    in debt, so oversized prompts are slowed down rather than refused.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` can be taken (0 if it can be taken now)."""
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= amount
+
+    def give_back(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    Client-side throttle matching a provider quota of `requests_per_second`
+    and `tokens_per_minute` (0 disables either). `acquire` blocks until both
+    buckets allow the call. Token reservations are estimates made before the
+    call; `settle` corrects them with the usage the API reports. `pause`
+    holds every caller back, e.g. after a 429 with Retry-After.
+    """
+
+    def __init__(self, requests_per_second=0, tokens_per_minute=0, burst_seconds=1.0):
+        self._lock = threading.Lock()
+        self._requests = None
+        self._tokens = None
+        if requests_per_second > 0:
+            self._requests = TokenBucket(requests_per_second, max(1.0, requests_per_second * burst_seconds))
+        if tokens_per_minute > 0:
+            self._tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self._paused_until = 0.0
+        self.waits = 0
+        self.waited_seconds = 0.0
+
+    @property
+    def enabled(self):
+        return self._requests is not None or self._tokens is not None
+
+    def acquire(self, tokens=0):
+        waited = False
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                delay = self._paused_until - now
+                if self._requests is not None:
+                    delay = max(delay, self._requests.wait_time(1, now))
+                if self._tokens is not None and tokens:
+                    delay = max(delay, self._tokens.wait_time(tokens, now))
+                if delay <= 0:
+                    if self._requests is not None:
+                        self._requests.take(1)
+                    if self._tokens is not None and tokens:
+                        self._tokens.take(tokens)
+                    return
+                if not waited:
+                    self.waits += 1
+                    waited = True
+                self.waited_seconds += delay
+            time.sleep(delay)
+
+    def settle(self, reserved, used):
+        """Return unused reserved tokens to the bucket, or take the overrun."""
+        if self._tokens is None or used is None:
+            return
+        with self._lock:
+            if used < reserved:
+                self._tokens.give_back(reserved - used)
+            else:
+                self._tokens.take(used - reserved)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "requests_per_second": self._requests.rate if self._requests else None,
+                "tokens_per_minute": self._tokens.rate * 60 if self._tokens else None,
+                "waits": self.waits,
+                "waited_seconds": round(self.waited_seconds, 3),
+            }
@@ -0,0 +1,116 @@
+import heapq
+import math
+import re
+from collections import Counter
+
+from chunking import PARAGRAPH_BREAK_RE
+
+TOKEN_RE = re.compile(r"[^\W_]+(?:'[^\W_]+)?")
+STOPWORDS = frozenset(
+    """
+    a about after again all also am an and any are as at be because been before being
+    but by can could did do does doing down during each few for from further had has
+    have having he her here hers herself him himself his how i if in into is it its
+    itself just me more most my myself no nor not now of off on once only or other our
+    ours out over own said same she should so some such than that the their theirs them
+    themselves then there these they this those through to too under until up very was
+    we were what when where which while who whom why will with would you your yours
+    """.split()
+)
+
+
+def tokenize(text):
+    """Lowercased word tokens with stopwords removed."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def split_passages(text, min_words=60, max_words=300):
+    """
+    Split text into paragraph-based passages. Short paragraphs (dialogue lines,
+    headings) are merged with their neighbours until a passage has at least
+    `min_words` words; a passage never grows past `max_words` by merging.
+    Returns (start, end) character offsets.
+    """
+    spans = []
+    pos = 0
+    for m in PARAGRAPH_BREAK_RE.finditer(text):
+        if m.start() > pos:
+            spans.append((pos, m.start()))
+        pos = m.end()
+    if pos < len(text):
+        spans.append((pos, len(text)))
+
+    passages = []
+    start = end = None
+    words = 0
+    for s_start, s_end in spans:
+        span_words = len(text[s_start:s_end].split())
+        if start is not None and (words >= min_words or words + span_words > max_words):
+            passages.append((start, end))
+            start = None
+        if start is None:
+            start, words = s_start, 0
+        end = s_end
+        words += span_words
+    if start is not None:
+        passages.append((start, end))
+    return passages
+
+
+class PassageIndex:
+    """In-memory inverted index over a book's passages, scored with Okapi BM25."""
+
+    def __init__(self, text, k1=1.5, b=0.75):
+        self.text = text
+        self.k1 = k1
+        self.b = b
+        self.passages = split_passages(text)
+
+        self.postings = {}
+        self.doc_lengths = []
+        for doc, (start, end) in enumerate(self.passages):
+            counts = Counter(tokenize(text[start:end]))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((doc, tf))
+
+        n = len(self.passages)
+        self.avg_doc_length = (sum(self.doc_lengths) / n) if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query, top_k=8, boost_terms=(), boost=2.0):
+        """
+        Return the `top_k` passages that best match `query`, in book order.
+        Terms from `boost_terms` (e.g. character names) are weighted by `boost`.
+        """
+        weights = Counter(tokenize(query))
+        for term in tokenize(" ".join(boost_terms)):
+            weights[term] += boost
+
+        scores = {}
+        avg = self.avg_doc_length or 1.0
+        for term, weight in weights.items():
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc, tf in self.postings[term]:
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lengths[doc] / avg)
+                scores[doc] = scores.get(doc, 0.0) + weight * idf * tf * (self.k1 + 1) / norm
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        results = []
+        for doc, score in sorted(best):
+            start, end = self.passages[doc]
+            results.append(
+                {
+                    "passage": doc,
+                    "start": start,
+                    "end": end,
+                    "score": round(score, 4),
+                    "text": self.text[start:end],
+                }
+            )
+        return results
@@ -0,0 +1,134 @@
+import re
+
+SEGMENTER_VERSION = 2
+
+_NUMBER_WORD = (
+    r"(?:one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|thirteen|"
+    r"fourteen|fifteen|sixteen|seventeen|eighteen|nineteen|twenty|thirty|forty|"
+    r"fifty|sixty|seventy|eighty|ninety|hundred)"
+)
+# Headings such as "CHAPTER 12", "Chapter Twenty-One: ...", "BOOK II", "Part iv"
+CHAPTER_HEADING_RE = re.compile(
+    r"^[ \t]*(?:chapter|book|part)[ \t]+"
+    rf"(?:\d+|[ivxlcdm]+|{_NUMBER_WORD}(?:[- ]{_NUMBER_WORD})*)\b[^\n]{{0,80}}$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# A bare upper-case roman numeral on its own line ("IV", "XII.")
+ROMAN_HEADING_RE = re.compile(r"^[ \t]*[IVXLCDM]{1,7}\.?[ \t]*$")
+GUTENBERG_START_RE = re.compile(r"^\s*\*{3}\s*START OF (?:THE|THIS) PROJECT GUTENBERG", re.IGNORECASE)
+GUTENBERG_END_RE = re.compile(r"^\s*\*{3}\s*END OF (?:THE|THIS) PROJECT GUTENBERG", re.IGNORECASE)
+# Scene breaks: "* * *", "***", "#", "~~~", "---", "o0o" on their own line
+SCENE_BREAK_RE = re.compile(r"^[ \t]*(?:(?:[*#~\-=•·][ \t]*){1,9}|o0o)[ \t]*$")
+
+
+def _is_subtitle(line):
+    """Short all-caps line right under a heading, e.g. "THE BOY WHO LIVED"."""
+    stripped = line.strip()
+    if GUTENBERG_START_RE.match(line) or GUTENBERG_END_RE.match(line):
+        return False
+    return 0 < len(stripped) <= 80 and stripped.isupper()
+
+
+def segment_book(text):
+    """
+    Detect the chapter structure of `text` in one pass over its lines.
+
+    Recognizes "CHAPTER N"/"BOOK II"/"Part four" headings, bare roman numeral
+    headings set off by blank lines, Project Gutenberg start/end markers (text
+    outside them is excluded) and scene breaks, which split chapters into
+    sections. Returns {"content_start", "content_end", "chapters"}; each
+    chapter has "id", "title", "start", "end" and "sections" (start/end
+    pairs). Ids are positions in the list, not the number printed in the
+    heading: chapter 0 is any text before the first heading and the headings
+    follow in order, so a book split into parts restarts its own numbering
+    but not the ids.
+    """
+    headings = []
+    scene_breaks = []
+    content_start = 0
+    content_end = len(text)
+
+    offset = 0
+    prev_blank = True
+    pending = None  # last heading, until we know whether a subtitle or prose follows it
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        blank = not stripped
+
+        if pending is not None:
+            if blank:
+                pending["blank_after"] = True
+            else:
+                heading, pending = pending, None
+                if heading["kind"] == "roman" and not heading.get("blank_after"):
+                    # A roman numeral followed directly by prose is not a heading
+                    headings.remove(heading)
+                elif _is_subtitle(line) and not CHAPTER_HEADING_RE.match(line.rstrip("\r\n")):
+                    heading["title"] = f"{heading['title']}: {stripped.title()}"
+                    offset += len(line)
+                    prev_blank = blank
+                    continue
+
+        if GUTENBERG_START_RE.match(line):
+            content_start = offset + len(line)
+            headings.clear()
+            scene_breaks.clear()
+        elif GUTENBERG_END_RE.match(line):
+            content_end = offset
+            break
+        elif CHAPTER_HEADING_RE.match(line.rstrip("\r\n")):
+            pending = {"start": offset, "title": " ".join(stripped.split()), "kind": "named"}
+            headings.append(pending)
+        elif prev_blank and ROMAN_HEADING_RE.match(line):
+            pending = {"start": offset, "title": stripped.rstrip("."), "kind": "roman"}
+            headings.append(pending)
+        elif prev_blank and SCENE_BREAK_RE.match(line):
+            scene_breaks.append((offset, offset + len(line)))
+
+        offset += len(line)
+        prev_blank = blank
+
+    if pending is not None and pending["kind"] == "roman" and not pending.get("blank_after"):
+        headings.remove(pending)
+
+    headings = [h for h in headings if content_start <= h["start"] < content_end]
+    starts = [h["start"] for h in headings]
+
+    chapters = []
+    if not starts or text[content_start:starts[0]].strip():
+        first_end = starts[0] if starts else content_end
+        chapters.append({"id": 0, "title": "Opening", "start": content_start, "end": first_end})
+    for i, heading in enumerate(headings):
+        end = starts[i + 1] if i + 1 < len(starts) else content_end
+        chapters.append({"id": i + 1, "title": heading["title"], "start": heading["start"], "end": end})
+
+    for chapter in chapters:
+        sections = []
+        section_start = chapter["start"]
+        for break_start, break_end in scene_breaks:
+            if chapter["start"] <= break_start < chapter["end"]:
+                sections.append({"start": section_start, "end": break_start})
+                section_start = break_end
+        sections.append({"start": section_start, "end": chapter["end"]})
+        chapter["sections"] = sections
+
+    return {
+        "version": SEGMENTER_VERSION,
+        "content_start": content_start,
+        "content_end": content_end,
+        "chapters": chapters,
+    }
+
+
+def chapter_starts(segments):
+    """Offsets of the real chapter headings (excluding the opening chapter 0)."""
+    return [chapter["start"] for chapter in segments["chapters"] if chapter["id"] > 0]
+
+
+def chapter_span(segments, first, last=None):
+    """Character span covering chapters `first`..`last` (inclusive), or None if out of range."""
+    last = first if last is None else last
+    selected = [c for c in segments["chapters"] if first <= c["id"] <= last]
+    if not selected:
+        return None
+    return selected[0]["start"], selected[-1]["end"]
@@ -1,18 +1,108 @@
+import hashlib
 import json
 import logging
 import os
-import requests
+import time
 from dotenv import load_dotenv
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 
+from book_store import BookStore
+from chat_context import RollingSummaries, build_chat_messages
+from chunk_checkpoints import ChunkCheckpoints, make_run_key
+from chunking import chunk_text
+from graph_cache import GraphCache, make_cache_key
+from graph_layout import has_current_layout, layout_graph
+from graph_merge import merge_extractions, merged_to_graph, merged_to_text
+from graph_schema import GRAPH_SCHEMA_VERSION, GraphSchemaError, normalize_graph
+from jobs import JobQueue
+from json_repair import JSONExtractionError, extract_json_object
+from llm_cache import create_response_cache, make_request_key
+from llm_client import LlamaClient, map_ordered
+from mentions import MentionIndex, derive_aliases
+from metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram
+from rate_limit import RateLimiter, RetryPolicy
+from retrieval import PassageIndex
+from segmenter import SEGMENTER_VERSION, chapter_span, segment_book
+from speculation import SpeculationCache
+from story_sessions import StorySessionStore
+from token_counter import PromptTooLarge, TokenCounter
+from summary_tree import build_summary_tree, cover, leaf_position
+from tracing import iterate_in_context, span, tracer, valid_trace_id
+
 # Load environment variables
 load_dotenv('../../api.env')
 
 # Flask setup
 app = Flask(__name__)
-CORS(app)
+# Let the browser read the trace id of each response
+CORS(app, expose_headers=["X-Trace-Id"])
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route and status", ["method", "route", "status"])
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to handle a request, including any streamed body", ["method", "route"]
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled")
+GRAPH_CACHE_LOOKUPS = Counter("graph_cache_lookups_total", "/inference graph cache lookups", ["result"])
+
+
+def request_route():
+    # The URL rule, not the path, so ids in the URL don't create a series each
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+
+
+@app.after_request
+def record_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@app.before_request
+def start_trace():
+    # A client can pass X-Trace-Id to group several requests under one trace
+    g.trace = tracer.start(
+        f"{request.method} {request_route()}",
+        trace_id=valid_trace_id(request.headers.get("X-Trace-Id")),
+        request_bytes=request.content_length or 0,
+    )
+
+
+@app.after_request
+def add_trace_header(response):
+    trace = g.get("trace")
+    if trace is not None:
+        response.headers["X-Trace-Id"] = trace[0].trace_id
+        trace[0].set(status=response.status_code)
+        if not response.is_streamed:
+            trace[0].set(response_bytes=response.content_length)
+    return response
+
+
+@app.teardown_request
+def end_trace(error=None):
+    trace = g.pop("trace", None)
+    if trace is not None:
+        tracer.end(*trace, error=error)
+
+
+@app.teardown_request
+def record_request_metrics(error=None):
+    # Runs after a streamed response has finished, so durations cover the whole stream
+    started = g.pop("request_started", None)
+    if started is None:
+        return
+    HTTP_IN_FLIGHT.dec()
+    status = g.pop("response_status", 500)
+    HTTP_REQUESTS.inc(method=request.method, route=request_route(), status=status)
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, route=request_route())
 
 # API Configuration
 LLAMA_API_KEY = os.getenv('LLAMA_API_KEY')
@@ -22,6 +112,146 @@ MODEL_NAME = "Llama-4-Maverick-17B-128E-Instruct-FP8"
 if not LLAMA_API_KEY:
     raise ValueError("LLAMA_API_KEY not found in environment variables")
 
+# Directory for the server's on-disk caches
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache'))
+
+# Request traces (nested spans for prompt building, LLM calls, parsing and
+# serialization) are appended to a JSONL file; each response carries X-Trace-Id
+tracer.configure(
+    os.getenv('TRACE_FILE', os.path.join(CACHE_DIR, 'traces.jsonl')),
+    enabled=os.getenv('TRACING', 'true').lower() in ('1', 'true', 'yes'),
+    max_bytes=int(os.getenv('TRACE_MAX_BYTES', str(64 * 1024 * 1024))),
+)
+
+
+class TracedJSONProvider(DefaultJSONProvider):
+    """jsonify, with response serialization recorded as a span."""
+
+    def response(self, *args, **kwargs):
+        with span("serialize_response") as current:
+            response = super().response(*args, **kwargs)
+            current.set(bytes=response.content_length)
+            return response
+
+
+app.json = TracedJSONProvider(app)
+
+# Exact-match cache of LLM completions ("memory", "sqlite" or "none")
+llm_response_cache = create_response_cache(
+    backend=os.getenv('LLM_CACHE_BACKEND', 'memory'),
+    cache_dir=CACHE_DIR,
+    ttl=float(os.getenv('LLM_CACHE_TTL', str(24 * 3600))),
+    max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', '1024')),
+)
+
+# Local token counting: a model tokenizer.json (needs `tokenizers`), else tiktoken, else a heuristic.
+# Only the tokenizer.json is exact; the others are estimates, checked against a reduced window.
+token_counter = TokenCounter(
+    backend=os.getenv('TOKENIZER_BACKEND', 'auto'),
+    tokenizer_path=os.getenv('LLAMA_TOKENIZER_PATH'),
+    encoding=os.getenv('TIKTOKEN_ENCODING', 'o200k_base'),
+)
+# Prompts are checked against this before they are sent
+LLAMA_CONTEXT_WINDOW = int(os.getenv('LLAMA_CONTEXT_WINDOW', '128000'))
+
+# Shared, pooled client used by every endpoint
+llama_client = LlamaClient(
+    api_key=LLAMA_API_KEY,
+    api_url=LLAMA_API_URL,
+    model=MODEL_NAME,
+    pool_size=int(os.getenv('LLAMA_POOL_SIZE', '16')),
+    max_concurrency=int(os.getenv('LLAMA_MAX_CONCURRENCY', '8')),
+    connect_timeout=float(os.getenv('LLAMA_CONNECT_TIMEOUT', '10')),
+    read_timeout=float(os.getenv('LLAMA_READ_TIMEOUT', '600')),
+    response_cache=llm_response_cache,
+    token_counter=token_counter,
+    context_window=LLAMA_CONTEXT_WINDOW,
+    # Share of the window held back when token counts are estimates
+    token_margin=float(os.getenv('TOKEN_COUNT_MARGIN', '0.1')),
+    # 429/5xx/timeouts are retried with jittered exponential backoff, honoring Retry-After
+    retry_policy=RetryPolicy(
+        max_retries=int(os.getenv('LLAMA_MAX_RETRIES', '4')),
+        base_delay=float(os.getenv('LLAMA_RETRY_BASE_DELAY', '1')),
+        max_delay=float(os.getenv('LLAMA_RETRY_MAX_DELAY', '60')),
+    ),
+    # Client-side quota so parallel chunk work throttles itself (0 = unlimited)
+    rate_limiter=RateLimiter(
+        requests_per_second=float(os.getenv('LLAMA_REQUESTS_PER_SECOND', '0')),
+        tokens_per_minute=int(os.getenv('LLAMA_TOKENS_PER_MINUTE', '0')),
+    ),
+)
+
+# Default number of chunks translated/transformed concurrently
+CHUNK_PARALLELISM = int(os.getenv('CHUNK_PARALLELISM', '4'))
+
+# Token budgets for chunked book processing (roughly the old 15k/12k character chunks)
+TRANSLATION_CHUNK_TOKENS = int(os.getenv('TRANSLATION_CHUNK_TOKENS', '3750'))
+TRANSFORM_CHUNK_TOKENS = int(os.getenv('TRANSFORM_CHUNK_TOKENS', '3000'))
+
+# Finished translate/transform chunks are checkpointed so a failed run resumes
+# where it stopped; bump a prompt version when its prompt changes
+TRANSLATION_PROMPT_VERSION = 1
+TRANSFORM_PROMPT_VERSION = 1
+chunk_checkpoints = ChunkCheckpoints(
+    os.path.join(CACHE_DIR, 'chunk_checkpoints.sqlite3'),
+    max_bytes=int(os.getenv('CHUNK_CHECKPOINT_MAX_BYTES', str(512 * 1024 * 1024))),
+)
+
+# Books above this size are analyzed chunk by chunk (map-reduce) instead of in one prompt
+INFERENCE_CHUNK_TOKENS = int(os.getenv('INFERENCE_CHUNK_TOKENS', '12000'))
+INFERENCE_CHUNK_OVERLAP_TOKENS = int(os.getenv('INFERENCE_CHUNK_OVERLAP_TOKENS', '300'))
+
+# Uploaded books, addressed by book_id
+book_store = BookStore(os.getenv('BOOK_STORE_DIR', os.path.join(CACHE_DIR, 'books')))
+
+# /chat sends the top-k retrieved passages instead of the whole book,
+# unless the book is small enough to send as-is
+CHAT_TOP_K_PASSAGES = int(os.getenv('CHAT_TOP_K_PASSAGES', '8'))
+CHAT_FULL_BOOK_TOKENS = int(os.getenv('CHAT_FULL_BOOK_TOKENS', '4000'))
+# /chat prompts are assembled within this budget; the latest turns stay verbatim
+# and older ones are folded into a rolling summary a block at a time
+CHAT_PROMPT_BUDGET_TOKENS = int(os.getenv('CHAT_PROMPT_BUDGET_TOKENS', '16000'))
+CHAT_RECENT_TURNS = int(os.getenv('CHAT_RECENT_TURNS', '6'))
+CHAT_SUMMARY_BLOCK_TURNS = int(os.getenv('CHAT_SUMMARY_BLOCK_TURNS', '4'))
+chat_summaries = RollingSummaries()
+
+# Story mode: continuations generated in the background for the choices just offered
+speculation_cache = SpeculationCache(
+    max_workers=int(os.getenv('SPECULATION_WORKERS', '4')),
+    ttl=float(os.getenv('SPECULATION_TTL', '300')),
+    max_sessions=int(os.getenv('SPECULATION_MAX_SESSIONS', '64')),
+)
+# Speculate for every story session even when the client doesn't ask (off by default:
+# most speculated continuations are thrown away)
+SPECULATE_SESSIONS = os.getenv('SPECULATE_SESSIONS', 'false').lower() in ('1', 'true', 'yes')
+
+# Story mode sessions: clients send a session id and their choice, the server keeps the rest
+story_sessions = StorySessionStore(
+    ttl=float(os.getenv('STORY_SESSION_TTL', str(6 * 3600))),
+    max_sessions=int(os.getenv('STORY_SESSION_MAX', '256')),
+    max_turns=int(os.getenv('STORY_SESSION_MAX_TURNS', '20')),
+    scene_window_chars=int(os.getenv('STORY_SCENE_WINDOW_CHARS', '4000')),
+)
+STORY_STYLE_SAMPLE_CHARS = 1000
+
+# Persistent cache of /inference results
+graph_cache = GraphCache(
+    os.path.join(CACHE_DIR, 'graph_cache.sqlite3'),
+    max_bytes=int(os.getenv('GRAPH_CACHE_MAX_BYTES', str(256 * 1024 * 1024))),
+)
+
+# Long-running endpoints can run as background jobs (see /jobs/<job_id>)
+job_queue = JobQueue(
+    max_workers=int(os.getenv('JOB_WORKERS', '2')),
+    ttl=float(os.getenv('JOB_TTL', str(6 * 3600))),
+    max_jobs=int(os.getenv('JOB_MAX', '256')),
+)
+
+# Node positions are computed once on the server and cached with the graph,
+# so the browser can draw it without running the force simulation first
+GRAPH_LAYOUT = os.getenv('GRAPH_LAYOUT', 'true').lower() in ('1', 'true', 'yes')
+GRAPH_LAYOUT_ITERATIONS = int(os.getenv('GRAPH_LAYOUT_ITERATIONS', '200'))
+
 CHARACTER_SYSTEM_PROMPT = """
 You are a highly detailed literary analyst AI. Your sole mission is to meticulously extract comprehensive information about characters and the *nuances* of their relationships from the provided text segment. This data will be used later to build a relationship graph.
 
@@ -105,6 +335,28 @@ I'll give you a harsh punishment if you miss any character or relationship.
 ```
 """
 
+CHUNK_EXTRACTION_SYSTEM_PROMPT = """
+You are a highly detailed literary analyst AI. You will receive ONE segment of a longer book. Extract every character mentioned in this segment and every relationship between characters that this segment shows or clearly implies.
+
+**Instructions:**
+
+1.  **Characters:** List every unique character in the segment. Use the fullest name the segment gives. Put other names, titles or nicknames used for the same character in `"aliases"`.
+2.  **Description:** One or two sentences on the character's role *in this segment*.
+3.  **Relationships:** For each pair of interacting characters, describe the relationship's roles, emotional dynamics, history and the key events *in this segment* that show it. Be specific; avoid vague words like "friend".
+4.  **Stick Strictly to the Text:** Use only this segment. Do not bring in outside knowledge about the book.
+
+**Output Format:** Return ONLY a JSON object, with no markdown or commentary:
+
+{
+  "characters": [
+    { "name": "Full Name", "aliases": ["Nickname"], "description": "Role in this segment" }
+  ],
+  "relationships": [
+    { "source": "Full Name", "target": "Other Full Name", "description": "Detailed description of the relationship in this segment" }
+  ]
+}
+"""
+
 JSON_SYSTEM_PROMPT = """
 You are an extremely precise and strict JSON extractor.
 Extract only the complete JSON object from the input. Get the last one if there are multiple.
@@ -138,6 +390,12 @@ You are an expert search AI designed to help users find detailed information abo
 Use this format to assist users in finding the relationship information they need.
 """
 
+CHAT_HISTORY_SUMMARY_PROMPT = """
+You keep a running summary of a conversation between a user and an assistant about a book. You are given the summary so far and the next messages of the conversation.
+
+Return an updated summary that keeps every question the user asked, the facts and character relationships the assistant stated, and anything the user said they want to know more about. Be concise; no preamble, just the summary.
+"""
+
 STORY_ANALYSIS_SYSTEM_PROMPT = """
 You are an expert story analyst AI. Your task is to analyze a book and extract detailed information about story events, character decision points, and story structure to enable interactive storytelling.
 
@@ -411,6 +669,231 @@ You are an expert story adaptation AI. Your task is to transform a story's setti
 Create a seamless adaptation that makes readers feel the story naturally belongs in the new setting.
 """
 
+def load_request_book(data):
+    """
+    Resolve the book a request refers to, either by `book_id` or by inline
+    `book_content` (which is registered so later requests can use its id).
+    Returns (book_id, book_content), or (None, None) if neither resolves.
+    """
+    book_id = data.get('book_id')
+    if book_id:
+        if not book_store.exists(book_id):
+            return None, None
+        return book_id, book_store.get_text(book_id)
+
+    book_content = data.get('book_content')
+    if book_content:
+        return book_store.add(book_content), book_content
+
+    return None, None
+
+
+def get_book_segments(book_id):
+    """Chapter table for a book, computed once and stored with the book."""
+    segments = book_store.load_artifact(book_id, "chapters")
+    if not segments or segments.get("version") != SEGMENTER_VERSION:
+        segments = segment_book(book_store.get_text(book_id))
+        book_store.save_artifact(book_id, "chapters", segments)
+    return segments
+
+
+def parse_chapter_range(value):
+    """Accept 3, "3", "3-5" or [3, 5]; return (first, last) or None if malformed."""
+    try:
+        if isinstance(value, (list, tuple)) and 1 <= len(value) <= 2:
+            first, last = int(value[0]), int(value[-1])
+        elif isinstance(value, str) and '-' in value:
+            first, last = (int(part) for part in value.split('-', 1))
+        else:
+            first = last = int(value)
+    except (TypeError, ValueError):
+        return None
+    return (first, last) if first <= last else None
+
+
+def select_chapter_range(book_id, book_content, data):
+    """
+    Narrow a request's book text to its optional `chapter_range`.
+    Returns (book_content, None), or (None, error_response) for a bad range.
+    """
+    if data.get('chapter_range') in (None, ''):
+        return book_content, None
+
+    chapter_range = parse_chapter_range(data['chapter_range'])
+    char_span = chapter_range and chapter_span(get_book_segments(book_id), *chapter_range)
+    if not char_span:
+        return None, (jsonify({"error": f"Invalid chapter_range: {data['chapter_range']}"}), 400)
+    return book_store.get_text(book_id)[char_span[0]:char_span[1]], None
+
+
+def missing_book_response(data):
+    if data.get('book_id'):
+        return jsonify({"error": f"Unknown book_id: {data['book_id']}"}), 404
+    return jsonify({"error": "book_id or book_content is required"}), 400
+
+
+# Changes whenever a prompt, the model or the chunking of the graph pipeline changes,
+# so cached graphs from an older pipeline are never served
+GRAPH_PIPELINE_VERSION = hashlib.sha256(
+    "\0".join([
+        MODEL_NAME,
+        CHARACTER_SYSTEM_PROMPT,
+        RELATIONSHIP_SYSTEM_PROMPT,
+        CHUNK_EXTRACTION_SYSTEM_PROMPT,
+        str(INFERENCE_CHUNK_TOKENS),
+        str(INFERENCE_CHUNK_OVERLAP_TOKENS),
+        str(GRAPH_SCHEMA_VERSION),
+    ]).encode("utf-8")
+).hexdigest()[:16]
+
+
+def parse_graph_response(relationship_response_text):
+    """
+    Parse the relationship step's output locally, repairing fences, comments,
+    trailing commas and truncation. Only if that fails is the LLM asked to
+    rewrite its output as clean JSON.
+    """
+    if not relationship_response_text:
+        return None
+    try:
+        with span("json.parse", source="graph", bytes=len(relationship_response_text)):
+            return extract_json_object(relationship_response_text)
+    except JSONExtractionError as e:
+        logging.error(f"Error parsing graph response: {e}")
+
+    # Last resort: an extra LLM round trip to clean up the JSON
+    json_response = llm_json_output(relationship_response_text)
+    print("json_response: ", json_response)
+    try:
+        with span("json.parse", source="graph_repair", bytes=len(json_response or "")):
+            return extract_json_object(json_response)
+    except JSONExtractionError as e:
+        logging.error(f"Error parsing graph response from json result: {e}")
+        return None
+
+
+def build_graph_single_pass(file_content, job=None):
+    """Run the character and relationship steps over the whole book at once."""
+    # Step 1: Character extraction
+    if job is not None:
+        job.set_stage("extracting characters")
+    messages = [
+        {"role": "system", "content": CHARACTER_SYSTEM_PROMPT},
+        {"role": "user", "content": file_content},
+    ]
+    character_outputs = call_llama_api(messages)
+    character_response_text = character_outputs
+    print("character_response_text: ", character_response_text)
+
+    # Step 2: Relationship extraction
+    if job is not None:
+        job.check_cancelled()
+        job.set_stage("extracting relationships")
+    messages = [
+        {"role": "system", "content": RELATIONSHIP_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Book content:\n{file_content}"},
+        {"role": "assistant", "content": character_response_text},
+        {
+            "role": "user",
+            "content": "Generate the JSON graph with title, summary, nodes, and links.",
+        },
+    ]
+    relationship_outputs = call_llama_api(messages)
+    relationship_response_text = relationship_outputs
+    print("relationship_response_text: ", relationship_response_text)
+
+    return parse_graph_response(relationship_response_text), character_response_text
+
+
+def extract_chunk_characters(chunk):
+    """Map step: extract characters and relationships from one chunk of the book."""
+    messages = [
+        {"role": "system", "content": CHUNK_EXTRACTION_SYSTEM_PROMPT},
+        {"role": "user", "content": chunk},
+    ]
+    response_text = call_llama_api(messages, max_tokens=1500, temperature=0.3)
+    if not response_text:
+        raise RuntimeError("Empty response from Llama API")
+
+    with span("json.parse", source="chunk", bytes=len(response_text)):
+        return extract_json_object(response_text)
+
+
+def build_graph_map_reduce(chunk_info, parallelism, job=None):
+    """
+    Extract characters chunk by chunk in parallel, merge the partial results
+    locally, and only send the merged analysis (not the book) to the LLM to
+    produce the final titled graph. With a `job`, each chunk's extraction is
+    reported to it as a partial result.
+    """
+    def extract(chunk):
+        if job is None:
+            return extract_chunk_characters(chunk['text'])
+        job.check_cancelled()
+        try:
+            partial = extract_chunk_characters(chunk['text'])
+        except Exception as e:
+            job.chunk_done(chunk['index'], error=e)
+            raise
+        job.chunk_done(chunk['index'], partial)
+        return partial
+
+    if job is not None:
+        job.set_stage("extracting characters", total=len(chunk_info))
+    outcomes = map_ordered(extract, chunk_info, parallelism)
+    if job is not None:
+        job.check_cancelled()
+
+    partials = []
+    for chunk, (partial, error) in zip(chunk_info, outcomes):
+        if error is not None:
+            print(f"Character extraction failed for chunk {chunk['index']+1}: {error}")
+            continue
+        partials.append(partial)
+
+    if not partials:
+        raise RuntimeError("Character extraction failed for every chunk")
+
+    with span("graph.merge", partials=len(partials)) as current:
+        merged = merge_extractions(partials)
+        character_response_text = merged_to_text(merged)
+        current.set(characters=len(merged['characters']), relationships=len(merged['relationships']))
+    print(f"Merged {len(partials)}/{len(chunk_info)} chunks into "
+          f"{len(merged['characters'])} characters and {len(merged['relationships'])} relationships")
+
+    # Reduce step: synthesize labels, title and summary from the merged analysis only
+    if job is not None:
+        job.set_stage("building graph")
+    messages = [
+        {"role": "system", "content": RELATIONSHIP_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": f"Character & Relationship Data (compiled from the whole book):\n{character_response_text}\n\n"
+                       f"Opening of the book (for the title and summary):\n{chunk_info[0]['text'][:2000]}",
+        },
+        {
+            "role": "user",
+            "content": "Generate the JSON graph with title, summary, nodes, and links.",
+        },
+    ]
+    try:
+        relationship_response_text = call_llama_api(
+            messages, max_tokens=min(16000, 1000 + 60 * (len(merged['characters']) + len(merged['relationships'])))
+        )
+        print("relationship_response_text: ", relationship_response_text)
+    except PromptTooLarge as e:
+        # The merged analysis of a very long book can outgrow the context window
+        print(f"Skipping the reduce call: {e}")
+        relationship_response_text = None
+
+    graph_data = parse_graph_response(relationship_response_text)
+    if not isinstance(graph_data, dict) or not isinstance(graph_data.get('nodes'), list) or not graph_data['nodes']:
+        # Fall back to the deterministic merge so a failed reduce call doesn't lose the analysis
+        graph_data = merged_to_graph(merged)
+
+    return graph_data, character_response_text
+
+
 @app.route("/inference", methods=["POST"])
 def inference():
     """
@@ -418,118 +901,335 @@ def inference():
     """
 
     try:
-        if "file" not in request.files:
+        if "file" in request.files:
+            file = request.files["file"]
+            if file.filename == "":
+                return jsonify({"error": "No file selected"}), 400
+
+            # Read file content directly from the uploaded file and register it
+            file_content = file.read().decode("utf-8")
+            book_id = book_store.add(file_content, filename=file.filename)
+        elif request.form.get("book_id"):
+            book_id, file_content = load_request_book(request.form)
+            if file_content is None:
+                return missing_book_response(request.form)
+        else:
             return jsonify({"error": "No file part in the request"}), 400
 
-        file = request.files["file"]
-        if file.filename == "":
-            return jsonify({"error": "No file selected"}), 400
+        refresh = request.form.get("refresh", "").lower() in ("1", "true", "yes")
+        with_layout = GRAPH_LAYOUT and request.form.get("layout", "").lower() not in ("0", "false", "no")
+        parallelism = get_chunk_parallelism(request.form)
 
-        # Read file content directly from the uploaded file
-        file_content = file.read().decode("utf-8")
+        def run(job=None):
+            return run_inference(book_id, file_content, refresh, with_layout, parallelism, job)
 
-        # Save the book in the current directory
-        with open(os.path.join(os.getcwd(), "book.txt"), "w") as f:
-            f.write(file_content)
+        if wants_job(request.form):
+            return submit_job("inference", run, {"book_id": book_id, "refresh": refresh})
+        body, status = run()
+        return jsonify(body), status
 
-        # Calculate the number of input tokens
-        num_input_tokens = calculate_input_tokens(file_content)
+    except Exception as e:
+        print(f"Error processing request: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        # Step 1: Character extraction
-        messages = [
-            {"role": "system", "content": CHARACTER_SYSTEM_PROMPT},
-            {"role": "user", "content": file_content},
-        ]
-        character_outputs = call_llama_api(messages)
-        character_response_text = character_outputs
-        print("character_response_text: ", character_response_text)
 
-        # Step 2: Relationship extraction
-        messages = [
-            {"role": "system", "content": RELATIONSHIP_SYSTEM_PROMPT},
-            {"role": "user", "content": f"Book content:\n{file_content}"},
-            {"role": "assistant", "content": character_response_text},
-            {
-                "role": "user",
-                "content": "Generate the JSON graph with title, summary, nodes, and links.",
-            },
-        ]
-        relationship_outputs = call_llama_api(messages)
-        relationship_response_text = relationship_outputs
-        print("relationship_response_text: ", relationship_response_text)
+def run_inference(book_id, file_content, refresh, with_layout, parallelism, job=None):
+    """Build (or fetch the cached) character graph; returns the /inference response body and status."""
+    # Calculate the number of input tokens
+    num_input_tokens = calculate_input_tokens(file_content)
+
+    cache_key = make_cache_key(file_content, GRAPH_PIPELINE_VERSION)
+    if not refresh:
+        cached = graph_cache.get(cache_key)
+        GRAPH_CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+        if cached is not None:
+            print(f"Graph cache hit for {cache_key[:12]}")
+            if with_layout and not has_current_layout(cached["graph_data"]):
+                # Graphs cached before layouts existed (or with an older layout) are laid out once here
+                with span("graph.layout", nodes=len(cached["graph_data"]["nodes"])):
+                    layout_graph(cached["graph_data"], iterations=GRAPH_LAYOUT_ITERATIONS)
+                graph_cache.put(cache_key, cached["graph_data"], cached["character_response_text"])
+            book_store.save_artifact(book_id, "graph", cached["graph_data"])
+            return {
+                "graph_data": cached["graph_data"],
+                "character_response_text": cached["character_response_text"],
+                "num_input_tokens": num_input_tokens,
+                "book_id": book_id,
+                "cache_key": cache_key,
+                "cached": True,
+            }, 200
+
+    if num_input_tokens <= INFERENCE_CHUNK_TOKENS:
+        graph_data, character_response_text = build_graph_single_pass(file_content, job)
+    else:
+        with span("chunk_text", bytes=len(file_content)) as current:
+            chunk_info = chunk_text(
+                file_content,
+                INFERENCE_CHUNK_TOKENS,
+                overlap_tokens=INFERENCE_CHUNK_OVERLAP_TOKENS,
+                token_counter=token_counter.count,
+            )
+            current.set(chunks=len(chunk_info))
+        graph_data, character_response_text = build_graph_map_reduce(chunk_info, parallelism, job)
+
+    # Enforce the nodes/links schema: merge duplicates, re-map or drop bad links
+    graph_report = None
+    try:
+        with span("graph.normalize"):
+            graph_data, graph_report = normalize_graph(graph_data)
+        print(f"Graph normalized: {graph_report}")
+    except GraphSchemaError as e:
+        print(f"Graph data failed validation: {e}")
+
+    # Only cache usable graphs so a failed run is retried next time
+    if graph_report is not None and graph_data["nodes"]:
+        if with_layout:
+            if job is not None:
+                job.set_stage("layout")
+            with span("graph.layout", nodes=len(graph_data["nodes"])):
+                layout_graph(graph_data, iterations=GRAPH_LAYOUT_ITERATIONS)
+        graph_cache.put(cache_key, graph_data, character_response_text)
+        book_store.save_artifact(book_id, "graph", graph_data)
+
+    return {
+        "graph_data": graph_data,
+        "character_response_text": character_response_text,
+        "num_input_tokens": num_input_tokens,
+        "book_id": book_id,
+        "cache_key": cache_key,
+        "cached": False,
+        "graph_report": graph_report,
+    }, 200
+
+
+@app.route("/inference/cache", methods=["GET"])
+def inference_cache_stats():
+    """
+    Reports the size of the /inference result cache
+    """
+    return jsonify(graph_cache.stats()), 200
 
-        graph_data = ""
-        try:
-            graph_data = jsonify_graph_response(relationship_response_text)
-            logging.info("Graph data generated:", json.dumps(graph_data, indent=2))
-        except json.JSONDecodeError as e:
-            logging.error(f"Error parsing graph response from : {e}")
-            try:
-                # Try to parse the response as a JSON object
-                json_response = llm_json_output(relationship_response_text)
-                print("json_response: ", json_response)
-                graph_data = jsonify_graph_response(json_response)
-                logging.info("Graph data generated:", json.dumps(graph_data, indent=2))
-            except json.JSONDecodeError as e:
-                logging.error(f"Error parsing graph response from json result: {e}")
-
-        return (
-            jsonify(
-                {
-                    "graph_data": graph_data,
-                    "character_response_text": character_response_text,
-                    "num_input_tokens": num_input_tokens,
-                }
-            ),
-            200,
-        )
+
+@app.route("/inference/cache", methods=["DELETE"])
+@app.route("/inference/cache/<cache_key>", methods=["DELETE"])
+def invalidate_inference_cache(cache_key=None):
+    """
+    Drops one cached /inference result, or all of them when no key is given
+    """
+    try:
+        removed = graph_cache.invalidate(cache_key)
+        return jsonify({"removed": removed, "status": "success"}), 200
 
     except Exception as e:
-        print(f"Error processing request: {str(e)}")
+        print(f"Error invalidating inference cache: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/llm_cache", methods=["GET"])
+def llm_cache_stats():
+    """
+    Reports hit/miss counters of the LLM response cache
+    """
+    if llm_response_cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **llm_response_cache.stats()}), 200
+
+
+@app.route("/llm_client", methods=["GET"])
+def llm_client_stats():
+    """
+    Reports retry counters and rate limiter state of the Llama API client
+    """
+    return jsonify(llama_client.stats()), 200
+
+
+def collect_component_metrics():
+    """Scrape-time metrics read from the caches, queues and the Llama client."""
+    families = []
+
+    def add(name, kind, documentation, samples):
+        families.append((name, kind, documentation, samples))
+
+    if llm_response_cache is not None:
+        cache = llm_response_cache.stats()
+        add("llm_response_cache_lookups_total", "counter", "LLM response cache lookups",
+            [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])])
+        add("llm_response_cache_hit_ratio", "gauge", "LLM response cache hit rate", [({}, cache["hit_rate"])])
+        add("llm_response_cache_entries", "gauge", "LLM response cache entries", [({}, cache["entries"])])
+
+    graph = graph_cache.stats()
+    add("graph_cache_entries", "gauge", "/inference graph cache entries", [({}, graph["entries"])])
+    add("graph_cache_bytes", "gauge", "/inference graph cache size", [({}, graph["bytes"])])
+
+    tokens = token_counter.stats()
+    add("token_count_cache_lookups_total", "counter", "Token count memo lookups",
+        [({"result": "hit"}, tokens["hits"]), ({"result": "miss"}, tokens["misses"])])
+
+    client = llama_client.stats()
+    add("llm_concurrency_limit", "gauge", "Maximum concurrent Llama API requests", [({}, client["max_concurrency"])])
+    limiter = client["rate_limiter"]
+    add("llm_rate_limit_waits_total", "counter", "Calls held back by the client-side rate limiter",
+        [({}, limiter["waits"])])
+    add("llm_rate_limit_wait_seconds_total", "counter", "Time calls spent held back by the rate limiter",
+        [({}, limiter["waited_seconds"])])
+    flights = client["single_flight"]
+    add("llm_single_flight_calls_total", "counter", "Calls that went upstream or shared an in-flight one",
+        [({"role": "leader"}, flights["calls"]), ({"role": "waiter"}, flights["coalesced"])])
+    add("llm_single_flight_waiters", "gauge", "Callers waiting on each in-flight call",
+        [({"key": key}, count) for key, count in flights["waiters"].items()])
+
+    speculation = speculation_cache.stats()
+    add("speculation_continuations_total", "counter", "Speculated story continuations by outcome",
+        [({"outcome": outcome}, speculation[outcome]) for outcome in ("started", "hits", "misses", "cancelled")])
+    add("speculation_in_flight", "gauge", "Speculated continuations still generating", [({}, speculation["in_flight"])])
+
+    add("story_sessions_active", "gauge", "Live story mode sessions", [({}, story_sessions.stats()["sessions"])])
+    add("jobs", "gauge", "Background jobs by status",
+        [({"status": status}, count) for status, count in job_queue.stats()["by_status"].items()])
+    return families
+
+
+REGISTRY.add_collector(collect_component_metrics)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Exposes request, LLM, cache and queue metrics in Prometheus text format
+    """
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+@app.route("/llm_cache", methods=["DELETE"])
+def clear_llm_cache():
+    """
+    Empties the LLM response cache
+    """
+    if llm_response_cache is not None:
+        llm_response_cache.clear()
+    return jsonify({"status": "success"}), 200
+
+
+def mentioned_character_names(query, characters):
+    """Names from `characters` (strings or graph nodes) that the query refers to."""
+    query_lower = query.lower()
+    names = []
+    for character in characters:
+        name = character.get("name", "") if isinstance(character, dict) else str(character)
+        if any(part.lower() in query_lower for part in name.split() if len(part) > 2):
+            names.append(name)
+    return names
+
+
+def retrieve_book_context(book_id, query, characters):
+    """
+    Book context for a chat turn: the whole book when it is small, otherwise
+    the BM25 top-k passages for the query and the characters it names.
+    Returns (header, blocks, passages); blocks are {"text", "score"}.
+    """
+    book_content = book_store.get_text(book_id)
+    if token_counter.count(book_content) <= CHAT_FULL_BOOK_TOKENS:
+        return "Book content:", [{"text": book_content, "score": float("inf")}], []
+
+    index = book_store.get_derived(book_id, "passage_index", PassageIndex)
+    passages = index.search(
+        query,
+        top_k=CHAT_TOP_K_PASSAGES,
+        boost_terms=mentioned_character_names(query, characters),
+    )
+    blocks = [
+        {"text": f"[Passage {p['passage'] + 1}]\n{p['text']}", "score": p["score"]} for p in passages
+    ]
+    return "Relevant passages from the book:", blocks, passages
+
+
+def summarize_chat_turns(previous_summary, turns):
+    """Fold a block of chat turns into the running conversation summary."""
+    transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+    messages = [
+        {"role": "system", "content": CHAT_HISTORY_SUMMARY_PROMPT},
+        {
+            "role": "user",
+            "content": f"Summary so far:\n{previous_summary or '(none)'}\n\nNext messages:\n{transcript}",
+        },
+    ]
+    return call_llama_api(messages, max_tokens=500, temperature=0.3)
+
+
 @app.route("/chat", methods=["POST"])
 def chat():
     """
-    Handles search requests from the frontend.
+    Handles search requests from the frontend. Streams the answer as
+    Server-Sent Events when the client asks for it.
     """
     try:
         data = request.json
         search_query = data.get("query")
         relationship_data = data.get("relationship_data")
-        chat_history_data = data.get("chat_history_data")
+        chat_history_data = data.get("chat_history_data") or []
 
-        # Read the book.txt file from the current directory
-        with open(os.path.join(os.getcwd(), "book.txt"), "r") as f:
-            file_content = f.read()
+        book_id = data.get("book_id")
+        if not book_id:
+            return jsonify({"error": "book_id is required; upload the book first"}), 400
+        if not book_store.exists(book_id):
+            return missing_book_response(data)
 
         if not search_query or not relationship_data:
             return (
                 jsonify({"error": "search_query and relationship_data are required"}),
                 400,
             )
-        messages = [
-            {"role": "system", "content": SEARCH_SYSTEM_PROMPT},
-            {"role": "assistant", "content": file_content},
-            {"role": "assistant", "content": relationship_data},
-        ]
+
+        with span("chat.retrieve_context"):
+            context_header, context_blocks, passages = retrieve_book_context(
+                book_id, search_query, data.get("characters") or []
+            )
 
         # Format chat history for the model
         formatted_history = []
         for msg in chat_history_data:
             formatted_history.append({"role": msg["sender"], "content": msg["text"]})
 
-        # Add chat history
-        messages.extend(formatted_history)
+        # Fit context, relationship data and history into the prompt budget
+        with span("chat.build_prompt") as current:
+            messages, context_report = build_chat_messages(
+                token_counter,
+                CHAT_PROMPT_BUDGET_TOKENS,
+                SEARCH_SYSTEM_PROMPT,
+                relationship_data,
+                context_blocks,
+                formatted_history,
+                search_query,
+                chat_summaries,
+                summarize_chat_turns,
+                recent_turns=CHAT_RECENT_TURNS,
+                fold_block=CHAT_SUMMARY_BLOCK_TURNS,
+                context_header=context_header,
+            )
+            current.set(prompt_tokens=context_report["prompt_tokens"])
+        kept = context_report.pop("kept_passages")
+        passages = [passages[i] for i in kept if i < len(passages)]
 
-        # Add the current user message
-        messages.append({"role": "user", "content": search_query})
+        retrieved_passages = [
+            {key: p[key] for key in ("passage", "start", "end", "score")} for p in passages
+        ]
+        if wants_stream(data):
+            return stream_llama_response(messages, {
+                "status": "success",
+                "book_id": book_id,
+                "retrieved_passages": retrieved_passages,
+                "context": context_report,
+            })
 
         search_outputs = call_llama_api(messages)
         search_response_text = search_outputs
         print("search_response_text: ", search_response_text)
-        return jsonify({"response": search_response_text}), 200
+        return jsonify({
+            "response": search_response_text,
+            "book_id": book_id,
+            "retrieved_passages": retrieved_passages,
+            "context": context_report,
+        }), 200
 
     except Exception as e:
         print(f"Error processing request: {str(e)}")
@@ -550,71 +1250,83 @@ def llm_json_output(response):
 
 
 def calculate_input_tokens(input_text):
-    # Rough approximation: 1 token ≈ 4 characters for English text
-    # This is a simple estimate since we don't have direct access to the tokenizer
-    return len(input_text) // 4
+    return token_counter.count(input_text)
 
 
-def jsonify_graph_response(content):
-    """Extract and parse JSON content from graph response."""
-    try:
-        # Find indices of first { and last }
-        start_idx = content.find("{")
-        end_idx = content.rfind("}")
+def call_llama_api(messages, max_tokens=800, temperature=0.7, cache=True, stream=False):
+    """
+    Call the Llama API with the given messages through the shared client.
+    Set cache=False for creative calls that must not reuse an earlier answer.
+    With stream=True, returns a generator of token/done/error events instead
+    of the completion text.
+    """
+    if stream:
+        return llama_client.stream(
+            messages, max_tokens=max_tokens, temperature=temperature, use_cache=cache
+        )
+    return llama_client.complete(
+        messages, max_tokens=max_tokens, temperature=temperature, use_cache=cache
+    )
 
-        if start_idx == -1 or end_idx == -1:
-            raise ValueError("No valid JSON object found in response")
 
-        # Extract JSON string
-        json_str = content[start_idx : end_idx + 1]
+def wants_stream(data):
+    """Clients opt into streaming with "stream": true or an Accept: text/event-stream header."""
+    return bool(data.get("stream")) or "text/event-stream" in request.headers.get("Accept", "")
 
-        # Parse JSON
-        return json.loads(json_str)
 
-    except Exception as e:
-        logging.error(f"Error parsing graph response: {e}")
-        return None
+def wants_job(data):
+    """Clients opt into running a long request as a background job with "async": true."""
+    return str(data.get("async", "")).lower() in ("1", "true", "yes")
+
+
+def submit_job(kind, fn, params):
+    def run(job):
+        # Continues the submitting request's trace after its response has gone out
+        with span(f"job {kind}", job_id=job.job_id):
+            return fn(job)
+
+    job = job_queue.submit(kind, run, params)
+    print(f"Queued {kind} job {job['job_id']}")
+    job["status_url"] = f"/jobs/{job['job_id']}"
+    return jsonify(job), 202
+
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-def call_llama_api(messages, max_tokens=800, temperature=0.7):
+
+def stream_llama_response(messages, metadata, max_tokens=800, temperature=0.7, cache=True, on_done=None):
     """
-    Call the Llama API with the given messages
+    Relay a streamed completion to the client as Server-Sent Events: one
+    "token" event per piece of text, then a "done" event with `metadata`,
+    the stop reason and usage metrics (or an "error" event). `on_done` is
+    called with the full text once the stream completes.
     """
-    headers = {
-        "Authorization": f"Bearer {LLAMA_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "model": MODEL_NAME,
-        "messages": messages,
-        "max_tokens": max_tokens,
-        "temperature": temperature
-    }
-    
-    try:
-        response = requests.post(LLAMA_API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        
-        response_json = response.json()
-        print(f"API Response: {json.dumps(response_json, indent=2)}")
-        
-        # Check if the response has the Llama API structure
-        if "completion_message" in response_json:
-            content = response_json["completion_message"]["content"]
-            if isinstance(content, dict) and "text" in content:
-                return content["text"]
+    def generate():
+        pieces = []
+        for event in call_llama_api(
+            messages, max_tokens=max_tokens, temperature=temperature, cache=cache, stream=True
+        ):
+            if event["event"] == "token":
+                pieces.append(event["text"])
+                yield sse_event("token", {"text": event["text"]})
+            elif event["event"] == "error":
+                yield sse_event("error", {"error": event["error"]})
             else:
-                return str(content)
-        else:
-            print(f"Unexpected API response structure: {response_json}")
-            return None
-            
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling Llama API: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            print(f"Response content: {e.response.text}")
-        return None
+                if on_done is not None:
+                    on_done("".join(pieces))
+                yield sse_event("done", {
+                    **metadata,
+                    "stop_reason": event["stop_reason"],
+                    "metrics": event["metrics"],
+                    "cached": event["cached"],
+                })
+
+    return Response(
+        stream_with_context(iterate_in_context(generate())),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/analyze_character_appearances", methods=["POST"])
@@ -624,26 +1336,40 @@ def analyze_character_appearances():
     """
     try:
         data = request.json
-        if not data or 'book_content' not in data:
-            return jsonify({"error": "book_content is required"}), 400
-
-        book_content = data['book_content']
+        if not data:
+            return jsonify({"error": "book_id or book_content is required"}), 400
+
+        book_id, book_content = load_request_book(data)
+        if book_content is None:
+            return missing_book_response(data)
+        book_content, range_error = select_chapter_range(book_id, book_content, data)
+        if range_error:
+            return range_error
         characters = data.get('characters', [])
         
         # Create character list for analysis
         character_names = [char['name'] for char in characters] if characters else []
         character_list = ", ".join(character_names)
+
+        # Chapter breaks are detected locally instead of by the model
+        chapters = [
+            {key: chapter[key] for key in ("id", "title", "start", "end")}
+            for chapter in get_book_segments(book_id)["chapters"]
+        ]
+        chapter_list = "\n".join(f"- Chapter {c['id']}: {c['title']}" for c in chapters)
         
         prompt = f"""
         Characters to analyze: {character_list}
+
+        Chapter breaks (already detected, use these instead of finding your own):
+        {chapter_list}
         
         Book content: {book_content}
         
         Analyze this book to find:
-        1. Natural chapter/section breaks
-        2. When each character first appears
-        3. The context of their first appearance
-        4. Actionable moments for each character
+        1. When each character first appears (by the chapter numbers above)
+        2. The context of their first appearance
+        3. Actionable moments for each character
         """
         
         messages = [
@@ -658,6 +1384,8 @@ def analyze_character_appearances():
             
         return jsonify({
             "appearance_analysis": appearance_analysis,
+            "chapters": chapters,
+            "book_id": book_id,
             "status": "success"
         }), 200
 
@@ -673,11 +1401,16 @@ def get_story_segment():
     """
     try:
         data = request.json
-        if not data or 'character' not in data or 'book_content' not in data:
-            return jsonify({"error": "character and book_content are required"}), 400
-
+        if not data or 'character' not in data:
+            return jsonify({"error": "character and book_id or book_content are required"}), 400
+
+        book_id, book_content = load_request_book(data)
+        if book_content is None:
+            return missing_book_response(data)
+        book_content, range_error = select_chapter_range(book_id, book_content, data)
+        if range_error:
+            return range_error
         character_name = data['character']
-        book_content = data['book_content']
         appearance_info = data.get('appearance_info', '')
         
         # Simple, direct prompt that asks for ONLY story text
@@ -732,16 +1465,23 @@ def get_story_segment():
         if (not clean_story or len(clean_story) < 50 or 
             any(word in clean_story for word in ['Step', 'Analysis', 'EXTRACT', 'Instructions'])):
             
-            # Extract actual text segments from the book content directly
-            book_paragraphs = book_content.split('\n\n')
-            character_found = False
+            # Extract actual text segments from the book content directly,
+            # starting at the character's first mention
+            index = get_mention_index(book_id)
+            if index is None or index.resolve(character_name) is None:
+                index = get_mention_index(book_id, [{"id": character_name, "name": character_name}])
+            first = index.first_appearance(character_name)
+
             story_start = []
-            
+            if first is not None:
+                paragraph_start = index.paragraph_starts[first["paragraph"]]
+                # Offsets are into the whole book, even when a chapter range was requested
+                book_paragraphs = book_store.get_text(book_id)[paragraph_start:].split('\n\n')
+            else:
+                book_paragraphs = []
+
             for para in book_paragraphs:
-                if character_name in para:
-                    character_found = True
-                
-                if character_found and len(para) > 50:
+                if len(para) > 50:
                     # This looks like actual story content
                     if not any(meta_word in para for meta_word in ['Chapter', 'Page ', 'Analysis', 'Character:']):
                         story_start.append(para)
@@ -761,6 +1501,7 @@ As {character_name}, you find yourself in this world where extraordinary events
         return jsonify({
             "story_segment": clean_story,
             "character": character_name,
+            "book_id": book_id,
             "status": "success"
         }), 200
 
@@ -769,15 +1510,60 @@ As {character_name}, you find yourself in this world where extraordinary events
         return jsonify({"error": str(e)}), 500
 
 
+def story_style_sample(book_id):
+    """The opening of the book's actual text, used as the author's style reference."""
+    content_start = get_book_segments(book_id)["content_start"]
+    return book_store.get_text(book_id)[content_start:content_start + STORY_STYLE_SAMPLE_CHARS].strip()
+
+
+def latest_lines(text, count=3):
+    return "\n".join([line for line in text.split("\n") if line.strip()][-count:])
+
+
+def unknown_story_session(data):
+    """True when a request relies on a session that doesn't exist (or has expired)."""
+    return bool(data.get('session_id')) and 'scene_context' not in data
+
+
+def with_story_session(data, scene_context):
+    """
+    Fill a story mode request from its session, if it names one: character,
+    language/setting config and `scene_context` come from the server, and any
+    field the client sends explicitly still wins. Returns (data, session).
+    """
+    session = story_sessions.get(data.get('session_id')) if data.get('session_id') else None
+    if session is None:
+        return data, None
+    defaults = {
+        'character': session['character'],
+        **session['config'],
+        'scene_context': scene_context(session),
+    }
+    return {**defaults, **{key: value for key, value in data.items() if value not in (None, '')}}, session
+
+
 @app.route("/generate_contextual_choices", methods=["POST"])
 def generate_contextual_choices():
     """
-    Generates specific, contextual choices for a character in their exact situation
+    Generates specific, contextual choices for a character in their exact situation.
+    With a "speculate" block (or "speculate": true for a session), continuations
+    for every choice start generating in the background so
+    /continue_story_enhanced can answer immediately.
     """
     try:
-        data = request.json
-        if not data or 'character' not in data or 'scene_context' not in data:
-            return jsonify({"error": "character and scene_context are required"}), 400
+        data, session = with_story_session(
+            request.json or {}, lambda session: latest_lines(session['current_scene'])
+        )
+        if session is None and unknown_story_session(data):
+            return jsonify({"error": f"Unknown or expired session_id: {data['session_id']}"}), 404
+        if 'character' not in data or 'scene_context' not in data:
+            return jsonify({"error": "session_id, or character and scene_context, are required"}), 400
+        if session is not None and (data.get('speculate') is True or ('speculate' not in data and SPECULATE_SESSIONS)):
+            # Speculate with the same scene the continuation will see
+            data['speculate'] = {
+                'session_id': session['session_id'],
+                'scene_context': story_sessions.scene_window(session),
+            }
 
         character = data['character']
         scene_context = data['scene_context']
@@ -849,31 +1635,15 @@ def generate_contextual_choices():
             {"role": "user", "content": prompt},
         ]
         
-        choices_response = call_llama_api(messages, max_tokens=1000)
+        choices_response = call_llama_api(messages, max_tokens=1000, cache=False)
         
         if not choices_response:
             return jsonify({"error": "Failed to generate contextual choices"}), 500
         
         # Parse the JSON response from the AI
         try:
-            # Clean up the response
-            json_match = choices_response.strip()
-            
-            # Remove markdown code blocks if present
-            if json_match.startswith('```json'):
-                json_match = json_match.replace('```json', '').replace('```', '').strip()
-            elif json_match.startswith('```'):
-                json_match = json_match.replace('```', '').strip()
-            
-            # Find JSON object in the response
-            start_idx = json_match.find('{')
-            end_idx = json_match.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx > start_idx:
-                json_match = json_match[start_idx:end_idx]
-            
-            print(f"Attempting to parse JSON: {json_match}")
-            parsed_response = json.loads(json_match)
+            with span("json.parse", source="choices", bytes=len(choices_response)):
+                parsed_response = extract_json_object(choices_response)
             
             # Format the choices for the frontend
             formatted_choices = []
@@ -890,10 +1660,11 @@ def generate_contextual_choices():
             return jsonify({
                 "choices": formatted_choices,
                 "raw_response": choices_response,
+                "speculation": speculate_continuations(data, formatted_choices),
                 "status": "success"
             }), 200
             
-        except (json.JSONDecodeError, ValueError) as e:
+        except JSONExtractionError as e:
             print(f"Failed to parse AI response as JSON: {e}")
             print(f"Raw response was: {choices_response}")
             
@@ -927,6 +1698,7 @@ def generate_contextual_choices():
             return jsonify({
                 "choices": fallback_choices,
                 "raw_response": choices_response,
+                "speculation": speculate_continuations(data, fallback_choices),
                 "status": "fallback_used"
             }), 200
 
@@ -935,36 +1707,31 @@ def generate_contextual_choices():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/continue_story_enhanced", methods=["POST"])
-def continue_story_enhanced():
-    """
-    Continues the story based on user's choice with enhanced context awareness
-    """
-    try:
-        data = request.json
-        if not data or 'user_choice' not in data or 'scene_context' not in data:
-            return jsonify({"error": "user_choice and scene_context are required"}), 400
+CONTINUATION_MAX_TOKENS = 1500
 
-        user_choice = data['user_choice']
-        scene_context = data['scene_context']
-        character = data.get('character', '')
-        original_style = data.get('original_style', '')
-        other_characters = data.get('other_characters', '')
-        
-        # Enhanced mode features
-        target_language = data.get('target_language', 'English')
-        setting_context = data.get('setting_context', '')
-        
-        # Build enhanced prompt with language and setting context
-        language_instruction = ""
-        if target_language != 'English':
-            language_instruction = f"\n**CRITICAL: Write the entire response in {target_language}. All dialogue, narration, and descriptions must be in {target_language}.**"
-        
-        setting_instruction = ""
-        if setting_context:
-            setting_instruction = f"\n**Setting Context: {setting_context}** - Maintain this setting's tone, technology level, social norms, and dialogue patterns throughout the continuation."
-        
-        prompt = f"""
+
+def build_continuation_messages(data):
+    """Prompt for continuing the story from the player's choice."""
+    user_choice = data['user_choice']
+    scene_context = data['scene_context']
+    character = data.get('character', '')
+    original_style = data.get('original_style', '')
+    other_characters = data.get('other_characters', '')
+    
+    # Enhanced mode features
+    target_language = data.get('target_language', 'English')
+    setting_context = data.get('setting_context', '')
+    
+    # Build enhanced prompt with language and setting context
+    language_instruction = ""
+    if target_language != 'English':
+        language_instruction = f"\n**CRITICAL: Write the entire response in {target_language}. All dialogue, narration, and descriptions must be in {target_language}.**"
+    
+    setting_instruction = ""
+    if setting_context:
+        setting_instruction = f"\n**Setting Context: {setting_context}** - Maintain this setting's tone, technology level, social norms, and dialogue patterns throughout the continuation."
+    
+    prompt = f"""
         Character: {character}
         User's Specific Choice: {user_choice}
         Current Scene Context: {scene_context}
@@ -980,16 +1747,123 @@ def continue_story_enhanced():
         
         Maintain the original author's writing style and character voices while preserving any language or setting adaptations.
         """
+    
+    return [
+        {"role": "system", "content": STORY_CONTINUATION_ENHANCED_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def continuation_fingerprint(messages):
+    return make_request_key(MODEL_NAME, messages, CONTINUATION_MAX_TOKENS, 0.7)
+
+
+def generate_continuation(messages, cancelled):
+    """Stream a continuation to completion, giving up as soon as `cancelled` is set."""
+    pieces = []
+    events = call_llama_api(messages, max_tokens=CONTINUATION_MAX_TOKENS, cache=False, stream=True)
+    try:
+        for event in events:
+            if cancelled.is_set():
+                return None
+            if event["event"] == "token":
+                pieces.append(event["text"])
+            elif event["event"] == "error":
+                return None
+    finally:
+        events.close()
+    return "".join(pieces)
+
+
+def speculate_continuations(data, choices):
+    """
+    Start generating a continuation for every offered choice in the
+    background. `data["speculate"]` carries the session id and the fields the
+    client will send to /continue_story_enhanced; anything it leaves out is
+    taken from the choices request.
+    """
+    speculate = data.get('speculate')
+    if not isinstance(speculate, dict) or not speculate.get('session_id') or not choices:
+        return None
+
+    base = {**data, **speculate}
+    jobs = []
+    for choice in choices:
+        messages = build_continuation_messages({**base, 'user_choice': choice['text']})
+        jobs.append((
+            choice['text'],
+            continuation_fingerprint(messages),
+            lambda cancelled, messages=messages: generate_continuation(messages, cancelled),
+        ))
+    speculation_cache.start(speculate['session_id'], base['scene_context'], jobs)
+    print(f"Speculating {len(jobs)} continuations for session {speculate['session_id']}")
+    return {"session_id": speculate['session_id'], "choices": len(jobs)}
+
+
+@app.route("/continue_story_enhanced", methods=["POST"])
+def continue_story_enhanced():
+    """
+    Continues the story based on user's choice with enhanced context awareness.
+    Streams the continuation as Server-Sent Events when the client asks for it.
+    """
+    try:
+        data, session = with_story_session(request.json or {}, story_sessions.scene_window)
+        if session is None and unknown_story_session(data):
+            return jsonify({"error": f"Unknown or expired session_id: {data['session_id']}"}), 404
+        if 'user_choice' not in data or 'scene_context' not in data:
+            return jsonify({"error": "user_choice and session_id or scene_context are required"}), 400
+
+        with span("story.build_prompt"):
+            messages = build_continuation_messages(data)
+
+        def record_turn(text):
+            if session is not None and text:
+                story_sessions.record_turn(session['session_id'], data['user_choice'], text)
+
+        # A continuation speculated when the choices were offered is served as-is
+        continuation = None
+        if data.get('session_id'):
+            continuation = speculation_cache.claim(
+                data['session_id'],
+                data['scene_context'],
+                data['user_choice'],
+                continuation_fingerprint(messages),
+            )
+        if continuation:
+            record_turn(continuation)
+            if wants_stream(data):
+                return Response(
+                    sse_event("token", {"text": continuation})
+                    + sse_event("done", {
+                        "status": "success",
+                        "stop_reason": "stop",
+                        "metrics": {},
+                        "cached": False,
+                        "speculative": True,
+                    }),
+                    mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                )
+            return jsonify({
+                "continuation": continuation,
+                "speculative": True,
+                "status": "success"
+            }), 200
         
-        messages = [
-            {"role": "system", "content": STORY_CONTINUATION_ENHANCED_PROMPT},
-            {"role": "user", "content": prompt},
-        ]
-        
-        continuation = call_llama_api(messages, max_tokens=1500)
+        if wants_stream(data):
+            return stream_llama_response(
+                messages,
+                {"status": "success"},
+                max_tokens=CONTINUATION_MAX_TOKENS,
+                cache=False,
+                on_done=record_turn,
+            )
+
+        continuation = call_llama_api(messages, max_tokens=CONTINUATION_MAX_TOKENS, cache=False)
         
         if not continuation:
             return jsonify({"error": "Failed to continue story"}), 500
+        record_turn(continuation)
             
         return jsonify({
             "continuation": continuation,
@@ -1001,6 +1875,89 @@ def continue_story_enhanced():
         return jsonify({"error": str(e)}), 500
 
 
+def summarize_chapter(chapter):
+    prompt = f"""
+        Chapter: {chapter['title']}
+
+        Chapter text:
+        {chapter['text']}
+
+        Summarize this chapter.
+        """
+
+    messages = [
+        {"role": "system", "content": CHAPTER_SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+    return call_llama_api(messages, max_tokens=600, temperature=0.3)
+
+
+def summarize_span(left, right):
+    prompt = f"""
+        Summary of chapters {left['first']}-{left['last']}:
+        {left['summary']}
+
+        Summary of chapters {right['first']}-{right['last']}:
+        {right['summary']}
+
+        Combine these into one summary of chapters {left['first']}-{right['last']}, keeping the events, introductions and relationships that matter later in the story.
+        """
+
+    messages = [
+        {"role": "system", "content": CHAPTER_SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+    return call_llama_api(messages, max_tokens=800, temperature=0.3)
+
+
+# Changes whenever the summary prompts, model or chapter detection change
+SUMMARY_TREE_VERSION = hashlib.sha256(
+    "\0".join([MODEL_NAME, CHAPTER_SUMMARY_SYSTEM_PROMPT, str(SEGMENTER_VERSION)]).encode("utf-8")
+).hexdigest()[:16]
+
+
+def get_summary_tree(book_id):
+    """
+    Per-chapter summary tree for a book. Built once (chapters summarized in
+    parallel), persisted with the book and kept in memory afterwards.
+    """
+    def build(text):
+        tree = book_store.load_artifact(book_id, "summary_tree")
+        if tree and tree.get("version") == SUMMARY_TREE_VERSION:
+            return tree
+
+        chapters = [
+            {"id": c["id"], "title": c["title"], "text": text[c["start"]:c["end"]]}
+            for c in get_book_segments(book_id)["chapters"]
+            if text[c["start"]:c["end"]].strip()
+        ]
+        print(f"Building summary tree over {len(chapters)} chapters")
+        tree = build_summary_tree(chapters, summarize_chapter, summarize_span, CHUNK_PARALLELISM)
+        tree["version"] = SUMMARY_TREE_VERSION
+        book_store.save_artifact(book_id, "summary_tree", tree)
+        return tree
+
+    return book_store.get_derived(book_id, "summary_tree", build)
+
+
+def find_first_appearance_chapter(book_id, character, skip_to_chapter):
+    """Chapter id to summarize up to: an explicit chapter, else the character's first mention."""
+    try:
+        return int(skip_to_chapter)
+    except (TypeError, ValueError):
+        pass
+
+    if not character:
+        return None
+    index = get_mention_index(book_id)
+    if index is None or index.resolve(character) is None:
+        index = get_mention_index(book_id, [{"id": character, "name": character}])
+    first = index.first_appearance(character)
+    return first["chapter"] if first else None
+
+
 @app.route("/get_chapter_summary", methods=["POST"])
 def get_chapter_summary():
     """
@@ -1008,36 +1965,67 @@ def get_chapter_summary():
     """
     try:
         data = request.json
-        if not data or 'book_content' not in data:
-            return jsonify({"error": "book_content is required"}), 400
+        if not data:
+            return jsonify({"error": "book_id or book_content is required"}), 400
 
-        book_content = data['book_content']
+        book_id, book_content = load_request_book(data)
+        if book_content is None:
+            return missing_book_response(data)
         character = data.get('character', '')
         skip_to_chapter = data.get('skip_to_chapter', '')
-        
-        prompt = f"""
+
+        tree = get_summary_tree(book_id)
+
+        if data.get('chapter_range') not in (None, ''):
+            chapter_range = parse_chapter_range(data['chapter_range'])
+            if not chapter_range:
+                return jsonify({"error": f"Invalid chapter_range: {data['chapter_range']}"}), 400
+            lo = leaf_position(tree, chapter_range[0])
+            hi = leaf_position(tree, chapter_range[1] + 1) - 1
+        else:
+            cutoff = find_first_appearance_chapter(book_id, character, skip_to_chapter)
+            if cutoff is None:
+                # Character not found in the text: let the model pick from the chapter summaries
+                chapter_summaries = "\n\n".join(
+                    f"{leaf['title']}:\n{leaf['summary']}" for leaf in tree["levels"][0]
+                )
+                prompt = f"""
         Character who will be played: {character}
         Skip to: {skip_to_chapter}
         
-        Book content: {book_content}
+        Chapter summaries: {chapter_summaries}
         
         Provide a summary of the key events that happened before {character} appears, 
         focusing on information that will be relevant for understanding their situation.
         """
-        
-        messages = [
-            {"role": "system", "content": CHAPTER_SUMMARY_SYSTEM_PROMPT},
-            {"role": "user", "content": prompt},
-        ]
-        
-        summary = call_llama_api(messages, max_tokens=1000)
-        
-        if not summary:
-            return jsonify({"error": "Failed to generate chapter summary"}), 500
-            
+                messages = [
+                    {"role": "system", "content": CHAPTER_SUMMARY_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt},
+                ]
+                summary = call_llama_api(messages, max_tokens=1000)
+                if not summary:
+                    return jsonify({"error": "Failed to generate chapter summary"}), 500
+                return jsonify({
+                    "summary": summary,
+                    "character": character,
+                    "book_id": book_id,
+                    "status": "success"
+                }), 200
+
+            lo, hi = 0, leaf_position(tree, cutoff) - 1
+
+        # Compose the story so far from the fewest cached tree nodes
+        nodes = cover(tree, lo, hi)
+        if nodes:
+            summary = "\n\n".join(node["summary"] for node in nodes)
+        else:
+            summary = f"{character or 'This character'} appears at the very beginning of the story."
+
         return jsonify({
             "summary": summary,
             "character": character,
+            "book_id": book_id,
+            "chapters_covered": [nodes[0]["first"], nodes[-1]["last"]] if nodes else [],
             "status": "success"
         }), 200
 
@@ -1046,63 +2034,217 @@ def get_chapter_summary():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/translate_book", methods=["POST"])
-def translate_book():
+def chunk_metadata(chunk_info):
+    """Chunk descriptions for API responses, without the chunk text itself."""
+    return [{key: value for key, value in chunk.items() if key != 'text'} for chunk in chunk_info]
+
+
+def get_chunk_parallelism(data):
+    """Read the requested parallelism, capped at the client's concurrency limit."""
+    try:
+        parallelism = int(data.get('parallelism', CHUNK_PARALLELISM))
+    except (TypeError, ValueError):
+        parallelism = CHUNK_PARALLELISM
+    return max(1, min(parallelism, llama_client.max_concurrency))
+
+
+def process_chunks(chunks, process_chunk, parallelism, label, job=None, checkpoint=None):
     """
-    Translates the entire book into the specified language
+    Run `process_chunk(index, chunk)` over every chunk concurrently and
+    reassemble the outputs in order. Chunks that fail are replaced by a
+    placeholder (never their untouched source text) and reported in the
+    returned failure list. With a `job`, each finished chunk is reported to
+    it and cancellation is checked before every chunk starts. With a `checkpoint` run key, chunks finished by an
+    earlier run are reused and new ones are saved as soon as they complete.
+
+    Returns (processed_chunks, failed_chunks, resumed_count).
     """
-    try:
-        data = request.json
-        if not data or 'book_content' not in data or 'target_language' not in data:
-            return jsonify({"error": "book_content and target_language are required"}), 400
+    finished = chunk_checkpoints.load(checkpoint, chunks) if checkpoint else {}
+    if finished:
+        print(f"{label}: resuming with {len(finished)}/{len(chunks)} chunks already done")
+
+    def run(item):
+        i, chunk = item
+        if i in finished:
+            if job is not None:
+                job.chunk_done(i, finished[i])
+            return finished[i]
+        if job is not None:
+            job.check_cancelled()
+        print(f"{label} chunk {i+1}/{len(chunks)}")
+        try:
+            with span("chunk", task=label.lower(), index=i + 1, bytes=len(chunk)) as current:
+                result = process_chunk(i, chunk)
+                if not result:
+                    raise RuntimeError("Empty response from Llama API")
+                current.set(output_bytes=len(result))
+        except Exception as e:
+            if job is not None:
+                job.chunk_done(i, error=e)
+            raise
+        if checkpoint:
+            chunk_checkpoints.save(checkpoint, i, chunk, result)
+        if job is not None:
+            job.chunk_done(i, result)
+        return result
+
+    if job is not None:
+        job.set_stage(label.lower(), total=len(chunks))
+    outcomes = map_ordered(run, list(enumerate(chunks)), parallelism)
+    if job is not None:
+        job.check_cancelled()
+
+    processed_chunks = []
+    failed_chunks = []
+    for i, (result, error) in enumerate(outcomes):
+        if error is not None:
+            print(f"{label} chunk {i+1} failed: {error}")
+            failed_chunks.append({"chunk": i + 1, "error": str(error)})
+            processed_chunks.append(f"[{label} chunk {i + 1} failed; send the request again to resume]")
+        else:
+            processed_chunks.append(result)
 
-        book_content = data['book_content']
-        target_language = data['target_language']
+    return processed_chunks, failed_chunks, len(finished)
+
+
+def chunk_run_key(task, book_content, params, prompt_version, chunk_tokens, restart=False):
+    """Checkpoint run key for a chunked task; `restart` discards what earlier runs saved."""
+    run_key = make_run_key(task, book_content, params, prompt_version, chunk_tokens)
+    if restart:
+        removed = chunk_checkpoints.clear(run_key)
+        print(f"Discarded {removed} checkpointed chunks for {task} run {run_key[:12]}")
+    return run_key
+
+
+def wants_restart(data):
+    return str(data.get('restart', '')).lower() in ('1', 'true', 'yes')
+
+
+def translate_chunk(chunk, target_language):
+    prompt = f"""
+        Target Language: {target_language}
         
-        # Split book into chunks for translation (to handle token limits)
-        chunk_size = 15000  # Adjust based on token limits
-        chunks = [book_content[i:i+chunk_size] for i in range(0, len(book_content), chunk_size)]
+        Text to translate:
+        {chunk}
         
-        translated_chunks = []
+        Translate this text into {target_language} while preserving the literary quality, character voices, and narrative style. Maintain the same emotional weight and make dialogue sound natural in the target language.
+        """
+
+    messages = [
+        {"role": "system", "content": TRANSLATION_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+    return call_llama_api(messages, max_tokens=20000, temperature=0.3)
+
+
+def transform_chunk(chunk, setting_description, time_period, location, custom_setting):
+    prompt = f"""
+        Setting Transformation: {setting_description}
+        Time Period: {time_period if time_period else 'Not specified'}
+        Location: {location if location else 'Not specified'}
+        Custom Setting: {custom_setting if custom_setting else 'Not specified'}
         
-        for i, chunk in enumerate(chunks):
-            print(f"Translating chunk {i+1}/{len(chunks)} into {target_language}")
-            
-            prompt = f"""
-            Target Language: {target_language}
-            
-            Text to translate:
-            {chunk}
-            
-            Translate this text into {target_language} while preserving the literary quality, character voices, and narrative style. Maintain the same emotional weight and make dialogue sound natural in the target language.
-            """
-            
-            messages = [
-                {"role": "system", "content": TRANSLATION_SYSTEM_PROMPT},
-                {"role": "user", "content": prompt}
-            ]
-            
-            translated_chunk = call_llama_api(messages, max_tokens=20000, temperature=0.3)
-            
-            if not translated_chunk:
-                return jsonify({"error": f"Failed to translate chunk {i+1}"}), 500
-                
-            translated_chunks.append(translated_chunk)
+        Original text to transform:
+        {chunk}
         
-        # Combine translated chunks
-        translated_book = '\n\n'.join(translated_chunks)
+        Transform this text to the new setting while preserving:
+        - Core plot structure and events
+        - Character personalities and relationships
+        - Emotional beats and themes
+        - Narrative pacing
         
-        return jsonify({
-            "translated_content": translated_book,
-            "target_language": target_language,
-            "status": "success"
-        }), 200
+        Adapt technology, dialogue, cultural references, and social norms to fit the new setting naturally.
+        """
+
+    messages = [
+        {"role": "system", "content": SETTING_TRANSFORMATION_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+    return call_llama_api(messages, max_tokens=20000, temperature=0.4)
+
+
+@app.route("/translate_book", methods=["POST"])
+def translate_book():
+    """
+    Translates the entire book into the specified language
+    """
+    try:
+        data = request.json
+        if not data or 'target_language' not in data:
+            return jsonify({"error": "book_id or book_content, and target_language are required"}), 400
+
+        book_id, book_content = load_request_book(data)
+        if book_content is None:
+            return missing_book_response(data)
+        book_content, range_error = select_chapter_range(book_id, book_content, data)
+        if range_error:
+            return range_error
+        target_language = data['target_language']
+        parallelism = get_chunk_parallelism(data)
+
+        run_key = chunk_run_key(
+            "translate_book", book_content, {"target_language": target_language},
+            TRANSLATION_PROMPT_VERSION, TRANSLATION_CHUNK_TOKENS, restart=wants_restart(data),
+        )
+
+        if wants_job(data):
+            return submit_job(
+                "translate_book",
+                lambda job: run_translate_book(book_id, book_content, target_language, parallelism, run_key, job),
+                {"book_id": book_id, "target_language": target_language, "run_key": run_key},
+            )
+        body, status = run_translate_book(book_id, book_content, target_language, parallelism, run_key)
+        return jsonify(body), status
 
     except Exception as e:
         print(f"Error translating book: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
+def run_translate_book(book_id, book_content, target_language, parallelism, run_key, job=None):
+    """Translate a book chunk by chunk; returns the /translate_book response body and status."""
+    # Split book into chunks on chapter/paragraph/sentence boundaries (to handle token limits)
+    with span("chunk_text", bytes=len(book_content)) as current:
+        chunk_info = chunk_text(book_content, TRANSLATION_CHUNK_TOKENS, token_counter=token_counter.count)
+        current.set(chunks=len(chunk_info))
+    chunks = [chunk['text'] for chunk in chunk_info]
+
+    print(f"Translating {len(chunks)} chunks into {target_language} ({parallelism} at a time)")
+    translated_chunks, failed_chunks, resumed = process_chunks(
+        chunks,
+        lambda i, chunk: translate_chunk(chunk, target_language),
+        parallelism,
+        "Translating",
+        job,
+        checkpoint=run_key,
+    )
+    checkpoint = {"run_key": run_key, "resumed_chunks": resumed}
+
+    if chunks and len(failed_chunks) == len(chunks):
+        return {
+            "error": "Failed to translate every chunk",
+            "failed_chunks": failed_chunks,
+            "checkpoint": checkpoint
+        }, 500
+
+    # Combine translated chunks; only a complete translation is registered as a book
+    translated_book = '\n\n'.join(translated_chunks)
+
+    return {
+        "translated_content": translated_book,
+        "translated_book_id": None if failed_chunks else book_store.add(translated_book),
+        "book_id": book_id,
+        "target_language": target_language,
+        "total_chunks": len(chunks),
+        "chunks": chunk_metadata(chunk_info),
+        "failed_chunks": failed_chunks,
+        "checkpoint": checkpoint,
+        "status": "partial_success" if failed_chunks else "success"
+    }, 200
+
+
 @app.route("/transform_setting", methods=["POST"])
 def transform_setting():
     """
@@ -1110,19 +2252,27 @@ def transform_setting():
     """
     try:
         data = request.json
-        if not data or 'book_content' not in data or 'setting_type' not in data:
-            return jsonify({"error": "book_content and setting_type are required"}), 400
-
-        book_content = data['book_content']
+        if not data or 'setting_type' not in data:
+            return jsonify({"error": "book_id or book_content, and setting_type are required"}), 400
+
+        book_id, book_content = load_request_book(data)
+        if book_content is None:
+            return missing_book_response(data)
+        book_content, range_error = select_chapter_range(book_id, book_content, data)
+        if range_error:
+            return range_error
         setting_type = data['setting_type']
         custom_setting = data.get('custom_setting', '')
         time_period = data.get('time_period', '')
         location = data.get('location', '')
+        parallelism = get_chunk_parallelism(data)
         
         # Create setting description based on type
         if setting_type == 'original':
             return jsonify({
                 "transformed_content": book_content,
+                "transformed_book_id": book_id,
+                "book_id": book_id,
                 "setting_description": "Original setting maintained",
                 "status": "success"
             }), 200
@@ -1136,61 +2286,96 @@ def transform_setting():
             setting_description = f"Custom setting: {custom_setting}"
         else:
             return jsonify({"error": "Invalid setting_type"}), 400
-        
-        # Split book into chunks for transformation
-        chunk_size = 12000  # Smaller chunks for complex transformations
-        chunks = [book_content[i:i+chunk_size] for i in range(0, len(book_content), chunk_size)]
-        
-        transformed_chunks = []
-        
-        for i, chunk in enumerate(chunks):
-            print(f"Transforming chunk {i+1}/{len(chunks)} to new setting")
-            
-            prompt = f"""
-            Setting Transformation: {setting_description}
-            Time Period: {time_period if time_period else 'Not specified'}
-            Location: {location if location else 'Not specified'}
-            Custom Setting: {custom_setting if custom_setting else 'Not specified'}
-            
-            Original text to transform:
-            {chunk}
-            
-            Transform this text to the new setting while preserving:
-            - Core plot structure and events
-            - Character personalities and relationships
-            - Emotional beats and themes
-            - Narrative pacing
-            
-            Adapt technology, dialogue, cultural references, and social norms to fit the new setting naturally.
-            """
-            
-            messages = [
-                {"role": "system", "content": SETTING_TRANSFORMATION_SYSTEM_PROMPT},
-                {"role": "user", "content": prompt}
-            ]
-            
-            transformed_chunk = call_llama_api(messages, max_tokens=20000, temperature=0.4)
-            
-            if not transformed_chunk:
-                return jsonify({"error": f"Failed to transform chunk {i+1}"}), 500
-                
-            transformed_chunks.append(transformed_chunk)
-        
-        # Combine transformed chunks
-        transformed_book = '\n\n'.join(transformed_chunks)
-        
-        return jsonify({
-            "transformed_content": transformed_book,
-            "setting_description": setting_description,
-            "setting_type": setting_type,
-            "status": "success"
-        }), 200
+
+        run_key = chunk_run_key(
+            "transform_setting", book_content,
+            {"setting_type": setting_type, "time_period": time_period,
+             "location": location, "custom_setting": custom_setting},
+            TRANSFORM_PROMPT_VERSION, TRANSFORM_CHUNK_TOKENS, restart=wants_restart(data),
+        )
+
+        def run(job=None):
+            return run_transform_setting(
+                book_id, book_content, setting_type, setting_description,
+                time_period, location, custom_setting, parallelism, run_key, job,
+            )
+
+        if wants_job(data):
+            return submit_job(
+                "transform_setting", run,
+                {"book_id": book_id, "setting_type": setting_type,
+                 "setting_description": setting_description, "run_key": run_key},
+            )
+        body, status = run()
+        return jsonify(body), status
 
     except Exception as e:
         print(f"Error transforming setting: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
+def run_transform_setting(book_id, book_content, setting_type, setting_description,
+                          time_period, location, custom_setting, parallelism, run_key, job=None):
+    """Transform a book chunk by chunk; returns the /transform_setting response body and status."""
+    # Split book into chunks for transformation (smaller budget for complex transformations)
+    with span("chunk_text", bytes=len(book_content)) as current:
+        chunk_info = chunk_text(book_content, TRANSFORM_CHUNK_TOKENS, token_counter=token_counter.count)
+        current.set(chunks=len(chunk_info))
+    chunks = [chunk['text'] for chunk in chunk_info]
+
+    print(f"Transforming {len(chunks)} chunks to new setting ({parallelism} at a time)")
+    transformed_chunks, failed_chunks, resumed = process_chunks(
+        chunks,
+        lambda i, chunk: transform_chunk(chunk, setting_description, time_period, location, custom_setting),
+        parallelism,
+        "Transforming",
+        job,
+        checkpoint=run_key,
+    )
+    checkpoint = {"run_key": run_key, "resumed_chunks": resumed}
+
+    if chunks and len(failed_chunks) == len(chunks):
+        return {
+            "error": "Failed to transform every chunk",
+            "failed_chunks": failed_chunks,
+            "checkpoint": checkpoint
+        }, 500
+
+    # Combine transformed chunks; only a complete transformation is registered as a book
+    transformed_book = '\n\n'.join(transformed_chunks)
+
+    return {
+        "transformed_content": transformed_book,
+        "transformed_book_id": None if failed_chunks else book_store.add(transformed_book),
+        "book_id": book_id,
+        "setting_description": setting_description,
+        "setting_type": setting_type,
+        "total_chunks": len(chunks),
+        "chunks": chunk_metadata(chunk_info),
+        "failed_chunks": failed_chunks,
+        "checkpoint": checkpoint,
+        "status": "partial_success" if failed_chunks else "success"
+    }, 200
+
+
+@app.route("/checkpoints", methods=["GET"])
+def chunk_checkpoint_stats():
+    """
+    Reports how many translate/transform chunks are checkpointed
+    """
+    return jsonify(chunk_checkpoints.stats()), 200
+
+
+@app.route("/checkpoints", methods=["DELETE"])
+@app.route("/checkpoints/<run_key>", methods=["DELETE"])
+def clear_chunk_checkpoints(run_key=None):
+    """
+    Drops one run's checkpointed chunks, or all of them when no key is given
+    """
+    removed = chunk_checkpoints.clear(run_key)
+    return jsonify({"removed": removed, "status": "success"}), 200
+
+
 @app.route("/upload_book", methods=["POST"])
 def upload_book():
     """
@@ -1219,8 +2404,11 @@ def upload_book():
                 title = line
                 break
 
+        book_id = book_store.add(content, filename=file.filename, title=title) if content.strip() else None
+
         return jsonify({
             "success": True,
+            "book_id": book_id,
             "content": content,
             "title": title,
             "filename": file.filename
@@ -1231,5 +2419,225 @@ def upload_book():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+def get_mention_index(book_id, nodes=None):
+    """
+    Mention index for a book over the given graph nodes, or over the nodes of
+    the graph /inference stored for it. Returns None if there are no nodes.
+    """
+    if nodes is None:
+        graph = book_store.load_artifact(book_id, "graph") or {}
+        nodes = graph.get("nodes") or []
+    nodes = [node for node in nodes if isinstance(node, dict) and node.get("name")]
+    if not nodes:
+        return None
+
+    characters = derive_aliases(nodes)
+    signature = hashlib.sha1(json.dumps(characters, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return book_store.get_derived(
+        book_id, f"mentions:{signature}", lambda text: MentionIndex(text, characters)
+    )
+
+
+@app.route("/books/<book_id>/mentions", methods=["GET", "POST"])
+def book_mentions(book_id):
+    """
+    Queries where characters are mentioned in a book. Uses the graph from
+    /inference unless "nodes" are posted. Optional: character (id or name),
+    limit, co_occurrence=true.
+    """
+    try:
+        if not book_store.exists(book_id):
+            return jsonify({"error": f"Unknown book_id: {book_id}"}), 404
+
+        params = dict(request.args)
+        if request.method == "POST":
+            params.update(request.json or {})
+
+        index = get_mention_index(book_id, params.get("nodes"))
+        if index is None:
+            return jsonify({"error": "No characters known for this book; run /inference or post nodes"}), 404
+
+        response = {
+            "book_id": book_id,
+            "frequencies": index.frequencies(),
+            "first_appearances": index.first_appearances(),
+        }
+
+        character = params.get("character")
+        if character:
+            if index.resolve(character) is None:
+                return jsonify({"error": f"Unknown character: {character}"}), 404
+            limit = params.get("limit")
+            if limit in (None, ""):
+                limit = None
+            else:
+                try:
+                    limit = int(limit)
+                except (TypeError, ValueError):
+                    limit = 0
+                if limit < 1:
+                    return jsonify({"error": "limit must be a positive integer"}), 400
+            response["character"] = character
+            response["occurrences"] = index.occurrences(character, limit)
+
+        if str(params.get("co_occurrence", "")).lower() in ("1", "true", "yes"):
+            response["co_occurrences"] = index.co_occurrences()
+
+        return jsonify(response), 200
+
+    except Exception as e:
+        print(f"Error querying mentions: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/books/<book_id>/chapters", methods=["GET"])
+def book_chapters(book_id):
+    """
+    Returns the book's chapter table: ids, titles, start/end offsets and scene sections.
+    Ids are positions in the list (0 is the text before the first heading), not the
+    chapter numbers in the headings; the heading as printed is in "title".
+    """
+    try:
+        if not book_store.exists(book_id):
+            return jsonify({"error": f"Unknown book_id: {book_id}"}), 404
+
+        return jsonify({"book_id": book_id, **get_book_segments(book_id)}), 200
+
+    except Exception as e:
+        print(f"Error segmenting book: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/books", methods=["POST"])
+def register_book():
+    """
+    Registers a book (file upload or JSON {"content", "title"}) and returns its book_id
+    """
+    try:
+        if 'file' in request.files:
+            file = request.files['file']
+            if file.filename == '':
+                return jsonify({"error": "No file selected"}), 400
+            content = file.read().decode('utf-8', errors='ignore')
+            filename = file.filename
+            title = request.form.get('title')
+        else:
+            data = request.json or {}
+            content = data.get('content', '')
+            filename = data.get('filename')
+            title = data.get('title')
+
+        if not content.strip():
+            return jsonify({"error": "Book content is empty"}), 400
+
+        book_id = book_store.add(content, filename=filename, title=title)
+        return jsonify({"book_id": book_id, **book_store.get_meta(book_id)}), 200
+
+    except Exception as e:
+        print(f"Error registering book: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/books/<book_id>", methods=["GET"])
+def get_book(book_id):
+    """
+    Returns a registered book's metadata, and its text with ?include_content=true
+    """
+    if not book_store.exists(book_id):
+        return jsonify({"error": f"Unknown book_id: {book_id}"}), 404
+
+    response = book_store.get_meta(book_id)
+    if request.args.get('include_content', '').lower() in ('1', 'true', 'yes'):
+        response['content'] = book_store.get_text(book_id)
+    return jsonify(response), 200
+
+
+@app.route("/story_sessions", methods=["POST"])
+def create_story_session():
+    """
+    Starts a story mode session for a character at the given opening scene
+    """
+    try:
+        data = request.json
+        if not data or not data.get('character') or not data.get('scene'):
+            return jsonify({"error": "character and scene are required"}), 400
+
+        book_id, book_content = load_request_book(data)
+        if book_content is None:
+            return missing_book_response(data)
+
+        config = {
+            'target_language': data.get('target_language') or 'English',
+            'setting_context': data.get('setting_context', ''),
+            'other_characters': data.get('other_characters', ''),
+            'character_background': data.get('character_background', ''),
+            'original_style': data.get('original_style') or story_style_sample(book_id),
+        }
+        session = story_sessions.create(book_id, data['character'], data['scene'], config)
+        return jsonify({
+            "session_id": session['session_id'],
+            "book_id": book_id,
+            "status": "success"
+        }), 200
+
+    except Exception as e:
+        print(f"Error creating story session: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/story_sessions/<session_id>", methods=["GET"])
+def get_story_session(session_id):
+    """
+    Returns a story session: its config, turn history and current scene
+    """
+    session = story_sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": f"Unknown or expired session_id: {session_id}"}), 404
+    return jsonify(session), 200
+
+
+@app.route("/story_sessions/<session_id>", methods=["DELETE"])
+def delete_story_session(session_id):
+    """
+    Ends a story session and drops any continuations speculated for it
+    """
+    speculation_cache.discard(session_id)
+    if not story_sessions.delete(session_id):
+        return jsonify({"error": f"Unknown or expired session_id: {session_id}"}), 404
+    return jsonify({"status": "success"}), 200
+
+
+@app.route("/jobs", methods=["GET"])
+def list_jobs():
+    """
+    Reports how many background jobs are queued, running and finished
+    """
+    return jsonify(job_queue.stats()), 200
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """
+    Returns a background job's status, chunk-level progress and, once it has
+    finished, its result. ?partial=1 adds the chunks completed so far.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown or expired job_id: {job_id}"}), 404
+    include_partial = request.args.get('partial', '').lower() in ('1', 'true', 'yes')
+    return jsonify(job.snapshot(include_partial=include_partial)), 200
+
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    """
+    Cancels a background job; a running job stops before its next chunk
+    """
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown or expired job_id: {job_id}"}), 404
+    return jsonify(job.snapshot()), 200
+
+
 if __name__ == "__main__":
     app.run(debug=False, port=5002)
@@ -0,0 +1,149 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import run_in_context
+
+
+def scene_hash(scene_context):
+    return hashlib.sha256(scene_context.encode("utf-8")).hexdigest()[:16]
+
+
+class SpeculationCache:
+    """
+    Short-lived store of story continuations generated ahead of time, one per
+    choice just offered to a player.
+
+    Speculations are keyed by session, scene hash and choice text and run on
+    a small background pool. A session holds one scene at a time: offering new
+    choices, or the player picking one, cancels the rest. Entries expire after
+    `ttl` seconds and at most `max_sessions` sessions are kept.
+    """
+
+    def __init__(self, max_workers=4, ttl=300, max_sessions=64):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculate")
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+
+    def start(self, session_id, scene_context, jobs):
+        """
+        Start speculating for a session. `jobs` is a list of
+        (choice_text, fingerprint, fn); `fn(cancelled)` produces the
+        continuation and should give up once the `cancelled` event is set.
+        `fingerprint` identifies the exact prompt, so a later request built
+        from different inputs is not served a mismatched continuation.
+        """
+        entries = {}
+        for choice_text, fingerprint, fn in jobs:
+            cancelled = threading.Event()
+            entries[choice_text] = {
+                "fingerprint": fingerprint,
+                "cancelled": cancelled,
+                "future": self._pool.submit(run_in_context(fn), cancelled),
+            }
+
+        with self._lock:
+            stale = [self._sessions.pop(session_id)] if session_id in self._sessions else []
+            self._sessions[session_id] = {
+                "scene": scene_hash(scene_context),
+                "created": time.monotonic(),
+                "entries": entries,
+            }
+            self.started += len(entries)
+            stale += self._evict_locked()
+        for speculation in stale:
+            self._cancel(speculation)
+
+    def claim(self, session_id, scene_context, choice_text, fingerprint, timeout=None):
+        """
+        Return the continuation speculated for this choice, waiting for it if
+        it is still being generated, or None if there is no usable one.
+        """
+        with self._lock:
+            stale = self._evict_locked()
+            speculation = self._sessions.get(session_id)
+            entry = None
+            if speculation is not None and speculation["scene"] == scene_hash(scene_context):
+                entry = speculation["entries"].get(choice_text)
+            if entry is None or entry["fingerprint"] != fingerprint:
+                self.misses += 1
+            else:
+                # The player has chosen; the other continuations will never be used
+                self._sessions.pop(session_id)
+                stale.append(speculation)
+        for other in stale:
+            self._cancel(other, keep=entry)
+
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return None
+        try:
+            result = entry["future"].result(timeout=timeout)
+        except Exception as e:
+            print(f"Speculative continuation failed: {e}")
+            result = None
+
+        with self._lock:
+            if result:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return result
+
+    def discard(self, session_id):
+        with self._lock:
+            speculation = self._sessions.pop(session_id, None)
+        if speculation is not None:
+            self._cancel(speculation)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "in_flight": sum(
+                    not entry["future"].done()
+                    for speculation in self._sessions.values()
+                    for entry in speculation["entries"].values()
+                ),
+                "started": self.started,
+                "hits": self.hits,
+                "misses": self.misses,
+                "cancelled": self.cancelled,
+            }
+
+    def _evict_locked(self):
+        # Caller must hold self._lock
+        now = time.monotonic()
+        evicted = []
+        for session_id in [s for s, spec in self._sessions.items() if now - spec["created"] > self.ttl]:
+            evicted.append(self._sessions.pop(session_id))
+        while len(self._sessions) > self.max_sessions:
+            evicted.append(self._sessions.popitem(last=False)[1])
+        return evicted
+
+    def _cancel(self, speculation, keep=None):
+        cancelled = 0
+        for entry in speculation["entries"].values():
+            if entry is keep:
+                continue
+            entry["cancelled"].set()
+            entry["future"].cancel()
+            if not entry["future"].done() or entry["future"].cancelled():
+                cancelled += 1
+        with self._lock:
+            self.cancelled += cancelled
+
+    def shutdown(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for speculation in sessions:
+            self._cancel(speculation)
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,109 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class StorySessionStore:
+    """
+    In-memory story mode sessions.
+
+    A session holds what every turn of a story needs (book, character,
+    language/setting config, a sample of the author's style) plus a compact
+    history of the player's choices and the story text that followed, so
+    clients only send a session id and their choice. Sessions idle for more
+    than `ttl` seconds are evicted, as are the least recently used ones
+    beyond `max_sessions`.
+    """
+
+    def __init__(self, ttl=3600, max_sessions=256, max_turns=20, scene_window_chars=4000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.scene_window_chars = scene_window_chars
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def create(self, book_id, character, scene, config):
+        """Start a session at `scene` (the opening story segment) and return it."""
+        now = time.time()
+        session = {
+            "session_id": uuid.uuid4().hex,
+            "book_id": book_id,
+            "character": character,
+            "config": dict(config),
+            "turns": [],
+            "opening_scene": scene,
+            "current_scene": scene,
+            "created_at": now,
+            "updated_at": now,
+        }
+        with self._lock:
+            self._evict_locked()
+            self._sessions[session["session_id"]] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return copy.deepcopy(session)
+
+    def get(self, session_id):
+        with self._lock:
+            self._evict_locked()
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            return copy.deepcopy(session)
+
+    def record_turn(self, session_id, choice, continuation):
+        """Append a turn; the continuation becomes the current scene."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            session["turns"].append({"choice": choice, "text": continuation})
+            del session["turns"][:-self.max_turns]
+            session["current_scene"] = continuation
+            session["updated_at"] = time.time()
+            self._sessions.move_to_end(session_id)
+            return True
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def scene_window(self, session):
+        """
+        The recent story the next prompt should see: the latest turns (choice
+        and what followed), newest last, within `scene_window_chars`.
+        """
+        parts = [session["opening_scene"]] + [
+            f"**{session['character']}'s choice:** {turn['choice']}\n\n{turn['text']}"
+            for turn in session["turns"]
+        ]
+        window = []
+        used = 0
+        for part in reversed(parts):
+            if window and used + len(part) > self.scene_window_chars:
+                break
+            window.append(part)
+            used += len(part) + 2
+        text = "\n\n".join(reversed(window))
+        if len(text) > self.scene_window_chars:
+            # Even the latest part alone is too long; keep its end, from a paragraph start
+            text = text[-self.scene_window_chars:]
+            paragraph = text.find("\n\n")
+            if paragraph != -1:
+                text = text[paragraph + 2:]
+        return text
+
+    def stats(self):
+        with self._lock:
+            self._evict_locked()
+            return {"sessions": len(self._sessions)}
+
+    def _evict_locked(self):
+        # Caller must hold self._lock
+        now = time.time()
+        for session_id in [s for s, session in self._sessions.items() if now - session["updated_at"] > self.ttl]:
+            del self._sessions[session_id]
@@ -0,0 +1,90 @@
+from llm_client import map_ordered
+
+
+def build_summary_tree(chapters, summarize_chapter, summarize_span, parallelism):
+    """
+    Build a bottom-up tree of summaries over a book's chapters.
+
+    `chapters` is a list of {"id", "title", "text"}. Leaves are one summary
+    per chapter, produced by `summarize_chapter(chapter)`; each level above
+    merges neighbouring pairs with `summarize_span(left, right)`. An odd node
+    at the end of a level is carried up unchanged. Every level is summarized
+    in parallel. Returns {"levels": [...]}, levels[0] being the leaves; each
+    node records the leaf positions (lo, hi) and chapter ids (first, last)
+    it covers.
+    """
+    outcomes = map_ordered(summarize_chapter, chapters, parallelism)
+    level = []
+    for position, (chapter, (summary, error)) in enumerate(zip(chapters, outcomes)):
+        if error is not None or not summary:
+            raise RuntimeError(f"Failed to summarize chapter {chapter['id']}: {error or 'empty response'}")
+        level.append(
+            {
+                "lo": position,
+                "hi": position,
+                "first": chapter["id"],
+                "last": chapter["id"],
+                "title": chapter["title"],
+                "summary": summary,
+            }
+        )
+
+    levels = [level]
+    while len(level) > 1:
+        pairs = [level[i:i + 2] for i in range(0, len(level), 2)]
+        outcomes = map_ordered(
+            lambda pair: summarize_span(*pair) if len(pair) == 2 else pair[0]["summary"],
+            pairs,
+            parallelism,
+        )
+        parent_level = []
+        for pair, (summary, error) in zip(pairs, outcomes):
+            if error is not None or not summary:
+                raise RuntimeError(
+                    f"Failed to summarize chapters {pair[0]['first']}-{pair[-1]['last']}: {error or 'empty response'}"
+                )
+            parent_level.append(
+                {
+                    "lo": pair[0]["lo"],
+                    "hi": pair[-1]["hi"],
+                    "first": pair[0]["first"],
+                    "last": pair[-1]["last"],
+                    "summary": summary,
+                }
+            )
+        levels.append(parent_level)
+        level = parent_level
+
+    return {"levels": levels}
+
+
+def cover(tree, lo, hi):
+    """
+    The fewest tree nodes that together cover leaf positions lo..hi
+    (inclusive), in reading order.
+    """
+    levels = tree["levels"]
+    if not levels or not levels[0] or lo > hi:
+        return []
+
+    def visit(depth, index):
+        node = levels[depth][index]
+        if node["hi"] < lo or node["lo"] > hi:
+            return []
+        if lo <= node["lo"] and node["hi"] <= hi:
+            return [node]
+        found = []
+        for child in (2 * index, 2 * index + 1):
+            if child < len(levels[depth - 1]):
+                found.extend(visit(depth - 1, child))
+        return found
+
+    return visit(len(levels) - 1, 0)
+
+
+def leaf_position(tree, chapter_id):
+    """Position of the leaf for `chapter_id`, or of the first chapter after it."""
+    for leaf in tree["levels"][0]:
+        if leaf["first"] >= chapter_id:
+            return leaf["lo"]
+    return len(tree["levels"][0])
@@ -0,0 +1,110 @@
+from chat_context import RollingSummaries, build_chat_messages, history_chain_keys
+from token_counter import MESSAGE_OVERHEAD_TOKENS, REQUEST_OVERHEAD_TOKENS
+
+
+class WordCounter:
+    """One token per word, so budgets in the tests are easy to reason about."""
+
+    def count(self, text):
+        return len(text.split())
+
+    def count_messages(self, messages):
+        return (
+            sum(self.count(m["content"]) for m in messages)
+            + MESSAGE_OVERHEAD_TOKENS * len(messages)
+            + REQUEST_OVERHEAD_TOKENS
+        )
+
+
+class Summarizer:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def __call__(self, previous, turns):
+        self.calls.append(len(turns))
+        if self.fail:
+            return None
+        return (previous + " " if previous else "") + f"<{len(turns)} turns>"
+
+
+def history(n):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i}"} for i in range(n)]
+
+
+def build(turns, summaries, summarize, budget=10_000, passages=()):
+    return build_chat_messages(
+        WordCounter(),
+        budget,
+        "system prompt",
+        "relationship data",
+        list(passages),
+        turns,
+        "the question",
+        summaries,
+        summarize,
+        recent_turns=6,
+        fold_block=4,
+    )
+
+
+def test_chain_keys_are_stable_per_prefix():
+    keys = history_chain_keys(history(5))
+    assert len(keys) == 6
+    assert history_chain_keys(history(3)) == keys[:4]
+
+
+def test_short_history_is_kept_verbatim():
+    summarize = Summarizer()
+    messages, report = build(history(7), RollingSummaries(), summarize)
+    assert summarize.calls == []
+    assert report["history_turns_verbatim"] == 7
+    assert messages[-1] == {"role": "user", "content": "the question"}
+
+
+def test_older_turns_fold_into_a_summary_block_by_block():
+    summarize = Summarizer()
+    messages, report = build(history(14), RollingSummaries(), summarize)
+
+    assert summarize.calls == [4, 4]
+    assert report["history_turns_summarized"] == 8
+    assert report["history_turns_verbatim"] == 6
+    assert "Summary of the earlier conversation:\n<4 turns> <4 turns>" in [m["content"] for m in messages]
+    assert messages[-7]["content"] == "turn 8"
+
+
+def test_summaries_are_reused_as_the_history_grows():
+    summaries = RollingSummaries()
+    build(history(14), summaries, Summarizer())
+
+    summarize = Summarizer()
+    build(history(16), summaries, summarize)
+    assert summarize.calls == []
+
+    build(history(18), summaries, summarize)
+    assert summarize.calls == [4]
+
+
+def test_unsummarized_turns_are_dropped():
+    _, report = build(history(14), RollingSummaries(), Summarizer(fail=True))
+    assert report["history_turns_summarized"] == 0
+    assert report["history_turns_dropped"] == 8
+    assert report["history_turns_verbatim"] == 6
+
+
+def test_lowest_scoring_passages_go_first_over_budget():
+    passages = [
+        {"text": "alpha " * 50, "score": 3.0},
+        {"text": "beta " * 50, "score": 1.0},
+        {"text": "gamma " * 50, "score": 2.0},
+        {"text": "delta " * 50, "score": 0.5},
+    ]
+    _, roomy = build(history(2), RollingSummaries(), Summarizer(), passages=passages)
+    messages, report = build(
+        history(2), RollingSummaries(), Summarizer(), budget=roomy["prompt_tokens"] - 60, passages=passages
+    )
+
+    assert report["passages_dropped"] == 2
+    assert report["kept_passages"] == [0, 2]
+    assert report["prompt_tokens"] <= roomy["prompt_tokens"] - 60
+    assert messages[1]["content"].index("alpha") < messages[1]["content"].index("gamma")
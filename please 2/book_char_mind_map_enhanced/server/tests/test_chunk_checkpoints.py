@@ -0,0 +1,74 @@
+import itertools
+
+import pytest
+
+import chunk_checkpoints
+from chunk_checkpoints import ChunkCheckpoints, make_run_key
+
+BOOK = "It was a bright cold day in April.\n\nThe clocks were striking thirteen."
+CHUNKS = ["It was a bright cold day in April.", "The clocks were striking thirteen."]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # A strictly increasing clock, so access order never ties
+    ticks = itertools.count(1)
+    monkeypatch.setattr(chunk_checkpoints.time, "time", lambda: float(next(ticks)))
+    return ChunkCheckpoints(str(tmp_path / "checkpoints.sqlite3"))
+
+
+def run_key(book=BOOK, params=None, prompt_version="v1", chunk_tokens=1000):
+    return make_run_key("translate", book, params or {"language": "French"}, prompt_version, chunk_tokens)
+
+
+def test_run_key_covers_book_target_prompt_and_chunk_size():
+    key = run_key()
+    assert run_key(book=BOOK.replace("\n", "\r\n") + "  ") == key
+    assert run_key(book=BOOK.replace("April", "May")) != key
+    assert run_key(params={"language": "German"}) != key
+    assert run_key(prompt_version="v2") != key
+    assert run_key(chunk_tokens=2000) != key
+
+
+def test_resume_returns_finished_chunks(store):
+    key = run_key()
+    store.save(key, 1, CHUNKS[1], "Les horloges sonnaient treize heures.")
+    assert store.load(key, CHUNKS) == {1: "Les horloges sonnaient treize heures."}
+
+
+def test_checkpoints_discarded_when_the_book_changes(store):
+    store.save(run_key(), 0, CHUNKS[0], "Il faisait beau.")
+    edited = BOOK.replace("April", "May")
+    assert store.load(run_key(book=edited), [CHUNKS[0].replace("April", "May"), CHUNKS[1]]) == {}
+
+
+def test_checkpoint_ignored_when_its_chunk_text_differs(store):
+    key = run_key()
+    store.save(key, 0, CHUNKS[0], "Il faisait beau.")
+    store.save(key, 1, CHUNKS[1], "Treize heures.")
+    assert store.load(key, ["Something else entirely.", CHUNKS[1]]) == {1: "Treize heures."}
+    assert store.load(key, CHUNKS[:1]) == {0: "Il faisait beau."}
+
+
+def test_evicts_least_recently_used_runs(store):
+    old, recent = run_key(params={"language": "German"}), run_key()
+    store.save(old, 0, CHUNKS[0], "x" * 100)
+    store.save(recent, 0, CHUNKS[0], "y" * 100)
+    store.max_bytes = 250
+    store.load(old, CHUNKS)  # "recent" is now the oldest access
+    store.save(old, 1, CHUNKS[1], "z" * 100)
+
+    assert store.load(recent, CHUNKS) == {}
+    assert sorted(store.load(old, CHUNKS)) == [0, 1]
+
+
+def test_clear(store):
+    a, b = run_key(), run_key(prompt_version="v2")
+    store.save(a, 0, CHUNKS[0], "a0")
+    store.save(a, 1, CHUNKS[1], "a1")
+    store.save(b, 0, CHUNKS[0], "b0")
+
+    assert store.clear(a) == 2
+    assert store.stats()["runs"] == 1
+    assert store.clear() == 1
+    assert store.stats() == {"runs": 0, "entries": 0, "bytes": 0, "max_bytes": store.max_bytes}
@@ -0,0 +1,83 @@
+from chunking import chunk_text, estimate_tokens
+
+
+def words(n, word="word"):
+    return " ".join([word] * n)
+
+
+def test_empty_text():
+    assert chunk_text("", 100) == []
+    assert chunk_text("  \n\n ", 100) == []
+
+
+def test_small_text_is_one_chunk():
+    text = "One paragraph.\n\nAnother paragraph."
+    chunks = chunk_text(text, 100)
+    assert len(chunks) == 1
+    assert chunks[0]["text"] == text
+    assert chunks[0]["index"] == 0 and chunks[0]["chapter_id"] == 0
+
+
+def test_chunks_respect_the_budget_and_break_on_paragraphs():
+    paragraphs = [f"Paragraph {i}. " + words(30) for i in range(20)]
+    text = "\n\n".join(paragraphs)
+    chunks = chunk_text(text, 100)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk["token_estimate"] <= 100
+        assert chunk["text"] == text[chunk["start"]:chunk["end"]]
+        assert chunk["text"].startswith("Paragraph ")
+    # Every paragraph lands in exactly one chunk, in order
+    assert "\n\n".join(chunk["text"] for chunk in chunks) == text
+
+
+def test_oversized_paragraph_splits_on_sentences():
+    sentences = [f"Sentence {i} " + words(20) + "." for i in range(10)]
+    text = " ".join(sentences)
+    chunks = chunk_text(text, 60)
+    assert all(chunk["text"].startswith("Sentence ") and chunk["text"].endswith(".") for chunk in chunks)
+
+
+def test_quoted_dialogue_is_not_split():
+    quote = '"' + ". ".join(words(8) for _ in range(6)) + '."'
+    text = "Before. " + quote + " After."
+    chunks = chunk_text(text, 80)
+    assert any(quote in chunk["text"] for chunk in chunks)
+
+
+def test_oversized_sentence_falls_back_to_whitespace():
+    text = words(400)
+    chunks = chunk_text(text, 50)
+    assert len(chunks) > 1
+    assert all(chunk["token_estimate"] <= 50 for chunk in chunks)
+    assert " ".join(chunk["text"] for chunk in chunks) == text
+
+
+def test_chapters_start_new_chunks():
+    text = "\n\n".join(f"Chapter {i}\n\n" + words(50) for i in range(1, 4))
+    chunks = chunk_text(text, 200, min_fill=0.2)
+    assert [chunk["chapter_id"] for chunk in chunks] == [1, 2, 3]
+    assert all(chunk["text"].startswith("Chapter ") for chunk in chunks)
+
+
+def test_overlap_prefixes_previous_units():
+    paragraphs = [f"P{i} " + words(20) for i in range(10)]
+    text = "\n\n".join(paragraphs)
+    plain = chunk_text(text, 60)
+    overlapped = chunk_text(text, 60, overlap_tokens=30)
+    assert len(plain) == len(overlapped)
+    for before, chunk in zip(plain, overlapped[1:]):
+        assert chunk["start"] < before["end"]
+        assert chunk["text"].endswith(plain[chunk["index"]]["text"])
+
+
+def test_custom_token_counter():
+    text = "\n\n".join(words(10) for _ in range(6))
+    chunks = chunk_text(text, 20, token_counter=lambda s: len(s.split()))
+    assert [chunk["token_estimate"] for chunk in chunks] == [20, 20, 20]
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("a") == 1
+    assert estimate_tokens("x" * 400) == 100
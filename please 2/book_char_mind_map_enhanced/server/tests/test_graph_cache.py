@@ -0,0 +1,61 @@
+import itertools
+
+import pytest
+
+import graph_cache
+from graph_cache import GraphCache, make_cache_key
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # A strictly increasing clock, so access order never ties
+    ticks = itertools.count(1)
+    monkeypatch.setattr(graph_cache.time, "time", lambda: float(next(ticks)))
+    return GraphCache(str(tmp_path / "graphs.sqlite3"))
+
+
+def graph(name):
+    return {"nodes": [{"id": name, "name": name}], "links": []}
+
+
+def test_key_ignores_line_endings_and_trailing_whitespace():
+    assert make_cache_key("Call me Ishmael.  \r\nSome years ago\r\n", "v1") == make_cache_key(
+        "Call me Ishmael.\nSome years ago", "v1"
+    )
+
+
+def test_key_changes_with_text_and_version():
+    key = make_cache_key("Call me Ishmael.", "v1")
+    assert make_cache_key("Call me Ahab.", "v1") != key
+    assert make_cache_key("Call me Ishmael.", "v2") != key
+
+
+def test_round_trip(cache):
+    assert cache.get("k") is None
+    cache.put("k", graph("Ishmael"), "raw response")
+    assert cache.get("k") == {"graph_data": graph("Ishmael"), "character_response_text": "raw response"}
+
+
+def test_evicts_least_recently_used(cache):
+    cache.put("a", graph("a"), "")
+    size = cache.stats()["bytes"]
+    cache.max_bytes = 2 * size
+    cache.put("b", graph("b"), "")
+    cache.get("a")  # "b" is now the oldest access
+    cache.put("c", graph("c"), "")
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["entries"] == 2
+
+
+def test_invalidate(cache):
+    for key in ("a", "b", "c"):
+        cache.put(key, graph(key), "")
+
+    assert cache.invalidate("a") == 1
+    assert cache.invalidate("a") == 0
+    assert cache.get("a") is None
+    assert cache.invalidate() == 2
+    assert cache.stats()["entries"] == 0
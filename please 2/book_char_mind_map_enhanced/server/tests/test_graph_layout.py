@@ -0,0 +1,73 @@
+import copy
+
+import numpy as np
+import pytest
+
+import graph_layout
+from graph_layout import TARGET_EDGE_LENGTH, force_layout, has_current_layout, layout_graph
+
+
+def ring(n, extra_links=()):
+    nodes = [{"id": str(i), "name": f"N{i}"} for i in range(n)]
+    links = [{"source": str(i), "target": str((i + 1) % n)} for i in range(n)]
+    links += [{"source": s, "target": t} for s, t in extra_links]
+    return {"nodes": nodes, "links": links}
+
+
+def coordinates(graph):
+    return np.array([[node["x"], node["y"]] for node in graph["nodes"]])
+
+
+def test_every_node_gets_finite_coordinates():
+    graph = layout_graph(ring(12))
+    pos = coordinates(graph)
+    assert pos.shape == (12, 2)
+    assert np.isfinite(pos).all()
+    assert has_current_layout(graph)
+
+
+def test_layout_is_deterministic():
+    assert layout_graph(ring(10))["nodes"] == layout_graph(ring(10))["nodes"]
+
+
+def test_linked_nodes_sit_about_the_target_distance_apart():
+    graph = layout_graph(ring(16))
+    pos = coordinates(graph)
+    lengths = [np.linalg.norm(pos[i] - pos[(i + 1) % 16]) for i in range(16)]
+    assert np.median(lengths) == pytest.approx(TARGET_EDGE_LENGTH, rel=0.01)
+
+
+def test_nodes_do_not_collapse_onto_each_other():
+    pos = coordinates(layout_graph(ring(20)))
+    gaps = np.linalg.norm(pos[:, None] - pos[None, :], axis=-1) + np.eye(20) * 1e9
+    assert gaps.min() > 1.0
+
+
+def test_unknown_and_self_links_are_ignored():
+    graph = ring(4, extra_links=[("0", "0"), ("0", "missing")])
+    assert coordinates(layout_graph(graph)).shape == (4, 2)
+
+
+@pytest.mark.parametrize("n", [1, 2])
+def test_tiny_graphs(n):
+    graph = {"nodes": [{"id": str(i)} for i in range(n)], "links": []}
+    assert np.isfinite(coordinates(layout_graph(graph))).all()
+
+
+def test_empty_graph_is_left_alone():
+    assert layout_graph({"nodes": [], "links": []}) == {"nodes": [], "links": []}
+
+
+def test_big_graphs_skip_the_spectral_start(monkeypatch):
+    monkeypatch.setattr(graph_layout, "SPECTRAL_MAX_NODES", 5)
+    monkeypatch.setattr(np.linalg, "eigh", lambda *a: pytest.fail("spectral start used"))
+    pos = force_layout(8, np.array([[0, 1], [1, 2]]), iterations=5)
+    assert pos.shape == (8, 2)
+
+
+def test_stale_layout_version_is_detected():
+    graph = layout_graph(ring(5))
+    stale = copy.deepcopy(graph)
+    stale["layout"]["version"] = -1
+    assert not has_current_layout(stale)
+    assert not has_current_layout({"nodes": []})
@@ -0,0 +1,99 @@
+import pytest
+
+from graph_schema import GraphSchemaError, normalize_graph
+
+
+def names(graph):
+    return [node["name"] for node in graph["nodes"]]
+
+
+def test_ids_and_vals_are_reassigned_sequentially():
+    graph, report = normalize_graph({
+        "title": "T",
+        "nodes": [{"id": "x", "name": "Harry Potter", "val": 9}, {"id": "y", "name": "Ron Weasley", "val": 3}],
+        "links": [{"source": "x", "target": "y", "label": "friends"}],
+    })
+    assert graph["nodes"] == [
+        {"id": "c1", "name": "Harry Potter", "val": 1},
+        {"id": "c2", "name": "Ron Weasley", "val": 2},
+    ]
+    assert graph["links"] == [{"source": "c1", "target": "c2", "label": "friends"}]
+    assert graph["title"] == "T" and graph["summary"] == ""
+    assert report["nodes_out"] == 2 and report["links_out"] == 1
+
+
+def test_invalid_nodes_are_dropped():
+    graph, report = normalize_graph({"nodes": [{"id": "a", "name": None}, {"id": "b", "name": 7}, "c",
+                                               {"id": "d", "name": "  "}, {"id": "e", "name": "Hermione"}]})
+    assert names(graph) == ["Hermione"]
+    assert report["invalid_nodes"] == 4
+
+
+def test_case_and_punctuation_variants_merge():
+    graph, report = normalize_graph({"nodes": [{"id": "1", "name": "Harry Potter"}, {"id": "2", "name": "harry potter."}]})
+    assert names(graph) == ["Harry Potter"]
+    assert report["merged_nodes"] == 1
+
+
+def test_aliases_merge_nodes_and_are_kept():
+    graph, _ = normalize_graph({"nodes": [
+        {"id": "1", "name": "Tom Riddle", "aliases": ["Voldemort"]},
+        {"id": "2", "name": "Voldemort"},
+    ]})
+    assert graph["nodes"] == [{"id": "c1", "name": "Tom Riddle", "val": 1, "aliases": ["Voldemort"]}]
+
+
+def test_one_word_name_merges_into_its_unique_full_name():
+    graph, _ = normalize_graph({"nodes": [
+        {"id": "1", "name": "Hagrid"},
+        {"id": "2", "name": "Rubeus Hagrid"},
+        {"id": "3", "name": "Professor Albus Dumbledore"},
+        {"id": "4", "name": "Dumbledore"},
+    ]})
+    assert names(graph) == ["Rubeus Hagrid", "Professor Albus Dumbledore"]
+
+
+def test_ambiguous_short_name_is_not_merged():
+    graph, _ = normalize_graph({"nodes": [
+        {"id": "1", "name": "Fred Weasley"},
+        {"id": "2", "name": "George Weasley"},
+        {"id": "3", "name": "Weasley"},
+    ]})
+    assert names(graph) == ["Fred Weasley", "George Weasley", "Weasley"]
+
+
+def test_links_are_remapped_through_merges_ids_and_names():
+    graph, report = normalize_graph({
+        "nodes": [{"id": "h", "name": "Harry Potter"}, {"id": "h2", "name": "Harry"},
+                  {"id": "r", "name": "Ron Weasley"}],
+        "links": [
+            {"source": "h2", "target": "r", "label": "best friends"},
+            {"source": "Ron Weasley", "target": "Harry Potter", "label": "loyal to"},
+            {"source": {"id": "h"}, "target": {"id": "r"}, "label": "best friends"},
+        ],
+    })
+    assert names(graph) == ["Harry Potter", "Ron Weasley"]
+    assert graph["links"] == [{"source": "c1", "target": "c2", "label": "best friends; loyal to"}]
+    assert report["duplicate_links"] == 2
+
+
+def test_dangling_and_self_links_are_dropped():
+    graph, report = normalize_graph({
+        "nodes": [{"id": "a", "name": "Harry"}, {"id": "b", "name": "Ron"}],
+        "links": [{"source": "a", "target": "zz"}, {"source": "a", "target": "a"}, "bad",
+                  {"source": "a", "target": "b"}],
+    })
+    assert graph["links"] == [{"source": "c1", "target": "c2", "label": ""}]
+    assert report["dangling_links"] == 2
+    assert report["self_links"] == 1
+
+
+def test_missing_links_list_is_treated_as_empty():
+    graph, _ = normalize_graph({"nodes": [{"name": "Harry"}], "links": None})
+    assert graph["links"] == []
+
+
+@pytest.mark.parametrize("graph", [None, [], {"nodes": None}, {"links": []}])
+def test_non_graph_input_raises(graph):
+    with pytest.raises(GraphSchemaError):
+        normalize_graph(graph)
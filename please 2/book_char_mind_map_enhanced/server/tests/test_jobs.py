@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+import jobs
+from jobs import JobQueue
+
+TIMEOUT = 5
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(max_workers=1)
+    yield queue
+    queue._pool.shutdown(wait=True, cancel_futures=True)
+
+
+def wait(queue, job_id):
+    job = queue.get(job_id)
+    job.future.result(timeout=TIMEOUT)
+    return job.snapshot(include_partial=True)
+
+
+def blocking_job(started, release):
+    def run(job):
+        started.set()
+        release.wait(TIMEOUT)
+        job.check_cancelled()
+        return {"status": "success"}, 200
+    return run
+
+
+def test_job_result_and_status(queue):
+    ok = queue.submit("demo", lambda job: ({"answer": 42}, 200), {"book_id": "b"})
+    bad = queue.submit("demo", lambda job: ({"error": "nope"}, 400))
+
+    done = wait(queue, ok["job_id"])
+    assert (done["status"], done["result"], done["params"]) == ("succeeded", {"answer": 42}, {"book_id": "b"})
+    failed = wait(queue, bad["job_id"])
+    assert (failed["status"], failed["error"]) == ("failed", "nope")
+
+
+def test_exception_fails_the_job(queue):
+    def explode(job):
+        raise RuntimeError("boom")
+
+    snapshot = wait(queue, queue.submit("demo", explode)["job_id"])
+    assert (snapshot["status"], snapshot["error"]) == ("failed", "boom")
+
+
+def test_progress_and_partial_results(queue):
+    def run(job):
+        job.set_stage("translating", total=4)
+        job.chunk_done(0, result="uno")
+        job.chunk_done(2, error=ValueError("bad chunk"))
+        job.chunk_done(1, result="dos")
+        return {"status": "success"}, 200
+
+    snapshot = wait(queue, queue.submit("translate", run)["job_id"])
+    assert snapshot["stage"] == "translating"
+    assert snapshot["progress"] == {
+        "total_chunks": 4, "completed_chunks": 3, "failed_chunks": 1, "fraction": 0.75,
+    }
+    assert snapshot["partial_results"] == [{"chunk": 1, "result": "uno"}, {"chunk": 2, "result": "dos"}]
+    assert snapshot["chunk_errors"] == [{"chunk": 3, "error": "bad chunk"}]
+
+
+def test_cancel_queued_job_never_runs(queue):
+    started, release = threading.Event(), threading.Event()
+    first = queue.submit("demo", blocking_job(started, release))
+    assert started.wait(TIMEOUT)
+
+    ran = []
+    second = queue.submit("demo", lambda job: (ran.append(1), ({}, 200))[1])
+    assert queue.cancel(second["job_id"]).status == "cancelled"
+    release.set()
+    wait(queue, first["job_id"])
+
+    assert ran == []
+    assert queue.get(second["job_id"]).snapshot()["status"] == "cancelled"
+
+
+def test_cancel_running_job_stops_at_next_check(queue):
+    started, release = threading.Event(), threading.Event()
+    submitted = queue.submit("demo", blocking_job(started, release))
+    assert started.wait(TIMEOUT)
+
+    job = queue.cancel(submitted["job_id"])
+    assert job.snapshot()["cancel_requested"] is True
+    release.set()
+    snapshot = wait(queue, submitted["job_id"])
+    assert snapshot["status"] == "cancelled"
+    assert "result" not in snapshot
+
+
+def test_cancel_unknown_job(queue):
+    assert queue.cancel("nope") is None
+
+
+def test_finished_jobs_expire_after_ttl(queue, monkeypatch):
+    job_id = queue.submit("demo", lambda job: ({}, 200))["job_id"]
+    wait(queue, job_id)
+    finished_at = queue.get(job_id).finished_at
+
+    monkeypatch.setattr(jobs.time, "time", lambda: finished_at + queue.ttl + 1)
+    assert queue.get(job_id) is None
+
+
+def test_oldest_finished_jobs_dropped_past_max_jobs(queue):
+    queue.max_jobs = 2
+    ids = []
+    for _ in range(3):
+        ids.append(queue.submit("demo", lambda job: ({}, 200))["job_id"])
+        wait(queue, ids[-1])
+
+    assert queue.get(ids[0]) is None
+    assert queue.get(ids[1]) is not None
+    assert queue.get(ids[2]) is not None
+    assert queue.stats()["jobs"] == 2
@@ -0,0 +1,64 @@
+import pytest
+
+from json_repair import JSONExtractionError, clean_json_text, close_truncated, extract_json_object, scan_objects
+
+
+def test_plain_object():
+    assert extract_json_object('{"a": 1}') == {"a": 1}
+
+
+def test_fenced_block_with_prose_around_it():
+    text = 'Here is the graph:\n```json\n{"nodes": [{"id": "c1"}]}\n```\nLet me know!'
+    assert extract_json_object(text) == {"nodes": [{"id": "c1"}]}
+
+
+def test_last_fenced_block_wins():
+    text = '```json\n{"draft": true}\n```\nCorrected:\n```json\n{"draft": false}\n```'
+    assert extract_json_object(text) == {"draft": False}
+
+
+def test_comments_and_trailing_commas():
+    text = '{\n  // the cast\n  "nodes": [1, 2, /* more */ ],\n  "links": [],\n}'
+    assert extract_json_object(text) == {"nodes": [1, 2], "links": []}
+
+
+def test_trailing_comma_patterns_inside_strings_are_kept():
+    text = '{"label": "friends ,} rivals ,]", "quote": "a \\"b,}\\"",}'
+    assert extract_json_object(text) == {"label": "friends ,} rivals ,]", "quote": 'a "b,}"'}
+
+
+def test_comment_markers_inside_strings_are_kept():
+    assert clean_json_text('{"url": "http://x/*y*/"}') == '{"url": "http://x/*y*/"}'
+
+
+def test_truncated_object_is_closed_after_last_complete_element():
+    text = '{"nodes": [{"id": "c1", "name": "Harry"}, {"id": "c2", "na'
+    assert extract_json_object(text) == {"nodes": [{"id": "c1", "name": "Harry"}, {"id": "c2"}]}
+
+
+def test_truncated_inside_string():
+    text = '{"title": "T", "summary": "A boy who li'
+    assert extract_json_object(text) == {"title": "T"}
+
+
+def test_truncated_output_is_preferred_over_earlier_complete_object():
+    text = '{"draft": 1}\n{"final": 2, "nodes": [1, 2'
+    assert extract_json_object(text) == {"final": 2, "nodes": [1]}
+
+
+def test_scan_objects_reports_spans_and_truncation():
+    text = 'x {"a": {"b": 1}} y {"c": "}"} z {"d": ['
+    spans, truncated = scan_objects(text)
+    assert [text[start:end] for start, end in spans] == ['{"a": {"b": 1}}', '{"c": "}"}']
+    assert truncated == text.index('{"d"')
+
+
+def test_close_truncated_closes_open_brackets_in_order():
+    text = '{"a": [{"b": [1, 2'
+    assert close_truncated(text, 0) == '{"a": [{"b": [1]}]}'
+
+
+@pytest.mark.parametrize("text", ["", "   ", "no json here", "[1, 2, 3]", "```json\n```"])
+def test_no_object_raises(text):
+    with pytest.raises(JSONExtractionError):
+        extract_json_object(text)
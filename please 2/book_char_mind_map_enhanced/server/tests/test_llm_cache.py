@@ -0,0 +1,81 @@
+import pytest
+
+import llm_cache
+from llm_cache import MemoryBackend, ResponseCache, SQLiteBackend, create_response_cache, make_request_key
+
+MESSAGES = [{"role": "user", "content": "Who is Ishmael?"}]
+
+
+class FakeClock:
+    """Stands in for time.time; every read advances it a little, so access order never ties."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 0.001
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend(max_entries=2)
+    return SQLiteBackend(str(tmp_path / "llm.sqlite3"), max_entries=2)
+
+
+def test_request_key_covers_every_parameter():
+    key = make_request_key("m", MESSAGES, 100, 0.0)
+    assert make_request_key("m", [dict(MESSAGES[0])], 100, 0.0) == key
+    assert make_request_key("other", MESSAGES, 100, 0.0) != key
+    assert make_request_key("m", MESSAGES, 200, 0.0) != key
+    assert make_request_key("m", MESSAGES, 100, 0.7) != key
+    assert make_request_key("m", [{"role": "user", "content": "Who is Ahab?"}], 100, 0.0) != key
+
+
+def test_backend_evicts_least_recently_used(clock, backend):
+    backend.set("a", "A", 9e9)
+    backend.set("b", "B", 9e9)
+    backend.get("a")
+    backend.set("c", "C", 9e9)
+
+    assert backend.get("b") is None
+    assert backend.get("a")[0] == "A"
+    assert backend.get("c")[0] == "C"
+    assert len(backend) == 2
+
+
+def test_hit_and_miss_counters(clock, backend):
+    cache = ResponseCache(backend, ttl=60)
+    assert cache.get("k") is None
+    cache.set("k", "answer")
+    assert cache.get("k") == "answer"
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_expired_entries_are_dropped(clock, backend):
+    cache = ResponseCache(backend, ttl=60)
+    cache.set("k", "answer")
+    clock.now += 59
+    assert cache.get("k") == "answer"
+    clock.now += 2
+    assert cache.get("k") is None
+    assert len(backend) == 0
+
+
+def test_create_response_cache(tmp_path):
+    assert create_response_cache("none", str(tmp_path), 60, 10) is None
+    assert isinstance(create_response_cache("memory", str(tmp_path), 60, 10).backend, MemoryBackend)
+    assert isinstance(create_response_cache("sqlite", str(tmp_path), 60, 10).backend, SQLiteBackend)
+    with pytest.raises(ValueError):
+        create_response_cache("redis", str(tmp_path), 60, 10)
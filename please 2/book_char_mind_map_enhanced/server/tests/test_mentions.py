@@ -0,0 +1,60 @@
+from mentions import AhoCorasick, MentionIndex, derive_aliases
+
+CHARACTERS = [
+    {"id": "1", "name": "Harry Potter", "aliases": ["Harry"]},
+    {"id": "2", "name": "Ron Weasley", "aliases": ["Ron"]},
+    {"id": "3", "name": "Hermione Granger", "aliases": []},
+]
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    patterns = ["he", "she", "his", "hers"]
+    found = {(patterns[pid], start) for start, end, pid in AhoCorasick(patterns).iter_matches("ushers")}
+    assert found == {("she", 1), ("he", 2), ("hers", 2)}
+
+
+def test_longest_name_wins_where_names_overlap():
+    index = MentionIndex("Harry Potter waved. Harry smiled.", CHARACTERS, chapter_starts=[])
+    assert [index.ids[i] for i in index.character_ids] == ["1", "1"]
+    assert list(index.lengths) == [len("Harry Potter"), len("Harry")]
+
+
+def test_names_match_whole_words_only():
+    text = "Ronald met Ron. Harrying nobody, Harry's owl flew. Aaron stayed."
+    index = MentionIndex(text, CHARACTERS, chapter_starts=[])
+    assert [text[o:o + n] for o, n in zip(index.offsets, index.lengths)] == ["Ron", "Harry"]
+
+
+def test_matching_is_case_insensitive():
+    index = MentionIndex("HARRY POTTER and hermione granger", CHARACTERS, chapter_starts=[])
+    assert index.frequencies() == {"1": 1, "2": 0, "3": 1}
+
+
+def test_paragraphs_chapters_and_first_appearance():
+    text = "Opening words.\n\nCHAPTER ONE\n\nHarry slept.\n\nRon and Harry ate."
+    chapter_start = text.index("CHAPTER ONE")
+    index = MentionIndex(text, CHARACTERS, chapter_starts=[chapter_start])
+
+    first = index.first_appearance("ron")
+    assert first == {"offset": text.index("Ron"), "length": 3, "paragraph": 3, "chapter": 1}
+    assert index.first_appearances()["1"]["paragraph"] == 2
+    assert index.first_appearance("Dumbledore") is None
+    assert len(index.occurrences("Harry Potter")) == 2
+    assert len(index.occurrences("1", limit=1)) == 1
+
+
+def test_co_occurrences_count_shared_paragraphs():
+    text = "Harry and Ron.\n\nRon and Harry again.\n\nHermione Granger alone."
+    index = MentionIndex(text, CHARACTERS, chapter_starts=[])
+    assert index.co_occurrences() == [{"source": "1", "target": "2", "paragraphs": 2}]
+    assert index.co_occurrences(min_count=3) == []
+
+
+def test_derive_aliases_skips_titles_and_shared_names():
+    characters = [
+        {"name": "Mr. Sherlock Holmes"},
+        {"name": "Mycroft Holmes"},
+        {"name": "Dr. John Watson"},
+    ]
+    aliases = [c["aliases"] for c in derive_aliases(characters)]
+    assert aliases == [["Sherlock"], ["Mycroft"], ["John", "Watson"]]
@@ -0,0 +1,121 @@
+import email.utils
+
+import pytest
+
+import rate_limit
+from rate_limit import RateLimiter, RetryPolicy, TokenBucket, parse_retry_after
+
+
+class FakeClock:
+    """Stands in for time.monotonic/time.sleep so waits are instant and measurable."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limit.time, "sleep", clock.sleep)
+    return clock
+
+
+@pytest.mark.parametrize("value, expected", [("0", 0.0), ("12", 12.0), (" 2.5 ", 2.5), ("-3", 0.0)])
+def test_retry_after_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_retry_after_http_date():
+    now = 1_700_000_000
+    value = email.utils.formatdate(now + 30, usegmt=True)
+    assert parse_retry_after(value, now=now) == pytest.approx(30)
+    assert parse_retry_after(email.utils.formatdate(now - 30, usegmt=True), now=now) == 0.0
+
+
+@pytest.mark.parametrize("value", [None, "", "soon", "Mon, 99 Foo 2024"])
+def test_retry_after_unparseable(value):
+    assert parse_retry_after(value) is None
+
+
+def test_should_retry_transient_statuses_only():
+    policy = RetryPolicy(max_retries=2)
+    assert policy.should_retry(0, 429)
+    assert policy.should_retry(0, 503)
+    assert policy.should_retry(1, None)  # connection error or timeout
+    assert not policy.should_retry(0, 400)
+    assert not policy.should_retry(0, 401)
+    assert not policy.should_retry(2, 429)
+
+
+def test_backoff_stays_within_exponential_cap():
+    policy = RetryPolicy(base_delay=1.0, max_delay=10.0)
+    for attempt, cap in [(0, 1.0), (1, 2.0), (2, 4.0), (3, 8.0), (4, 10.0), (10, 10.0)]:
+        delays = [policy.delay(attempt) for _ in range(200)]
+        assert all(0 <= d <= cap for d in delays)
+
+
+def test_retry_after_is_a_lower_bound_and_capped():
+    policy = RetryPolicy(base_delay=1.0, max_delay=2.0, max_retry_after=60.0)
+    assert all(policy.delay(0, retry_after=5) >= 5 for _ in range(50))
+    assert policy.delay(0, retry_after=3600) == 60.0
+
+
+def test_token_bucket_refills_and_allows_oversized_requests_into_debt():
+    bucket = TokenBucket(rate=10, capacity=100)
+    assert bucket.wait_time(100, now=bucket.updated) == 0
+    bucket.take(100)
+    assert bucket.wait_time(50, now=bucket.updated + 1) == pytest.approx(4)
+    assert bucket.wait_time(500, now=bucket.updated + 10) == 0  # capped at capacity once full
+    bucket.take(500)
+    assert bucket.level == -400
+
+
+def test_disabled_limiter_never_waits(clock):
+    limiter = RateLimiter()
+    assert not limiter.enabled
+    for _ in range(100):
+        limiter.acquire(tokens=10_000)
+    assert clock.slept == []
+
+
+def test_requests_per_second(clock):
+    limiter = RateLimiter(requests_per_second=2)
+    for _ in range(6):
+        limiter.acquire()
+    # Burst of 2, then one request every half second
+    assert sum(clock.slept) == pytest.approx(2.0)
+    assert limiter.stats()["waits"] == 4
+
+
+def test_settle_returns_unused_tokens(clock):
+    limiter = RateLimiter(tokens_per_minute=600)
+    limiter.acquire(tokens=600)
+    limiter.settle(reserved=600, used=100)
+    limiter.acquire(tokens=500)
+    assert clock.slept == []
+    limiter.acquire(tokens=60)
+    assert sum(clock.slept) == pytest.approx(6.0)
+
+
+def test_settle_without_usage_keeps_the_reservation(clock):
+    limiter = RateLimiter(tokens_per_minute=600)
+    limiter.acquire(tokens=600)
+    limiter.settle(reserved=600, used=None)
+    limiter.acquire(tokens=60)
+    assert sum(clock.slept) == pytest.approx(6.0)
+
+
+def test_pause_holds_every_caller(clock):
+    limiter = RateLimiter(requests_per_second=100)
+    limiter.pause(3)
+    limiter.acquire()
+    assert sum(clock.slept) == pytest.approx(3.0)
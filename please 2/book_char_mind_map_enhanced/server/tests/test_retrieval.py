@@ -0,0 +1,63 @@
+from retrieval import PassageIndex, split_passages, tokenize
+
+
+def test_tokenize_drops_stopwords_and_case():
+    assert tokenize("The Boy who LIVED, and Harry's scar!") == ["boy", "lived", "harry's", "scar"]
+
+
+def test_short_paragraphs_merge_up_to_the_limits():
+    text = "\n\n".join(["one two three"] * 10)
+    passages = split_passages(text, min_words=6, max_words=9)
+    assert [len(text[s:e].split()) for s, e in passages] == [6, 6, 6, 6, 6]
+
+
+def test_long_paragraph_is_never_merged():
+    long = " ".join(["word"] * 50)
+    text = "short one\n\n" + long + "\n\nshort two"
+    passages = [text[s:e] for s, e in split_passages(text, min_words=5, max_words=20)]
+    assert passages == ["short one", long, "short two"]
+
+
+FILLER = " ".join(f"filler{i}" for i in range(60))
+
+TOPICS = [
+    "Harry lived in the cupboard under the stairs at Privet Drive.",
+    "Hagrid arrived with a cake and told Harry he was a wizard.",
+    "The Hogwarts Express left from platform nine and three quarters.",
+    "Snape taught potions in the dungeons.",
+    "Hagrid kept a dragon egg in his hut near the forest.",
+]
+
+
+def make_book():
+    # Each paragraph is long enough to be its own passage
+    return "\n\n".join(f"{topic} {FILLER}" for topic in TOPICS)
+
+
+def test_each_long_paragraph_is_a_passage():
+    index = PassageIndex(make_book())
+    assert len(index.passages) == len(TOPICS)
+
+
+def test_search_ranks_matching_passages():
+    book = make_book()
+    results = PassageIndex(book).search("dragon egg", top_k=1)
+    assert len(results) == 1
+    assert results[0]["passage"] == 4
+    assert results[0]["text"] == book[results[0]["start"]:results[0]["end"]]
+
+
+def test_search_returns_book_order_and_ignores_unknown_terms():
+    index = PassageIndex(make_book())
+    assert index.search("quidditch broomstick") == []
+    results = index.search("Hagrid Harry", top_k=8)
+    # Passage 1 mentions both and scores highest, but results come back in book order
+    assert max(results, key=lambda r: r["score"])["passage"] == 1
+    assert [r["passage"] for r in results] == [0, 1, 4]
+
+
+def test_boost_terms_favour_character_passages():
+    index = PassageIndex(make_book())
+    assert [r["passage"] for r in index.search("potions cake", top_k=1)] in ([1], [3])
+    boosted = index.search("potions cake", top_k=1, boost_terms=["Snape"])
+    assert [r["passage"] for r in boosted] == [3]
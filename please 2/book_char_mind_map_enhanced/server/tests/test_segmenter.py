@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from segmenter import chapter_span, chapter_starts, segment_book
+
+BOOK_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "book.txt")
+
+
+@pytest.fixture(scope="module")
+def book():
+    with open(BOOK_PATH, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_bundled_book_chapters(book):
+    chapters = segment_book(book)["chapters"]
+    assert chapters[0]["title"] == "Opening"
+    assert chapters[1]["title"] == "CHAPTER ONE: The Boy Who Lived"
+    assert chapters[2]["title"] == "CHAPTER TWO: The Vanishing Glass"
+    assert chapters[-1]["title"].startswith("CHAPTER SEVENTEEN")
+    # CHAPTER NINE is run into the end of a paragraph in this copy, so it is not a heading
+    assert len(chapters) == 17
+    assert all(book[c["start"]:].startswith("CHAPTER") for c in chapters[1:])
+
+
+def test_chapters_tile_the_book(book):
+    segments = segment_book(book)
+    chapters = segments["chapters"]
+    assert chapters[0]["start"] == segments["content_start"] == 0
+    assert chapters[-1]["end"] == segments["content_end"] == len(book)
+    for previous, chapter in zip(chapters, chapters[1:]):
+        assert previous["end"] == chapter["start"]
+    assert [c["id"] for c in chapters] == list(range(len(chapters)))
+
+
+def test_numbered_and_roman_headings_with_scene_breaks():
+    text = (
+        "Preface text.\n\n"
+        "Chapter 1\n\nIt began.\n\n* * *\n\nLater that day.\n\n"
+        "IV\n\nA roman chapter.\n\n"
+        "Part Two: The Return\nStill going.\n"
+    )
+    chapters = segment_book(text)["chapters"]
+    assert [c["title"] for c in chapters] == ["Opening", "Chapter 1", "IV", "Part Two: The Return"]
+    assert len(chapters[1]["sections"]) == 2
+    first, second = chapters[1]["sections"]
+    assert text[first["start"]:first["end"]].strip().endswith("It began.")
+    assert text[second["start"]:second["end"]].strip() == "Later that day."
+
+
+def test_roman_numeral_followed_by_prose_is_not_a_heading():
+    text = "Intro.\n\nI\nwent home.\n"
+    assert [c["title"] for c in segment_book(text)["chapters"]] == ["Opening"]
+
+
+def test_gutenberg_boilerplate_is_excluded():
+    text = (
+        "Licence blurb\nChapter 99\n"
+        "*** START OF THE PROJECT GUTENBERG EBOOK X ***\n"
+        "Chapter 1\nBody.\n"
+        "*** END OF THE PROJECT GUTENBERG EBOOK X ***\nMore licence\n"
+    )
+    segments = segment_book(text)
+    assert text[segments["content_start"]:].startswith("Chapter 1")
+    assert text[segments["content_end"]:].startswith("*** END")
+    assert [c["title"] for c in segments["chapters"]] == ["Chapter 1"]
+
+
+def test_chapter_span_and_starts():
+    text = "Chapter 1\nOne.\nChapter 2\nTwo.\nChapter 3\nThree.\n"
+    segments = segment_book(text)
+    starts = chapter_starts(segments)
+    assert [text[s:].split("\n")[0] for s in starts] == ["Chapter 1", "Chapter 2", "Chapter 3"]
+    start, end = chapter_span(segments, 2, 3)
+    assert text[start:end] == "Chapter 2\nTwo.\nChapter 3\nThree.\n"
+    assert chapter_span(segments, 7) is None
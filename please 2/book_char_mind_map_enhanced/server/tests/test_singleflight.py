@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def run_concurrently(flight, key, fn, waiters):
+    """Start a leader blocked inside `fn`, then `waiters` callers for the same key; returns their outcomes."""
+    release = threading.Event()
+    outcomes = [None] * (waiters + 1)
+
+    def leader_fn():
+        release.wait(5)
+        return fn()
+
+    def call(i, target):
+        try:
+            outcomes[i] = ("ok", flight.do(key, target))
+        except Exception as e:
+            outcomes[i] = ("error", e)
+
+    threads = [threading.Thread(target=call, args=(0, leader_fn))]
+    threads[0].start()
+    wait_for(lambda: flight.stats()["in_flight"] == 1)
+    for i in range(1, waiters + 1):
+        # A waiter's own function must never run
+        threads.append(threading.Thread(target=call, args=(i, lambda: pytest.fail("waiter ran its own call"))))
+        threads[-1].start()
+    wait_for(lambda: flight.stats()["coalesced"] == waiters)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_single_call_runs_and_is_not_shared():
+    flight = SingleFlight()
+    assert flight.do("k", lambda: 42) == (42, False)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_waiters_share_the_leaders_result():
+    flight = SingleFlight()
+    calls = []
+    outcomes = run_concurrently(flight, "k", lambda: calls.append(1) or "answer", waiters=3)
+    assert calls == [1]
+    assert outcomes[0] == ("ok", ("answer", False))
+    assert outcomes[1:] == [("ok", ("answer", True))] * 3
+    stats = flight.stats()
+    assert stats["calls"] == 1 and stats["coalesced"] == 3 and stats["max_waiters"] == 3
+    assert stats["in_flight"] == 0
+
+
+def test_leader_exception_reaches_every_waiter():
+    flight = SingleFlight()
+    error = ValueError("kaboom")
+
+    def fail():
+        raise error
+
+    outcomes = run_concurrently(flight, "k", fail, waiters=2)
+    assert outcomes == [("error", error)] * 3
+    # The failed flight is forgotten, so the next call runs again
+    assert flight.do("k", lambda: "retried") == ("retried", False)
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight()
+    release = threading.Event()
+    results = {}
+
+    def call(key):
+        results[key] = flight.do(key, lambda: release.wait(5) and key)
+
+    threads = [threading.Thread(target=call, args=(key,)) for key in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: flight.stats()["in_flight"] == 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == {"a": ("a", False), "b": ("b", False)}
+    assert flight.stats()["coalesced"] == 0
+
+
+def test_completed_calls_are_not_cached():
+    flight = SingleFlight()
+    counter = iter(range(10))
+    assert flight.do("k", lambda: next(counter)) == (0, False)
+    assert flight.do("k", lambda: next(counter)) == (1, False)
@@ -0,0 +1,71 @@
+import pytest
+
+from summary_tree import build_summary_tree, cover, leaf_position
+
+
+def chapters(*ids):
+    return [{"id": i, "title": f"Chapter {i}", "text": f"text {i}"} for i in ids]
+
+
+def summarize_chapter(chapter):
+    return f"[{chapter['id']}]"
+
+
+def summarize_span(left, right):
+    return left["summary"] + right["summary"]
+
+
+def build(*ids):
+    return build_summary_tree(chapters(*ids), summarize_chapter, summarize_span, parallelism=4)
+
+
+def spans(nodes):
+    return [(node["lo"], node["hi"]) for node in nodes]
+
+
+def test_levels_merge_neighbouring_pairs():
+    tree = build(1, 2, 3, 4, 5)
+    assert [spans(level) for level in tree["levels"]] == [
+        [(0, 0), (1, 1), (2, 2), (3, 3), (4, 4)],
+        [(0, 1), (2, 3), (4, 4)],
+        [(0, 3), (4, 4)],
+        [(0, 4)],
+    ]
+    assert tree["levels"][-1][0]["summary"] == "[1][2][3][4][5]"
+    # The odd node out is carried up unchanged
+    assert tree["levels"][1][2]["summary"] == "[5]"
+
+
+def test_failed_chapter_raises():
+    def flaky(chapter):
+        return "" if chapter["id"] == 2 else "ok"
+
+    with pytest.raises(RuntimeError, match="chapter 2"):
+        build_summary_tree(chapters(1, 2, 3), flaky, summarize_span, parallelism=2)
+
+
+@pytest.mark.parametrize(
+    "lo, hi, expected",
+    [
+        (0, 4, [(0, 4)]),
+        (0, 3, [(0, 3)]),
+        (1, 4, [(1, 1), (2, 3), (4, 4)]),
+        (2, 2, [(2, 2)]),
+        (1, 2, [(1, 1), (2, 2)]),
+        (3, 1, []),
+    ],
+)
+def test_cover_uses_fewest_nodes_in_reading_order(lo, hi, expected):
+    assert spans(cover(build(1, 2, 3, 4, 5), lo, hi)) == expected
+
+
+def test_cover_of_empty_tree():
+    assert cover({"levels": []}, 0, 3) == []
+
+
+def test_leaf_position_rounds_up_to_next_chapter():
+    tree = build(0, 2, 5, 7)
+    assert leaf_position(tree, 0) == 0
+    assert leaf_position(tree, 2) == 1
+    assert leaf_position(tree, 3) == 2
+    assert leaf_position(tree, 8) == 4
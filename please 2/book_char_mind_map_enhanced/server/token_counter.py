@@ -0,0 +1,165 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+# Runs of letters, digits, newlines or punctuation, as a BPE tokenizer would roughly see them
+_PIECE_RE = re.compile(r"[^\W\d_]+|\d+|\n+|[^\w\s]+")
+# Han, kana and hangul: about one token per character
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+
+# Tokens the chat template adds around each message, and once per request
+MESSAGE_OVERHEAD_TOKENS = 4
+REQUEST_OVERHEAD_TOKENS = 3
+
+
+class PromptTooLarge(ValueError):
+    """A prompt that cannot fit the model's context window."""
+
+    def __init__(self, prompt_tokens, context_window):
+        super().__init__(
+            f"Prompt is {prompt_tokens} tokens, over the {context_window} tokens usable in the model's context window"
+        )
+        self.prompt_tokens = prompt_tokens
+        self.context_window = context_window
+
+
+def heuristic_count(text):
+    """
+    Tokenizer-free estimate, used when no tokenizer is installed. Counts word,
+    number and punctuation pieces the way BPE vocabularies tend to split them,
+    so non-English text and dialogue are not undercounted the way a flat
+    characters/4 rule undercounts them.
+    """
+    tokens = 0
+    for match in _PIECE_RE.finditer(text):
+        piece = match.group()
+        first = piece[0]
+        if first == "\n":
+            tokens += 1
+        elif first.isdigit():
+            tokens += (len(piece) + 2) // 3
+        elif first.isalpha():
+            if piece.isascii():
+                tokens += 1 + max(0, len(piece) - 4) // 4
+            else:
+                cjk = len(_CJK_RE.findall(piece))
+                rest = len(piece) - cjk
+                tokens += cjk + (1 + rest // 3 if rest else 0)
+        else:
+            tokens += (len(piece) + 1) // 2
+    return tokens
+
+
+def _load_backend(backend, tokenizer_path, encoding):
+    """Return (name, count_batch) for the first usable tokenizer backend."""
+    if backend in ("auto", "tokenizers") and tokenizer_path:
+        try:
+            from tokenizers import Tokenizer
+
+            tokenizer = Tokenizer.from_file(tokenizer_path)
+            return "tokenizers", lambda texts: [
+                len(e.ids) for e in tokenizer.encode_batch(texts, add_special_tokens=False)
+            ]
+        except Exception as e:
+            print(f"tokenizers backend unavailable ({e}), trying the next one")
+
+    if backend in ("auto", "tiktoken"):
+        try:
+            import tiktoken
+
+            enc = tiktoken.get_encoding(encoding)
+            return "tiktoken", lambda texts: [len(ids) for ids in enc.encode_ordinary_batch(texts)]
+        except Exception as e:
+            print(f"tiktoken backend unavailable ({e}), falling back to the heuristic counter")
+
+    return "heuristic", lambda texts: [heuristic_count(text) for text in texts]
+
+
+class TokenCounter:
+    """
+    Counts tokens with a local tokenizer: a Hugging Face `tokenizers`
+    tokenizer.json for the model when one is configured, else `tiktoken`,
+    else `heuristic_count`. Only the first is exact for Llama models:
+    tiktoken's vocabularies are OpenAI's, so its counts (like the
+    heuristic's) are estimates, and `exact` is False. Counts are memoized (keyed by a digest of the
+    text), so repeated system prompts and chunks are only tokenized once.
+    """
+
+    def __init__(self, backend="auto", tokenizer_path=None, encoding="o200k_base", cache_size=4096):
+        self.backend, self._count_batch = _load_backend(backend, tokenizer_path, encoding)
+        self.exact = self.backend == "tokenizers"
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._memo = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(text):
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def count(self, text):
+        if not text:
+            return 0
+        return self.count_batch([text])[0]
+
+    def count_batch(self, texts):
+        """Token counts for many texts; only the ones not seen before are tokenized, in one batch."""
+        counts = [0] * len(texts)
+        missing = {}
+        with self._lock:
+            for i, text in enumerate(texts):
+                if not text:
+                    continue
+                key = self._key(text)
+                if key in self._memo:
+                    self._memo.move_to_end(key)
+                    counts[i] = self._memo[key]
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+                    self.misses += 1
+
+        if missing:
+            keys = list(missing)
+            fresh = self._count_batch([texts[missing[key][0]] for key in keys])
+            with self._lock:
+                for key, n in zip(keys, fresh):
+                    for i in missing[key]:
+                        counts[i] = n
+                    self._memo[key] = n
+                while len(self._memo) > self.cache_size:
+                    self._memo.popitem(last=False)
+        return counts
+
+    def count_messages(self, messages):
+        """Prompt size of a chat request, including the per-message template overhead."""
+        contents = [m.get("content") or "" for m in messages]
+        return (
+            sum(self.count_batch([c if isinstance(c, str) else str(c) for c in contents]))
+            + MESSAGE_OVERHEAD_TOKENS * len(messages)
+            + REQUEST_OVERHEAD_TOKENS
+        )
+
+    def fits(self, messages, limit):
+        """
+        Whether a prompt is at most `limit` tokens. Every token covers at
+        least one UTF-8 byte, so prompts with fewer bytes than `limit` are
+        accepted without tokenizing.
+        """
+        size = sum(len(str(m.get("content") or "").encode("utf-8")) for m in messages)
+        overhead = MESSAGE_OVERHEAD_TOKENS * len(messages) + REQUEST_OVERHEAD_TOKENS
+        if size + overhead <= limit:
+            return True
+        return self.count_messages(messages) <= limit
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "exact": self.exact,
+                "entries": len(self._memo),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
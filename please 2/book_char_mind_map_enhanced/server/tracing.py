@@ -0,0 +1,172 @@
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+TRACE_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+def new_trace_id():
+    return uuid.uuid4().hex
+
+
+def valid_trace_id(value):
+    """A client-supplied trace id, if it is well formed (32 lowercase hex characters)."""
+    value = (value or "").strip().lower()
+    return value if TRACE_ID_RE.match(value) else None
+
+
+class Span:
+    """One timed step of a trace, with free-form attributes (sizes, token counts, ...)."""
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.thread = threading.current_thread().name
+        self.duration_ms = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, error=None):
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 3)
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self):
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "thread": self.thread,
+        }
+        if self.error is not None:
+            record["error"] = self.error
+        return record
+
+
+class Tracer:
+    """
+    Lightweight in-process tracer. The current span lives in a context
+    variable, so spans nest across function calls without being passed
+    around; work handed to a thread pool keeps its parent when it runs in a
+    `contextvars.copy_context()` taken by the submitting thread. Finished
+    spans are appended to a JSONL file, one object per line, which is
+    rotated to `<path>.1` once it grows past `max_bytes`.
+    """
+
+    def __init__(self, path=None, enabled=True, max_bytes=64 * 1024 * 1024):
+        self._lock = threading.Lock()
+        self.configure(path, enabled, max_bytes)
+
+    def configure(self, path, enabled=True, max_bytes=64 * 1024 * 1024):
+        with self._lock:
+            self.path = path
+            self.enabled = bool(enabled and path)
+            self.max_bytes = max_bytes
+            if self.enabled:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def start(self, name, trace_id=None, current=True, **attributes):
+        """
+        Open a span under the current one (or a new root span when there is
+        none, or when `trace_id` is given). Returns (span, token); pass both
+        to `end`. With current=False the span is not made current, which is
+        what generators need: they must not change the context of whoever
+        iterates them.
+        """
+        parent = _current.get()
+        if trace_id is None and parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, attributes)
+        else:
+            span = Span(name, trace_id or new_trace_id(), None, attributes)
+        return span, (_current.set(span) if current else None)
+
+    def end(self, span, token=None, error=None):
+        span.finish(error)
+        if token is not None:
+            try:
+                _current.reset(token)
+            except ValueError:
+                # Ended from a different context (e.g. a streamed response); the span still gets exported
+                pass
+        self.export(span)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span, token = self.start(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.end(span, token, error=e)
+            raise
+        self.end(span, token)
+
+    def export(self, span):
+        if not self.enabled:
+            return
+        line = json.dumps(span.to_dict(), default=str, ensure_ascii=False) + "\n"
+        with self._lock:
+            try:
+                if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                print(f"Could not write trace span: {e}")
+
+
+def run_in_context(fn):
+    """
+    Wrap `fn` to run in a copy of the caller's context, so spans it opens on
+    another thread nest under the span that was current when it was wrapped.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def iterate_in_context(iterable):
+    """
+    Iterate `iterable` in a copy of the caller's context. Streamed responses
+    are consumed after the view returns, outside the context it ran in, so
+    spans opened while streaming would otherwise start a trace of their own.
+    """
+    context = contextvars.copy_context()
+    iterator = iter(iterable)
+
+    def generate():
+        try:
+            while True:
+                try:
+                    item = context.run(next, iterator)
+                except StopIteration:
+                    return
+                yield item
+        finally:
+            # Closing runs the inner generator's finally blocks (e.g. ending its span) when the client disconnects
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                context.run(close)
+
+    return generate()
+
+
+# Shared tracer; exports nothing until the server configures a path
+tracer = Tracer()
+span = tracer.span
@@ -1,9 +1,27 @@
 import React, { useState } from 'react';
 import axios from 'axios';
 
+const API_URL = 'http://localhost:5002';
+const JOB_POLL_INTERVAL_MS = 2000;
+
+// Run a long request as a server-side job and poll it until it finishes
+const runJob = async (endpoint, data, onProgress) => {
+  const { data: submitted } = await axios.post(`${API_URL}${endpoint}`, { ...data, async: true });
+  for (;;) {
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    const { data: job } = await axios.get(`${API_URL}/jobs/${submitted.job_id}`);
+    if (job.status === 'succeeded') return job.result;
+    if (job.status === 'failed' || job.status === 'cancelled') {
+      throw new Error(job.error || `Job ${job.status}`);
+    }
+    onProgress(job.progress);
+  }
+};
+
 const EnhancedModeConfig = ({ 
   onConfigApply, 
   bookContent, 
+  bookId, 
   isLoading, 
   setIsLoading 
 }) => {
@@ -13,6 +31,13 @@ const EnhancedModeConfig = ({
   const [location, setLocation] = useState('');
   const [customSetting, setCustomSetting] = useState('');
   const [showConfig, setShowConfig] = useState(true);
+  const [progressText, setProgressText] = useState('');
+
+  const showProgress = (label) => (progress) => {
+    if (progress.total_chunks) {
+      setProgressText(`${label} ${progress.completed_chunks}/${progress.total_chunks} chunks`);
+    }
+  };
 
   // Popular languages supported by Llama 4
   const languages = [
@@ -84,28 +109,29 @@ const EnhancedModeConfig = ({
       if (settingType !== 'original') {
         console.log('Applying setting transformation...');
         const settingData = {
-          book_content: bookContent,
+          ...(bookId ? { book_id: bookId } : { book_content: bookContent }),
           setting_type: settingType,
           time_period: timePeriod,
           location: location,
           custom_setting: customSetting
         };
         
-        const settingResponse = await axios.post('http://localhost:5002/transform_setting', settingData);
-        transformedContent = settingResponse.data.transformed_content;
-        configDescription.push(settingResponse.data.setting_description);
+        const settingResult = await runJob('/transform_setting', settingData, showProgress('Transforming'));
+        transformedContent = settingResult.transformed_content;
+        configDescription.push(settingResult.setting_description);
       }
       
       // Apply language translation
       if (selectedLanguage !== 'English') {
         console.log(`Translating to ${selectedLanguage}...`);
+        // Only a transformed text has to be sent inline; the original is already on the server
         const translationData = {
-          book_content: transformedContent,
+          ...(settingType === 'original' && bookId ? { book_id: bookId } : { book_content: transformedContent }),
           target_language: selectedLanguage
         };
         
-        const translationResponse = await axios.post('http://localhost:5002/translate_book', translationData);
-        transformedContent = translationResponse.data.translated_content;
+        const translationResult = await runJob('/translate_book', translationData, showProgress('Translating'));
+        transformedContent = translationResult.translated_content;
         configDescription.push(`Translated to ${selectedLanguage}`);
       }
       
@@ -125,6 +151,7 @@ const EnhancedModeConfig = ({
       alert('Error applying configuration. Please try again.');
     } finally {
       setIsLoading(false);
+      setProgressText('');
     }
   };
 
@@ -214,7 +241,7 @@ const EnhancedModeConfig = ({
           disabled={isLoading}
           className="px-8 py-3 bg-purple-600 text-white rounded-lg hover:bg-purple-700 transition-colors disabled:opacity-50 font-semibold"
         >
-          {isLoading ? 'Applying Configuration...' : 'Apply Enhanced Configuration'}
+          {isLoading ? (progressText || 'Applying Configuration...') : 'Apply Enhanced Configuration'}
         </button>
       </div>
 
@@ -7,6 +7,10 @@ export default function CharacterGraph({ graphData }) {
   const [hoveredLink, setHoveredLink] = useState(null);
   const [showAllLabels, setShowAllLabels] = useState(false);
   const fgRef = useRef();
+  // Graphs laid out by the server already have positions; skip the simulation
+  const hasLayout =
+    graphData?.nodes?.length > 0 &&
+    graphData.nodes.every((node) => node.x !== undefined && node.y !== undefined);
 
   useEffect(() => {
     const updateDimensions = () => {
@@ -117,7 +121,7 @@ export default function CharacterGraph({ graphData }) {
           width={dimensions.width}
           height={dimensions.height}
           onEngineStop={() => fgRef.current.zoomToFit(600)}
-          cooldownTicks={100}
+          cooldownTicks={hasLayout ? 0 : 100}
         />
       </div>
     </div>
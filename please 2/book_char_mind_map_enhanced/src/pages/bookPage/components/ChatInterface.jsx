@@ -3,7 +3,7 @@ import React, { useState, useRef, useEffect } from 'react';
 import { FaPaperPlane } from 'react-icons/fa';
 import axios from 'axios';
 
-const ChatInterface = ({ relationshipData }) => {
+const ChatInterface = ({ bookId, relationshipData }) => {
   const [messages, setMessages] = useState([
     { text: "Hello! I can answer questions about this book. What would you like to know?", sender: "assistant" }
   ]);
@@ -27,6 +27,7 @@ const ChatInterface = ({ relationshipData }) => {
 
     try {
       const response = await axios.post('http://localhost:5002/chat', {
+        book_id: bookId,
         query: userMessage,
         relationship_data: relationshipData,
         chat_history_data: messages
@@ -14,6 +14,7 @@ export default function BookPage() {
   const [searchComplete, setSearchComplete] = useState(false);
   const [tokenUsage, setTokenUsage] = useState(0);
   const [relationshipData, setRelationshipData] = useState(null);
+  const [bookId, setBookId] = useState(() => localStorage.getItem('bookId'));
   const navigate = useNavigate();
   const debug = false;
 
@@ -81,7 +82,9 @@ export default function BookPage() {
       });
 
       if (response.data.success) {
+        setBookId(response.data.book_id);
         // Store the original content and redirect to enhanced mode config
+        localStorage.setItem('bookId', response.data.book_id);
         localStorage.setItem('originalBookContent', response.data.content);
         localStorage.setItem('bookTitle', response.data.title || 'Uploaded Book');
         navigate('/enhanced-config');
@@ -212,7 +215,7 @@ export default function BookPage() {
         {/* Chat Section - Only show when search is complete */}
         {graphData && relationshipData && (
           <div className="mt-12">
-            <ChatInterface relationshipData={relationshipData} />
+            <ChatInterface bookId={bookId} relationshipData={relationshipData} />
           </div>
         )}
       </div>
@@ -28,6 +28,9 @@ export default function StoryMode() {
     configDescription: ""
   });
   const [isEnhancedMode, setIsEnhancedMode] = useState(false);
+  // Server-side story session: holds the character, config and story so far
+  const [bookId, setBookId] = useState(null);
+  const [sessionId, setSessionId] = useState(null);
 
   const handleEnhancedConfig = (config) => {
     setEnhancedConfig(config);
@@ -59,10 +62,11 @@ export default function StoryMode() {
       if (response.data.graph_data && response.data.graph_data.nodes) {
         setCharacters(response.data.graph_data.nodes);
         setBookContent(contentToAnalyze);
+        setBookId(response.data.book_id);
         
         // Analyze character appearances
         const appearanceResponse = await axios.post("http://localhost:5002/analyze_character_appearances", {
-          book_content: contentToAnalyze,
+          book_id: response.data.book_id,
           characters: response.data.graph_data.nodes
         });
         
@@ -83,10 +87,15 @@ export default function StoryMode() {
 
     setIsLoading(true);
     try {
-      // Just read the file content and move to configuration
+      // Read the file content and register the book so later steps can send its id
       const text = await fileObject.text();
+      const registerResponse = await axios.post("http://localhost:5002/books", {
+        content: text,
+        filename: fileObject.name
+      });
       setOriginalBookContent(text);
       setBookContent(text);
+      setBookId(registerResponse.data.book_id);
       setStep(2); // Move to configuration step
     } catch (error) {
       console.error("Error reading book file:", error);
@@ -104,7 +113,7 @@ export default function StoryMode() {
       // Get the story segment for this character
               const segmentResponse = await axios.post("http://localhost:5002/get_story_segment", {
         character: character.name,
-        book_content: bookContent,
+        book_id: bookId,
         appearance_info: appearanceAnalysis
       });
       
@@ -113,7 +122,7 @@ export default function StoryMode() {
       // Check if we need a summary (character appears later)
       if (storySegment.includes("SUMMARY:") || storySegment.includes("summary")) {
                   const summaryResponse = await axios.post("http://localhost:5002/get_chapter_summary", {
-          book_content: bookContent,
+          book_id: bookId,
           character: character.name,
           skip_to_chapter: "Character's first appearance"
         });
@@ -121,6 +130,17 @@ export default function StoryMode() {
         setIsFirstAppearance(false);
       }
       
+      const sessionResponse = await axios.post("http://localhost:5002/story_sessions", {
+        book_id: bookId,
+        character: character.name,
+        scene: storySegment,
+        character_background: `Character from the story: ${character.name}`,
+        other_characters: "Characters in the scene",
+        target_language: enhancedConfig.language,
+        setting_context: enhancedConfig.settingContext
+      });
+      setSessionId(sessionResponse.data.session_id);
+      
       setCurrentScene(storySegment);
       setStoryHistory([{ text: storySegment, isChoice: false }]);
       setStep(4);
@@ -137,17 +157,9 @@ export default function StoryMode() {
     try {
       setIsLoading(true);
       
-      // Get the most recent story context for choice generation
-      const recentText = currentScene.split('\n').filter(line => line.trim().length > 0).slice(-3).join('\n');
-      const sceneContext = recentText || currentScene.substring(Math.max(0, currentScene.length - 500));
-      
+      // The server picks the scene context from the session
       const response = await axios.post("http://localhost:5002/generate_contextual_choices", {
-        character: selectedCharacter.name,
-        scene_context: sceneContext,
-        character_background: `Character from the story: ${selectedCharacter.name}`,
-        other_characters: "Characters present in the scene",
-        target_language: enhancedConfig.language,
-        setting_context: enhancedConfig.settingContext
+        session_id: sessionId
       });
       
       // Use the choices directly from the API response
@@ -176,13 +188,8 @@ export default function StoryMode() {
     try {
       setIsLoading(true);
       const response = await axios.post("http://localhost:5002/continue_story_enhanced", {
-        user_choice: choice.text,
-        scene_context: currentScene,
-        character: selectedCharacter.name,
-        original_style: bookContent.substring(0, 1000), // Sample for style
-        other_characters: "Characters in the scene",
-        target_language: enhancedConfig.language,
-        setting_context: enhancedConfig.settingContext
+        session_id: sessionId,
+        user_choice: choice.text
       });
       
       const continuation = response.data.continuation;
@@ -285,6 +292,7 @@ export default function StoryMode() {
             <EnhancedModeConfig
               onConfigApply={handleEnhancedConfig}
               bookContent={originalBookContent}
+              bookId={bookId}
               isLoading={isLoading}
               setIsLoading={setIsLoading}
             />